@@ -0,0 +1,43 @@
+"""
+Substream fan-out throughput of LocalExecutor for a single parallel
+subtask.
+
+Usage: python bench_fanout.py [num_streams [max_workers [max_substreams]]]
+"""
+from __future__ import print_function, absolute_import
+import os
+import shutil
+import sys
+import tempfile
+import desc.workflow_engine as engine
+
+def main(num_streams, max_workers=None, max_substreams=None):
+    pipeline = engine.Pipeline('fanout_pipeline', '1.0')
+    main_task = pipeline.main_task
+    main_task.set_variables()
+    main_task.create_parallel_process('visit')
+    cwd = os.getcwd()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        os.chdir(tmpdir)
+        pipeline.write_python_module()
+        with open(pipeline.get_module_name(), 'a') as output:
+            output.write('visitsTask_jobs = [type("Job", (object,), '
+                         'dict(pipeline_vars=dict(VISIT=str(i))))() '
+                         'for i in range(%i)]\n' % num_streams)
+        pipeline.write_process_scripts()
+        executor = engine.LocalExecutor(pipeline, max_workers=max_workers,
+                                        pool='thread',
+                                        max_substreams=max_substreams)
+        executor.run()
+        for subtask, (streams, elapsed, rate) \
+                in executor.fanout_summary().items():
+            print('%s: %i substreams in %.2f s, %.1f substreams/s'
+                  % (subtask, streams, elapsed, rate))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    args = [int(x) for x in sys.argv[1:]]
+    main(*(args or [1000]))
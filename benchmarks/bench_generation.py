@@ -0,0 +1,196 @@
+"""
+Wall time and peak memory of pipeline generation for synthetic
+pipelines of increasing size, written as json for comparison against
+a baseline.
+
+Each pipeline has num_processes job processes in the main task, one
+in ten of them script processes, plus num_parallel parallel processes
+made with create_parallel_process, each of which adds a setup process
+and a subtask with one job process.  Every process but the first
+requires up to density processes chosen at random among the earlier
+ones.  The operations measured are construction, str() (first and
+cached renders), toxml(), get_module_name(), write_python_module()
+and write_process_scripts().  Times are measured without tracing;
+peak memory is the tracemalloc peak of the allocations made during
+each operation, measured in a second pass.
+
+Usage: python bench_generation.py [-o results.json] [-b baseline.json]
+           [--tolerance 0.25] [num_processes:num_parallel:density ...]
+
+With a baseline, operations that are slower or use more memory than
+the baseline by more than the tolerance are listed, and the exit
+status is 1 if there are any.  Differences of less than 10 ms or
+64 kB are not counted.
+"""
+from __future__ import print_function, absolute_import
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import desc.workflow_engine as engine
+
+operations = ('construct', 'str', 'str_cached', 'toxml', 'get_module_name',
+              'write_python_module', 'write_process_scripts')
+
+def build_pipeline(num_processes, num_parallel, density, seed=0):
+    rng = random.Random(seed)
+    pipeline = engine.Pipeline('bench_pipeline', '1.0')
+    main_task = pipeline.main_task
+    main_task.set_variables()
+    # Spread the parallel processes evenly through the main task.
+    step = (num_processes + num_parallel)//max(num_parallel, 1)
+    processes = []
+    for i in range(num_processes + num_parallel):
+        requirements = rng.sample(processes, min(density, len(processes)))
+        if num_parallel and i % step == 0 and i//step < num_parallel:
+            main_task.create_parallel_process('p%07i' % i,
+                                              requirements=requirements)
+        else:
+            job_type = 'script' if i % 10 == 0 else 'std'
+            main_task.create_process('process_%07i' % i, job_type=job_type,
+                                     requirements=requirements)
+        processes.append(main_task.processes[-1])
+    return pipeline
+
+def run_operations(config, measure):
+    """
+    Run the operations on a new pipeline in a scratch directory, and
+    return a dict of the values returned by measure(function) for
+    each of them.
+    """
+    results = {}
+    cwd = os.getcwd()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        os.chdir(tmpdir)
+        pipeline = [None]
+
+        def construct():
+            pipeline[0] = build_pipeline(*config)
+        results['construct'] = measure(construct)
+        pipeline = pipeline[0]
+        results['str'] = measure(lambda: str(pipeline))
+        results['str_cached'] = measure(lambda: str(pipeline))
+        results['toxml'] = measure(pipeline.toxml)
+        results['get_module_name'] = measure(pipeline.get_module_name)
+        results['write_python_module'] \
+            = measure(lambda: pipeline.write_python_module(clobber=True))
+        results['write_process_scripts'] \
+            = measure(lambda: pipeline.write_process_scripts(clobber=True))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+    return results
+
+def wall_time(function):
+    t0 = time.time()
+    function()
+    return time.time() - t0
+
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def benchmark(config):
+    num_processes, num_parallel, density = config
+    times = run_operations(config, wall_time)
+    peaks = run_operations(config, peak_memory)
+    return dict(num_processes=num_processes, num_parallel=num_parallel,
+                density=density,
+                total_processes=num_processes + 2*num_parallel,
+                operations=dict((op, dict(seconds=times[op],
+                                          peak_bytes=peaks[op]))
+                                for op in operations))
+
+# Differences smaller than these are treated as noise.
+min_change = dict(seconds=0.01, peak_bytes=64*1024)
+
+def compare(results, baseline, tolerance):
+    """
+    Return a list of (configuration, operation, quantity, baseline
+    value, new value) for measurements that exceed the baseline by
+    more than the fractional tolerance, and by more than min_change.
+    Configurations missing from the baseline are ignored.
+    """
+    def key(entry):
+        return entry['num_processes'], entry['num_parallel'], entry['density']
+    reference = dict((key(entry), entry) for entry in baseline['results'])
+    regressions = []
+    for entry in results['results']:
+        if key(entry) not in reference:
+            continue
+        old_operations = reference[key(entry)]['operations']
+        for op, values in entry['operations'].items():
+            if op not in old_operations:
+                continue
+            for quantity in ('seconds', 'peak_bytes'):
+                old = old_operations[op][quantity]
+                new = values[quantity]
+                if new > old*(1 + tolerance) \
+                        and new - old > min_change[quantity]:
+                    regressions.append((key(entry), op, quantity, old, new))
+    return regressions
+
+def parse_config(arg):
+    fields = [int(x) for x in arg.split(':')]
+    if not 1 <= len(fields) <= 3:
+        raise argparse.ArgumentTypeError('expected '
+                                         'num_processes[:num_parallel'
+                                         '[:density]], got ' + arg)
+    return tuple(fields + [0, 1][len(fields) - 1:])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark pipeline generation at scale.')
+    parser.add_argument('configs', nargs='*', type=parse_config,
+                        metavar='num_processes:num_parallel:density',
+                        default=[(1000, 100, 1), (10000, 1000, 2),
+                                 (50000, 5000, 3)])
+    parser.add_argument('-o', '--output', default=None,
+                        help='json file for the results')
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='json file of earlier results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='fractional increase counted as a regression')
+    args = parser.parse_args(argv)
+
+    results = dict(python=platform.python_version(),
+                   platform=platform.platform(),
+                   timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   results=[])
+    print('%10s  %8s  %7s  %21s  %10s  %12s'
+          % ('processes', 'parallel', 'density', 'operation', 'time (s)',
+             'peak (MB)'))
+    for config in args.configs:
+        entry = benchmark(config)
+        results['results'].append(entry)
+        for op in operations:
+            values = entry['operations'][op]
+            print('%10i  %8i  %7i  %21s  %10.4f  %12.2f'
+                  % (config + (op, values['seconds'],
+                               values['peak_bytes']/1024.**2)))
+    if args.output is not None:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as input_:
+        baseline = json.load(input_)
+    regressions = compare(results, baseline, args.tolerance)
+    for config, op, quantity, old, new in regressions:
+        print('Regression: %s %s %s %g -> %g'
+              % (':'.join(str(x) for x in config), op, quantity, old, new))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
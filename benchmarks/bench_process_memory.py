@@ -0,0 +1,58 @@
+"""
+Memory per process and construction rate for large pipelines.  Two
+shapes are built: a chain of job processes in the main task, and a
+set of parallel processes, each with its own subtask.  Memory is the
+tracemalloc total for the pipeline, divided by the number of
+processes, and the rate is measured separately without tracing.
+
+Usage: python bench_process_memory.py [num_processes ...]
+"""
+from __future__ import print_function, absolute_import
+import sys
+import time
+import tracemalloc
+import desc.workflow_engine as engine
+
+def build_chain(num_processes):
+    pipeline = engine.Pipeline('bench_pipeline', '1.0')
+    main_task = pipeline.main_task
+    previous = []
+    for i in range(num_processes):
+        process = main_task.create_process('process_%07i' % i,
+                                           requirements=previous)
+        previous = [process]
+    return pipeline
+
+def build_parallel(num_processes):
+    # Each parallel process comprises a setup process and a subtask
+    # with one job process, so this makes num_processes processes.
+    pipeline = engine.Pipeline('bench_pipeline', '1.0')
+    main_task = pipeline.main_task
+    first = main_task.create_process('first')
+    for i in range(num_processes//2):
+        main_task.create_parallel_process('p%07i' % i, requirements=[first])
+    return pipeline
+
+def measure(build, num_processes):
+    tracemalloc.start()
+    pipeline = build(num_processes)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del pipeline
+    t0 = time.time()
+    build(num_processes)
+    rate = num_processes/(time.time() - t0)
+    return size/float(num_processes), rate
+
+def main(sizes):
+    print('%10s  %9s  %16s  %20s' % ('processes', 'shape', 'bytes/process',
+                                     'processes/second'))
+    for num_processes in sizes:
+        for shape, build in (('chain', build_chain),
+                             ('parallel', build_parallel)):
+            bytes_per_process, rate = measure(build, num_processes)
+            print('%10i  %9s  %16.1f  %20.0f'
+                  % (num_processes, shape, bytes_per_process, rate))
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,69 @@
+"""
+Benchmark of Pipeline.write_xml against the minidom round-trip that
+Pipeline.toxml used to do.  Each measurement runs in a fresh
+subprocess so that the peak RSS values are independent.
+
+Usage: python bench_xml_writer.py [num_processes ...]
+"""
+from __future__ import print_function, absolute_import
+import os
+import resource
+import subprocess
+import sys
+import time
+from xml.dom import minidom
+import desc.workflow_engine as engine
+
+def build_pipeline(num_processes):
+    pipeline = engine.Pipeline('bench_pipeline', '1.0')
+    main_task = pipeline.main_task
+    main_task.set_variables()
+    previous = []
+    for i in range(num_processes):
+        job_type = 'script' if i % 10 == 0 else 'std'
+        process = main_task.create_process('process_%07i' % i,
+                                           job_type=job_type,
+                                           requirements=previous)
+        process.notation = 'Process number %i' % i
+        previous = [process]
+    return pipeline
+
+def minidom_path(pipeline, output):
+    doc = minidom.parseString(str(pipeline))
+    output.write(doc.toprettyxml(encoding='UTF-8', newl='', indent=4*' '))
+
+def streaming_path(pipeline, output):
+    pipeline.write_xml(output)
+
+def peak_rss_mb():
+    # ru_maxrss is in kB on Linux and in bytes on macOS.
+    scale = 1024.**2 if sys.platform == 'darwin' else 1024.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/scale
+
+def run_one(method, num_processes):
+    pipeline = build_pipeline(num_processes)
+    rss0 = peak_rss_mb()
+    t0 = time.time()
+    with open(os.devnull, 'wb') as output:
+        dict(minidom=minidom_path, stream=streaming_path)[method](pipeline,
+                                                                  output)
+    dt = time.time() - t0
+    print(dt, rss0, peak_rss_mb())
+
+def main(sizes):
+    print('%10s  %8s  %10s  %14s  %14s' % ('processes', 'method', 'time (s)',
+                                           'base RSS (MB)', 'peak RSS (MB)'))
+    for num_processes in sizes:
+        for method in ('minidom', 'stream'):
+            output = subprocess.check_output([sys.executable, __file__,
+                                              '--run', method,
+                                              str(num_processes)])
+            dt, rss0, rss1 = [float(x) for x in output.split()]
+            print('%10i  %8s  %10.3f  %14.1f  %14.1f'
+                  % (num_processes, method, dt, rss0, rss1))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        run_one(sys.argv[2], int(sys.argv[3]))
+    else:
+        main([int(x) for x in sys.argv[1:]] or [1000, 10000, 50000])
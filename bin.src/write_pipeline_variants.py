@@ -0,0 +1,9 @@
+#!/usr/bin/env python
+"""
+Write the xml, workflow module and job scripts of a pipeline for each
+of a set of sites and parameter variants.
+"""
+import sys
+from desc.workflow_engine.variants import main
+
+sys.exit(main())
@@ -13,15 +13,95 @@ export IN_DIR=${IN_DIR:-${WORK_DIR}/input}
 # Workaround for EUPS trying to write to home directory
 export HOME=`pwd`
 
+export SCRIPT=${SCRIPT_LOCATION}/${PIPELINE_PROCESS:-$1}
+
+# If ENV_SNAPSHOT_DIR is set, the variables and functions that
+# ${DM_DIR}/${DM_SETUP} sets up are saved in a snapshot file in that
+# directory, and later jobs restore them from it instead of repeating
+# the setup.  A snapshot is stale if the setup file is newer, or if it
+# is older than ENV_SNAPSHOT_MAX_AGE minutes; an update of the stack
+# that does not touch the setup file is only seen once the snapshot
+# is stale, or after it is refreshed by running this script with
+# --capture-env as its argument, which only does the setup and writes
+# the snapshot.  The snapshot records the exported variables that the
+# setup sets, changes or unsets, and the functions that it defines;
+# shell variables that are not exported, and functions that it
+# removes, are not restored.
+export ENV_SNAPSHOT_DIR=${ENV_SNAPSHOT_DIR:-}
+export ENV_SNAPSHOT_MAX_AGE=${ENV_SNAPSHOT_MAX_AGE:-1440}
+export ENV_SNAPSHOT_FILE=
+if [ "$1" = "--capture-env" ]
+then
+export SCRIPT=/dev/null
+fi
+if [ -n "${ENV_SNAPSHOT_DIR}" ]
+then
+key=$(echo "${DM_DIR}/${DM_SETUP} $(uname -r)" | cksum | cut -f1 -d' ')
+export ENV_SNAPSHOT_FILE=${ENV_SNAPSHOT_DIR}/dm_env_${key}.sh
+if [ "$1" != "--capture-env" ] && [ -f ${ENV_SNAPSHOT_FILE} ] \
+    && [ ! ${DM_DIR}/${DM_SETUP} -nt ${ENV_SNAPSHOT_FILE} ] \
+    && [ -z "$(find ${ENV_SNAPSHOT_FILE} -mmin +${ENV_SNAPSHOT_MAX_AGE})" ] \
+    && source ${ENV_SNAPSHOT_FILE}
+then
+set -xe; export SHELLOPTS; source ${SCRIPT}
+exit
+fi
+fi
+
+_env_lines() {
+    local name
+    for name in $(compgen -e)
+    do
+        case ${name} in
+            ENV_SNAPSHOT_*|SHLVL|_|PWD|OLDPWD|SHELLOPTS) ;;
+            *) printf 'export %s=%q\n' ${name} "${!name}" ;;
+        esac
+    done
+}
+
+_write_snapshot() {
+    # Save the variables and functions that the setup added, changed
+    # or removed.
+    local name
+    [ -n "${ENV_SNAPSHOT_FILE}" ] || return 0
+    {
+        _env_lines | grep -Fxv -f ${ENV_SNAPSHOT_TEMP}.vars || true
+        for name in $(sed -n 's/^export \([^=]*\)=.*/\1/p' \
+                      ${ENV_SNAPSHOT_TEMP}.vars)
+        do
+            [ -n "${!name+set}" ] || echo "unset ${name}"
+        done
+        for name in $(declare -F | cut -f3 -d' ')
+        do
+            grep -Fqx ${name} ${ENV_SNAPSHOT_TEMP}.functions \
+                || declare -f ${name}
+        done
+    } > ${ENV_SNAPSHOT_TEMP}
+    mv ${ENV_SNAPSHOT_TEMP} ${ENV_SNAPSHOT_FILE}
+    rm -f ${ENV_SNAPSHOT_TEMP}.vars ${ENV_SNAPSHOT_TEMP}.functions
+}
+
+# Record the state before the setup, including that of scl.  The
+# snapshot directory may be shared by the nodes of a cluster, so the
+# temporary files are named after the host as well as the process.
+if [ -n "${ENV_SNAPSHOT_FILE}" ]
+then
+mkdir -p ${ENV_SNAPSHOT_DIR}
+export ENV_SNAPSHOT_TEMP=${ENV_SNAPSHOT_FILE}.$(uname -n).$$
+_env_lines > ${ENV_SNAPSHOT_TEMP}.vars
+declare -F | cut -f3 -d' ' > ${ENV_SNAPSHOT_TEMP}.functions
+fi
+
 # Test which version of RHEL we are using
 majversion=$(lsb_release -rs | cut -f1 -d.)
 
-export SCRIPT=${SCRIPT_LOCATION}/${PIPELINE_PROCESS:-$1}
-
 # Set up Twinkles environment and invoke process specific script
 if [ $majversion -eq 6 ]
 then
-scl enable devtoolset-3 'source ${DM_DIR}/${DM_SETUP}; set -xe; export SHELLOPTS; source ${SCRIPT}'
+# The snapshot functions are defined in the scl shell rather than
+# exported to the environment of the jobs.
+scl enable devtoolset-3 "$(declare -f _env_lines _write_snapshot)"'
+source ${DM_DIR}/${DM_SETUP}; _write_snapshot; set -xe; export SHELLOPTS; source ${SCRIPT}'
 else
-source ${DM_DIR}/${DM_SETUP}; set -xe; export SHELLOPTS; source ${SCRIPT}
+source ${DM_DIR}/${DM_SETUP}; _write_snapshot; set -xe; export SHELLOPTS; source ${SCRIPT}
 fi
@@ -47,9 +47,10 @@ setupPhosim.add_subtask(singleVisitTask)
 wrapUp = main_task.create_process('wrapUp', job_type='script',
                                   requirements=[phoSimFinalize])
 
-with open('phosim_pipeline.xml', 'w') as output:
-    output.write(pipeline.toxml() + '\n')
+if __name__ == '__main__':
+    with open('phosim_pipeline.xml', 'wb') as output:
+        output.write(pipeline.toxml() + b'\n')
 
-pipeline.write_python_module(clobber=True)
-pipeline.write_process_scripts()
+    pipeline.write_python_module(clobber=True)
+    pipeline.write_process_scripts()
 
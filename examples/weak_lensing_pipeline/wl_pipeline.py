@@ -74,14 +74,15 @@ tjp_cosmo = main_task.create_process('TJPCosmo',
                                                    dndz_inf_nt])
 tjp_cosmo.notation = 'Joint probe cosomlogical parameter estimation'
 
-# Write the xml to an output file.
-with open('wl_pipeline.xml', 'w') as output:
-    output.write(pipeline.toxml() + '\n')
-
-# Create the python module with the substream launching functions for
-# the parallelized subtasks.  The module name is determined from the
-# main task variables.
-pipeline.write_python_module()
-
-# Create stubs for the bash scripts expected by the SLAC workflow engine.
-pipeline.write_process_scripts()
+if __name__ == '__main__':
+    # Write the xml to an output file.
+    with open('wl_pipeline.xml', 'wb') as output:
+        output.write(pipeline.toxml() + b'\n')
+
+    # Create the python module with the substream launching functions for
+    # the parallelized subtasks.  The module name is determined from the
+    # main task variables.
+    pipeline.write_python_module()
+
+    # Create stubs for the bash scripts expected by the SLAC workflow engine.
+    pipeline.write_process_scripts()
@@ -1,2 +1,18 @@
 from __future__ import absolute_import
 from .workflow_engine import *
+from .variables import *
+from .graph import *
+from .executor import *
+from .analysis import *
+from .simulator import *
+from .incremental import *
+from .builder import *
+from .substreams import *
+from .expressions import *
+from .xml_reader import *
+from .diff import *
+from .validation import *
+from .sharding import *
+from .result_cache import *
+from .tracing import *
+from .variants import *
@@ -0,0 +1,139 @@
+"""
+Critical-path analysis of the process graph of a pipeline.
+"""
+from __future__ import print_function, absolute_import
+from collections import OrderedDict
+from .expressions import VariableResolver
+from .graph import ProcessGraph
+
+__all__ = ['ScheduleAnalysis', 'process_runtimes']
+
+# Runtime, in seconds, assumed for job types when neither an estimate
+# nor a MAXCPU or MAXCPULONG value that can be evaluated locally is
+# available.  This is the SLAC value in data/main_task_variables.txt.
+default_maxcpu = 100000.
+
+class ScheduleAnalysis(object):
+    """
+    Earliest and latest start times, slack, and the critical path of a
+    pipeline, given runtime estimates for its processes and assuming
+    that every process starts as soon as its requirements finish.
+
+    runtimes maps qualified (task_name.process_name) or plain process
+    names to runtimes in seconds.  Processes without an estimate take
+    the MAXCPU or MAXCPULONG value for their job type, and script
+    processes take zero time.  fanout maps subtask names to the
+    number of substreams; the substreams run concurrently, so this
+    scales the total work, but not the makespan.
+    """
+    def __init__(self, pipeline, runtimes=None, fanout=None):
+        self.graph = ProcessGraph(pipeline.main_task)
+        fanout = fanout if fanout is not None else {}
+        graph = self.graph
+        order = graph.topological_order()
+        names = [graph.name(process) for process in graph.processes]
+        self.runtime = process_runtimes(graph, runtimes)
+        self.streams = OrderedDict()
+        for name, process in zip(names, graph.processes):
+            self.streams[name] = self._num_streams(process, fanout)
+
+        # Forward pass.
+        self.earliest_start = OrderedDict((name, 0.) for name in names)
+        self.earliest_finish = OrderedDict()
+        for process in order:
+            name = graph.name(process)
+            start = max([self.earliest_finish[graph.name(x)]
+                         for x in graph.upstream[process]] or [0.])
+            self.earliest_start[name] = start
+            self.earliest_finish[name] = start + self.runtime[name]
+        self.makespan = max(list(self.earliest_finish.values()) or [0.])
+
+        # Backward pass.
+        self.latest_start = OrderedDict((name, 0.) for name in names)
+        self.latest_finish = OrderedDict()
+        for process in reversed(order):
+            name = graph.name(process)
+            finish = min([self.latest_start[graph.name(x)]
+                          for x in graph.downstream[process]]
+                         or [self.makespan])
+            self.latest_finish[name] = finish
+            self.latest_start[name] = finish - self.runtime[name]
+        self.slack = OrderedDict((name, self.latest_start[name]
+                                  - self.earliest_start[name])
+                                 for name in names)
+        self.critical_path = self._critical_path(order)
+
+    @property
+    def work(self):
+        """Total process runtime, summed over all substreams."""
+        return sum(self.runtime[name]*self.streams[name]
+                   for name in self.runtime)
+
+    def makespan_bound(self, slots):
+        """Lower bound on the makespan given a number of batch slots."""
+        return max(self.makespan, self.work/float(slots))
+
+    def _is_critical(self, name):
+        return abs(self.slack[name]) <= 1e-9*max(1., self.makespan)
+
+    def _critical_path(self, order):
+        graph = self.graph
+        ends = [process for process in order
+                if self._is_critical(graph.name(process))
+                and not graph.downstream[process]]
+        if not ends:
+            return []
+        path = [ends[0]]
+        while True:
+            start = self.earliest_start[graph.name(path[-1])]
+            upstream = [x for x in graph.upstream[path[-1]]
+                        if self._is_critical(graph.name(x)) and
+                        abs(self.earliest_finish[graph.name(x)] - start)
+                        <= 1e-9*max(1., self.makespan)]
+            if not upstream:
+                break
+            path.append(upstream[0])
+        return [graph.name(process) for process in reversed(path)]
+
+    def _num_streams(self, process, fanout):
+        num_streams = 1
+        task = self.graph.tasks[process]
+        while task.outer_process is not None:
+            num_streams *= fanout.get(task.name, 1)
+            task = self.graph.tasks[task.outer_process]
+        return num_streams
+
+def process_runtimes(graph, runtimes=None, site=None):
+    """
+    Runtime for each process in a ProcessGraph, keyed by qualified
+    name.  Estimates in runtimes are looked up by qualified name, then
+    by process name.  Otherwise, jobs take the MAXCPU or MAXCPULONG
+    value of the main task, evaluated for site (by default, the SITE
+    variable), and script processes take zero time.  A fused job
+    (see Pipeline.fuse_job_chains) takes the sum of the times of its
+    members, looked up in the same way.
+    """
+    runtimes = runtimes if runtimes is not None else {}
+    resolver = VariableResolver([graph.main_task.variables], site=site)
+    defaults = dict(script=0.)
+    for job_type, varname in (('std', 'MAXCPU'), ('long', 'MAXCPULONG')):
+        try:
+            defaults[job_type] = float(resolver.get(varname))
+        except (TypeError, ValueError):
+            defaults[job_type] = default_maxcpu
+
+    def runtime(process, name):
+        for key in (name, process.name):
+            if key in runtimes:
+                return float(runtimes[key])
+        if process.fused:
+            task_name = name.rpartition('.')[0]
+            return sum(runtime(member, '%s.%s' % (task_name, member.name))
+                       for member in process.fused)
+        return defaults.get(process.job_type, default_maxcpu)
+
+    result = OrderedDict()
+    for process in graph.processes:
+        name = graph.name(process)
+        result[name] = runtime(process, name)
+    return result
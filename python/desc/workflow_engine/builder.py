@@ -0,0 +1,158 @@
+"""
+Bulk construction of pipeline processes from a table.
+"""
+from __future__ import print_function, absolute_import
+import csv
+import re
+from collections import OrderedDict
+from .workflow_engine import Task, check_names, job_line
+
+__all__ = ['add_processes', 'read_process_table']
+
+# Columns of a process table, in the order used for tuple records.
+columns = ('name', 'job_type', 'task', 'notation', 'requirements', 'outer')
+
+_separators = re.compile(r'[\s,;]+')
+
+def read_process_table(table):
+    """
+    The rows of a process table as a list of dicts.  table is a CSV
+    file name or file object with a header row, a NumPy structured
+    array, or a sequence of dicts or of tuples with the fields in the
+    order of columns.
+    """
+    if hasattr(table, 'dtype'):
+        names = table.dtype.names
+        return [dict(zip(names, [_decode(x) for x in row]))
+                for row in table.tolist()]
+    if hasattr(table, 'read'):
+        return list(csv.DictReader(table))
+    if isinstance(table, str):
+        with open(table) as input_:
+            return list(csv.DictReader(input_))
+    return [row if isinstance(row, dict) else dict(zip(columns, row))
+            for row in table]
+
+def add_processes(pipeline, table):
+    """
+    Create the processes described by a table (see read_process_table)
+    and return them.  The columns are
+
+    name: process name
+    job_type: 'std' (the default), 'long' or 'script'
+    task: name of the task that owns the process, by default the main
+        task
+    notation: optional notation
+    requirements: names of required processes, separated by spaces,
+        commas or semicolons, or given as a list.  A name is qualified,
+        task_name.process_name, or refers to a process in the same task
+        or, failing that, in the main task.
+    outer: for a task that is not yet in the pipeline, the process
+        that creates it as a subtask, named as for requirements.  Only
+        one row of the task needs to give it.
+
+    Requirements may refer to processes anywhere in the table or in
+    the pipeline.  All names are checked before the pipeline is
+    modified, and the dependencies are wired up in a single pass once
+    all processes exist, so the cost is linear in the table size.
+    """
+    with pipeline._phase('build'):
+        return _add_processes(pipeline, table)
+
+def _add_processes(pipeline, table):
+    table = _table_columns(read_process_table(table))
+    main_task = pipeline.main_task
+    tasks = OrderedDict()
+    processes = OrderedDict()
+    _index_task(main_task, tasks, processes)
+
+    # Check the names and references before modifying the pipeline.
+    names = table['name']
+    if None in names:
+        raise RuntimeError('process table row %i has no name'
+                           % names.index(None))
+    keys = [(task_name or main_task.name, name)
+            for task_name, name in zip(table['task'], names)]
+    for key in keys:
+        if key in processes:
+            raise RuntimeError('duplicate process %s.%s' % key)
+        processes[key] = None
+    for name, job_type in zip(names, table['job_type']):
+        if job_type not in job_line:
+            raise RuntimeError('%s: unknown job_type %s' % (name, job_type))
+    outers = OrderedDict()
+    for key, outer in zip(keys, table['outer']):
+        if key[0] in tasks:
+            continue
+        if outers.get(key[0]) not in (None, outer) and outer is not None:
+            raise RuntimeError('conflicting outer processes for task '
+                               + key[0])
+        outers[key[0]] = outers.get(key[0]) or outer
+    check_names(names + list(outers))
+    for task_name, outer in outers.items():
+        if outer is None:
+            raise RuntimeError('no outer process given for task '
+                               + task_name)
+        outers[task_name] = _resolve(processes, main_task.name,
+                                     main_task.name, outer)
+    requirements = [[_resolve(processes, main_task.name, key[0], name)
+                     for name in required]
+                    for key, required in zip(keys, table['requirements'])]
+
+    # Create the processes and tasks, and then wire up the subtasks and
+    # requirements, so that references can go in any order.
+    for task_name in outers:
+        tasks[task_name] = Task(task_name)
+    created = []
+    for key, job_type, notation in zip(keys, table['job_type'],
+                                       table['notation']):
+        process = tasks[key[0]].create_process(key[1], job_type=job_type)
+        process.notation = notation
+        processes[key] = process
+        created.append(process)
+    for task_name, outer in outers.items():
+        processes[outer].add_subtask(tasks[task_name])
+    for process, required in zip(created, requirements):
+        for key in required:
+            process.requires(processes[key])
+    return created
+
+def _decode(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+def _table_columns(rows):
+    """
+    The columns of a list of rows, with surrounding whitespace removed
+    and blank fields set to None.
+    """
+    table = {}
+    for column in columns:
+        values = [row.get(column) for row in rows]
+        table[column] = [(value.strip() or None)
+                         if isinstance(value, str) else value
+                         for value in values]
+    table['job_type'] = [value or 'std' for value in table['job_type']]
+    table['requirements'] \
+        = [_separators.split(value) if isinstance(value, str)
+           else (value or []) for value in table['requirements']]
+    return table
+
+def _index_task(task, tasks, processes):
+    tasks[task.name] = task
+    for process in task.processes:
+        processes[(task.name, process.name)] = process
+    for process in task.processes:
+        for subtask in process.subtasks:
+            _index_task(subtask, tasks, processes)
+
+def _resolve(processes, main_task_name, task_name, name):
+    key = (task_name, name)
+    if key in processes:
+        return key
+    owner, _, process_name = name.rpartition('.')
+    key = (owner, process_name) if owner else (main_task_name, name)
+    if key in processes:
+        return key
+    raise RuntimeError('required process %s not found' % name)
@@ -0,0 +1,173 @@
+"""
+Structural differences between two versions of a pipeline.
+"""
+from __future__ import print_function, absolute_import
+from collections import OrderedDict
+from .graph import ProcessGraph
+
+__all__ = ['PipelineDiff', 'diff_pipelines']
+
+class PipelineDiff(object):
+    """
+    Changes from an old to a new version of a pipeline, keyed by
+    qualified process name.  added_processes and removed_processes
+    list process names, changed_processes maps the name of a process
+    in both versions to the attributes that differ ('site', 'notation',
+    'job', 'script', 'requirements' or 'subtasks'), and added_edges
+    and removed_edges list (upstream, downstream) name pairs.
+    changed_variables maps a task name to a dict of the variables
+    whose raw values differ, as (old, new) pairs, where None stands
+    for a missing variable.  affected_processes lists the processes
+    of the new version that are added or changed, that belong to a
+    task with changed variables, or that run downstream of any of
+    those; a stream that has only run unaffected processes can be
+    rolled forward to the new version.
+    """
+    def __init__(self):
+        self.version = None
+        self.added_tasks = []
+        self.removed_tasks = []
+        self.added_processes = []
+        self.removed_processes = []
+        self.changed_processes = OrderedDict()
+        self.added_edges = []
+        self.removed_edges = []
+        self.changed_variables = OrderedDict()
+        self.affected_processes = []
+
+    def __bool__(self):
+        return bool(self.version or self.added_tasks or self.removed_tasks
+                    or self.added_processes or self.removed_processes
+                    or self.changed_processes or self.added_edges
+                    or self.removed_edges or self.changed_variables)
+
+    __nonzero__ = __bool__
+
+    def to_dict(self):
+        """The changes as a dict of lists and dicts, e.g., for json."""
+        return OrderedDict(
+            [('version', list(self.version) if self.version else None),
+             ('added_tasks', self.added_tasks),
+             ('removed_tasks', self.removed_tasks),
+             ('added_processes', self.added_processes),
+             ('removed_processes', self.removed_processes),
+             ('changed_processes', self.changed_processes),
+             ('added_edges', [list(edge) for edge in self.added_edges]),
+             ('removed_edges', [list(edge) for edge in self.removed_edges]),
+             ('changed_variables',
+              OrderedDict((task, OrderedDict((name, list(values))
+                                             for name, values
+                                             in changes.items()))
+                          for task, changes
+                          in self.changed_variables.items())),
+             ('affected_processes', self.affected_processes)])
+
+def diff_pipelines(old, new):
+    """
+    Compare two pipelines, e.g., one built in Python and one read
+    with Pipeline.from_xml, and return a PipelineDiff.  The comparison
+    is a single pass over each version, so it is linear in the number
+    of processes and dependencies.
+    """
+    diff = PipelineDiff()
+    old_graph = ProcessGraph(old.main_task)
+    new_graph = ProcessGraph(new.main_task)
+    if old.main_task.version != new.main_task.version:
+        diff.version = (old.main_task.version, new.main_task.version)
+
+    old_tasks = _tasks(old_graph)
+    new_tasks = _tasks(new_graph)
+    diff.added_tasks = [name for name in new_tasks if name not in old_tasks]
+    diff.removed_tasks = [name for name in old_tasks if name not in new_tasks]
+    changed_tasks = set()
+    for name, task in new_tasks.items():
+        if name in old_tasks:
+            changes = _variable_changes(old_tasks[name], task)
+            if changes:
+                diff.changed_variables[name] = changes
+                changed_tasks.add(name)
+
+    old_records = _process_records(old_graph)
+    new_records = _process_records(new_graph)
+    diff.added_processes = [name for name in new_records
+                            if name not in old_records]
+    diff.removed_processes = [name for name in old_records
+                              if name not in new_records]
+    for name, record in new_records.items():
+        old_record = old_records.get(name)
+        if old_record is None:
+            continue
+        changes = [field for field in _fields
+                   if record[field] != old_record[field]]
+        if changes:
+            diff.changed_processes[name] = changes
+
+    old_edges = _edges(old_records)
+    new_edges = _edges(new_records)
+    diff.added_edges = [edge for edge in new_edges if edge not in old_edges]
+    diff.removed_edges = [edge for edge in old_edges if edge not in new_edges]
+
+    diff.affected_processes = _affected(diff, new_graph, changed_tasks)
+    return diff
+
+_fields = ('site', 'notation', 'job', 'script', 'requirements', 'subtasks')
+
+def _tasks(graph):
+    tasks = OrderedDict([(graph.main_task.name, graph.main_task)])
+    for task in graph.tasks.values():
+        tasks.setdefault(task.name, task)
+    return tasks
+
+def _variable_changes(old_task, new_task):
+    old_values = OrderedDict(old_task.variables.items())
+    new_values = OrderedDict(new_task.variables.items())
+    changes = OrderedDict()
+    for name, value in new_values.items():
+        if old_values.get(name) != value:
+            changes[name] = (old_values.get(name), value)
+    for name, value in old_values.items():
+        if name not in new_values:
+            changes[name] = (value, None)
+    return changes
+
+def _process_records(graph):
+    # The attributes of each process that are compared, with the
+    # dependencies as qualified names, so that the processes of the
+    # two versions need not be the same objects.
+    records = OrderedDict()
+    for process in graph.processes:
+        records[graph.name(process)] = dict(
+            site=process.site,
+            notation=process.notation,
+            job=process.job,
+            script=None if process.job is not None
+            else process._script_body(),
+            requirements=tuple(graph.name(upstream)
+                               for upstream in graph.upstream[process]),
+            subtasks=tuple(subtask.name for subtask in process.subtasks))
+    return records
+
+def _edges(records):
+    edges = OrderedDict()
+    for name, record in records.items():
+        for upstream in record['requirements']:
+            edges[(upstream, name)] = None
+    return edges
+
+def _affected(diff, graph, changed_tasks):
+    names = dict((graph.name(process), process) for process in graph.tasks)
+    affected = set(names[name] for name in diff.added_processes)
+    affected.update(names[name] for name in diff.changed_processes)
+    if graph.main_task.name in changed_tasks:
+        # The variables of the main task are visible to all processes.
+        affected.update(graph.tasks)
+    else:
+        affected.update(process for process, task in graph.tasks.items()
+                        if task.name in changed_tasks)
+    for process in graph.topological_order():
+        if process not in affected and \
+                any(upstream in affected
+                    for upstream in graph.upstream[process]):
+            affected.add(process)
+    return [graph.name(process) for process in graph.tasks
+            if process in affected]
@@ -0,0 +1,550 @@
+"""
+Local execution of a pipeline's processes on a concurrent.futures pool.
+"""
+from __future__ import print_function, absolute_import
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+try:
+    # On Python 2, concurrent.futures is provided by the futures
+    # package, which only LocalExecutor needs.
+    import concurrent.futures
+except ImportError:
+    concurrent = None
+try:
+    import resource
+except ImportError:
+    resource = None
+from .expressions import SiteConfiguration
+from .graph import ProcessGraph
+from .result_cache import ResultCache, file_digest
+from .tracing import Trace
+from .workflow_engine import package_data_path
+
+__all__ = ['LocalExecutor', 'LocalPipeline']
+
+class LocalExecutor(object):
+    """
+    Run the processes of a Pipeline on the local node.  Processes are
+    submitted to the pool as soon as all of their requirements have
+    succeeded.  Job processes run their scripts, as written by
+    Pipeline.write_process_scripts, through batch_script.sh; script
+    processes call the corresponding function in the module written by
+    Pipeline.write_python_module, or, if they have a script body of
+    their own (e.g., one read by Pipeline.from_xml), run it as python
+    with the pipeline variables, pipeline and execfile defined.
+
+    The substreams that a script process creates with
+    pipeline.createSubstream are run as separate instances of the
+    subtask's processes, at most max_substreams of them at a time, and
+    at most the max_in_flight launch option of their subtask at a time
+    per subtask.
+    Processes that depend on a subtask process are released once all
+    of its substreams have succeeded.
+
+    If cache, a ResultCache or the path of its file, is given, a
+    process instance is not run again if the cache has a successful
+    result for its key, a hash of its job scripts or workflow module,
+    its variables and stream path, and the keys of the instances that
+    it depends on; so a process is rerun only if it, or something
+    upstream of it, has changed.
+
+    Each run records when every process instance was queued, started
+    and ended, and its peak memory use, in self.trace, which is the
+    trace argument, the pipeline's trace, or a new Trace.
+
+    Job and script processes run in work_dir.  With the thread pool,
+    script processes run one at a time, since they change the working
+    directory of the executor's process.
+
+    The environment snapshots of batch_script.sh are disabled unless
+    env_snapshots is True, in which case they are kept in the
+    env_snapshots subdirectory of work_dir.
+    """
+    def __init__(self, pipeline, max_workers=None, pool='process',
+                 script_dir=None, work_dir=None, batch_script=None,
+                 environ=None, max_substreams=None, cache=None,
+                 trace=None, env_snapshots=False):
+        if pool not in ('process', 'thread'):
+            raise RuntimeError("pool must be 'process' or 'thread'")
+        if concurrent is None:
+            raise RuntimeError('LocalExecutor needs concurrent.futures; '
+                               'on Python 2, install the futures package')
+        self.pipeline = pipeline
+        self.graph = ProcessGraph(pipeline.main_task)
+        self.max_workers = max_workers
+        self.pool = pool
+        if script_dir is None:
+            script_dir = os.getcwd()
+        self.script_dir = os.path.abspath(script_dir)
+        if work_dir is None:
+            work_dir = self.script_dir
+        self.work_dir = os.path.abspath(work_dir)
+        if batch_script is None:
+            batch_script = package_data_path('batch_script.sh')
+        self.batch_script = batch_script
+        self.environ = dict(environ) if environ is not None else {}
+        self.max_substreams = max_substreams
+        self.env_snapshots = env_snapshots
+        if cache is not None and not isinstance(cache, ResultCache):
+            cache = ResultCache(cache)
+        self.cache = cache
+        self._trace = trace if trace is not None else pipeline.trace
+        self.trace = None
+        self._site = SiteConfiguration(pipeline.main_task)
+
+    def run(self):
+        """
+        Run the pipeline and return an OrderedDict of the exit status
+        of each process, keyed by qualified process name.  The status
+        of a subtask process is 0 if all of its substreams succeeded
+        and the first non-zero exit status otherwise.  Processes
+        downstream of a failure are not run and have status None.  The
+        status of each process instance, keyed by qualified name and
+        stream path, is available afterwards in self.stream_status, and
+        the (name, stream path) of the instances whose results were
+        taken from the cache in self.cached.
+        """
+        graph = self.graph
+        graph.topological_order()
+        self._site = SiteConfiguration(self.pipeline.main_task)
+        self.status = OrderedDict((graph.name(process), None)
+                                  for process in graph.processes)
+        self.stream_status = OrderedDict()
+        self._fanout = OrderedDict()
+        self._done = set()
+        self._unfinished = dict((process, 0) for process in graph.processes)
+        self._instances = dict((process, []) for process in graph.processes)
+        self._waiting = {}
+        self._ready = []
+        self._skipped = set()
+        self._stream_vars = {(): {}}
+        self._stream_queues = OrderedDict()
+        self._stream_left = {}
+        self._active_streams = 0
+        self._active_by_subtask = {}
+        self._keys = {}
+        self.cached = []
+        self.trace = self._trace if self._trace is not None else Trace()
+        self._queued = {}
+        for process in self.pipeline.main_task.processes:
+            self._unfinished[process] += 1
+            self._create_instance(process, ())
+        running = {}
+        try:
+            with self._pool() as pool:
+                while self._ready or running:
+                    ready, self._ready = self._ready, []
+                    for instance in ready:
+                        result = self._cached_result(instance)
+                        if result is None:
+                            running[self._submit(pool, instance)] = instance
+                        else:
+                            now = time.time()
+                            self._finish(instance, result, now, now,
+                                         cached=True)
+                    if not running:
+                        continue
+                    done = concurrent.futures.wait(
+                        running,
+                        return_when=concurrent.futures.FIRST_COMPLETED)[0]
+                    for future in done:
+                        instance = running.pop(future)
+                        result, start, end, peak_rss = future.result()
+                        self._store_result(instance, result)
+                        self._finish(instance, result, start, end, peak_rss)
+        finally:
+            if self.cache is not None:
+                self.cache.save()
+        return self.status
+
+    def fanout_summary(self):
+        """
+        For each subtask run by the last call to run(), the number of
+        substreams, the time from the first substream launch to the
+        completion of the last substream, and the substream
+        throughput per second.
+        """
+        summary = OrderedDict()
+        for subtask_name, (num_streams, start, end) in self._fanout.items():
+            elapsed = end - start
+            rate = num_streams/elapsed if elapsed > 0 else float('inf')
+            summary[subtask_name] = (num_streams, elapsed, rate)
+        return summary
+
+    @staticmethod
+    def stream_path(stream):
+        return '.'.join(['0'] + [str(index) for _, index in stream])
+
+    def _create_instance(self, process, stream):
+        task = self.graph.tasks[process]
+        waiting = 0
+        for requirement in self.graph.upstream[process]:
+            if requirement is task.outer_process:
+                continue
+            if self.graph.tasks[requirement] is task \
+                    or requirement not in self._done:
+                waiting += 1
+        instance = (process, stream)
+        self._waiting[instance] = waiting
+        self._instances[process].append(stream)
+        if waiting == 0:
+            self._enqueue(instance)
+
+    def _release(self, instance):
+        self._waiting[instance] -= 1
+        if self._waiting[instance] == 0:
+            self._enqueue(instance)
+
+    def _enqueue(self, instance):
+        self._queued[instance] = time.time()
+        self._ready.append(instance)
+
+    def _finish(self, instance, result, start, end, peak_rss=None,
+                cached=False):
+        process, stream = instance
+        task = self.graph.tasks[process]
+        name = self.graph.name(process)
+        if process.job is None:
+            returncode, requests = result
+        else:
+            returncode, requests = result, []
+        if returncode == 0:
+            try:
+                self._queue_streams(process, stream, requests)
+            except RuntimeError as eobj:
+                print(eobj, file=sys.stderr)
+                returncode = 1
+        self.stream_status[(name, self.stream_path(stream))] = returncode
+        self.trace.add_process(name, self.stream_path(stream),
+                               self._queued.pop(instance), start, end,
+                               peak_rss=peak_rss, status=returncode,
+                               cached=cached)
+        if returncode != 0:
+            if self.status[name] is None:
+                self.status[name] = returncode
+            if stream:
+                stranded = self._stranded(instance) - self._skipped
+                self._skipped.update(stranded)
+                self._stream_progress(stream, 1 + len(stranded))
+            return
+        self._unfinished[process] -= 1
+        for child in self.graph.downstream[process]:
+            if self.graph.tasks[child] is task:
+                self._release((child, stream))
+        if stream:
+            self._stream_progress(stream, 1)
+        self._check_done(process)
+        self._admit_streams()
+
+    def _stranded(self, instance):
+        """Instances in the same stream downstream of a failed one."""
+        process, stream = instance
+        task = self.graph.tasks[process]
+        stranded = set()
+        queue = [process]
+        while queue:
+            for child in self.graph.downstream[queue.pop()]:
+                if self.graph.tasks[child] is task \
+                        and (child, stream) not in stranded:
+                    stranded.add((child, stream))
+                    queue.append(child)
+        return stranded
+
+    def _check_done(self, process):
+        if process in self._done or self._unfinished[process]:
+            return
+        task = self.graph.tasks[process]
+        if task.outer_process is not None \
+                and task.outer_process not in self._done:
+            return
+        self._done.add(process)
+        if self.status[self.graph.name(process)] is None:
+            self.status[self.graph.name(process)] = 0
+        for child in self.graph.downstream[process]:
+            child_task = self.graph.tasks[child]
+            if child_task is task or child_task.outer_process is process:
+                continue
+            for stream in self._instances[child]:
+                self._release((child, stream))
+        for subtask in process.subtasks:
+            for subtask_process in subtask.processes:
+                self._check_done(subtask_process)
+
+    def _queue_streams(self, process, stream, requests):
+        subtasks = dict((subtask.name, subtask) for subtask in process.subtasks)
+        for subtask_name, index, pipeline_vars in requests:
+            if subtask_name not in subtasks:
+                raise RuntimeError('%s: %s is not a subtask of this process'
+                                   % (self.graph.name(process), subtask_name))
+        now = time.time()
+        for subtask_name, index, pipeline_vars in requests:
+            subtask = subtasks[subtask_name]
+            substream = stream + ((subtask_name, index),)
+            variables = dict(self._stream_vars[stream])
+            variables.update(pipeline_vars)
+            self._stream_vars[substream] = variables
+            self._stream_queues.setdefault(subtask, deque()).append(substream)
+            for subtask_process in subtask.processes:
+                self._unfinished[subtask_process] += 1
+            self._fanout.setdefault(subtask_name, [0, now, now])[0] += 1
+
+    def _admit_streams(self):
+        for subtask, queue in self._stream_queues.items():
+            limit = (subtask.launch_options or {}).get('max_in_flight')
+            while queue and (self.max_substreams is None or
+                             self._active_streams < self.max_substreams) \
+                    and (limit is None or
+                         self._active_by_subtask.get(subtask.name, 0) < limit):
+                stream = queue.popleft()
+                self._active_streams += 1
+                self._active_by_subtask[subtask.name] \
+                    = self._active_by_subtask.get(subtask.name, 0) + 1
+                self._stream_left[stream] = len(subtask.processes)
+                for process in subtask.processes:
+                    self._create_instance(process, stream)
+                if not subtask.processes:
+                    self._stream_progress(stream, 0)
+
+    def _stream_progress(self, stream, num_finished):
+        self._stream_left[stream] -= num_finished
+        if self._stream_left[stream] == 0:
+            del self._stream_left[stream]
+            self._active_streams -= 1
+            self._active_by_subtask[stream[-1][0]] -= 1
+            self._fanout[stream[-1][0]][2] = time.time()
+            self._admit_streams()
+
+    def _pool(self):
+        if self.pool == 'thread':
+            return concurrent.futures.ThreadPoolExecutor(self.max_workers)
+        return concurrent.futures.ProcessPoolExecutor(self.max_workers)
+
+    def _cached_result(self, instance):
+        if self.cache is None:
+            return None
+        key = self._keys[instance] = self._cache_key(instance)
+        result = self.cache.get(key)
+        if result is not None:
+            process, stream = instance
+            self.cached.append((self.graph.name(process),
+                                self.stream_path(stream)))
+        return result
+
+    def _store_result(self, instance, result):
+        if self.cache is None:
+            return
+        returncode = result if instance[0].job is not None else result[0]
+        if returncode == 0:
+            self.cache.put(self._keys[instance], result)
+
+    def _cache_key(self, instance):
+        process, stream = instance
+        task = self.graph.tasks[process]
+        if process.job is not None:
+            scripts = [file_digest(os.path.join(self.script_dir, name))
+                       for name in [process.name] +
+                       [member.name for member in process.fused]]
+            scripts.append(file_digest(self.batch_script))
+        else:
+            scripts = [file_digest(self.module_path()), process.script]
+        upstream = []
+        for requirement in self.graph.upstream[process]:
+            if requirement is task.outer_process:
+                streams = [stream[:-1]]
+            elif self.graph.tasks[requirement] is task:
+                streams = [stream]
+            else:
+                streams = sorted(self._instances[requirement],
+                                 key=self.stream_path)
+            upstream.extend(self._keys.get((requirement, item))
+                            for item in streams)
+        return ResultCache.key(self.graph.name(process), process.job,
+                               scripts, self._instance_variables(instance),
+                               self.stream_path(stream), self.work_dir,
+                               self.environ, upstream)
+
+    def _instance_variables(self, instance):
+        process, stream = instance
+        variables = self.variables(process)
+        variables.update(self._stream_vars[stream])
+        return variables
+
+    def _submit(self, pool, instance):
+        process, stream = instance
+        variables = self._instance_variables(instance)
+        if process.job is not None:
+            environ = self.job_environ(process, variables)
+            environ['PIPELINE_STREAMPATH'] = self.stream_path(stream)
+            return pool.submit(_timed, _run_job, self.batch_script,
+                               process.name, environ, self.work_dir,
+                               self._log_file(instance))
+        variables['SLAC_SCRIPT_LOCATION'] = self.script_dir
+        variables['SLAC_OUTPUT_DATA_DIR'] = self.work_dir
+        variables['PIPELINE_STREAMPATH'] = self.stream_path(stream)
+        return pool.submit(_timed, _run_script, self.module_path(),
+                           process.name, variables, process.script,
+                           self.work_dir)
+
+    def variables(self, process):
+        """
+        The main task variables, overridden by those of the process's
+        own task, with ${...} expressions evaluated for the pipeline's
+        SITE.  Values that cannot be evaluated locally are omitted.
+        """
+        return dict(self._site.resolver(self.graph.tasks[process]).values())
+
+    def job_environ(self, process, variables):
+        environ = dict(os.environ)
+        environ.update(variables)
+        environ['SCRIPT_LOCATION'] = self.script_dir
+        environ['OUTPUT_DATA_DIR'] = self.work_dir
+        if not os.path.isfile(os.path.join(environ.get('DM_DIR', ''),
+                                           environ.get('DM_SETUP', ''))):
+            # The DM stack is not available here, so skip its setup.
+            environ['DM_DIR'] = os.path.dirname(os.devnull)
+            environ['DM_SETUP'] = os.path.basename(os.devnull)
+        environ['PIPELINE_PROCESS'] = process.name
+        environ['PIPELINE_STREAMPATH'] = '0'
+        environ['ENV_SNAPSHOT_DIR'] = ''
+        if self.env_snapshots:
+            environ['ENV_SNAPSHOT_DIR'] = os.path.join(self.work_dir,
+                                                       'env_snapshots')
+        environ.update(self.environ)
+        return environ
+
+    def module_path(self):
+        return os.path.join(self.script_dir, self.pipeline.get_module_name())
+
+    def _log_file(self, instance):
+        process, stream = instance
+        filename = self.graph.name(process)
+        if stream:
+            filename += '.' + self.stream_path(stream)
+        return os.path.join(self.work_dir, filename + '.log')
+
+class LocalPipeline(object):
+    """
+    Stand-in for the Pipeline-II server's pipeline object in the
+    namespace of script processes.  It records the substreams
+    requested by createSubstream so that LocalExecutor can run them,
+    and the streams of other pipelines requested by createStream.
+    """
+    def __init__(self, stream_path='0'):
+        self.stream_path = stream_path
+        self.substreams = []
+        self.streams = []
+
+    def getStream(self):
+        return int(self.stream_path.split('.')[-1])
+
+    def createSubstream(self, subtask, stream, pipeline_vars=None):
+        self.substreams.append((subtask, int(stream),
+                                _parse_pipeline_vars(pipeline_vars)))
+
+    def createStream(self, task, stream=-1, pipeline_vars=None):
+        self.streams.append((task, int(stream),
+                             _parse_pipeline_vars(pipeline_vars)))
+
+def _parse_pipeline_vars(pipeline_vars):
+    """
+    Convert pipeline_vars, either a dict or a "NAME=value,..." string,
+    to a dict of strings.
+    """
+    if not pipeline_vars:
+        return {}
+    if hasattr(pipeline_vars, 'items'):
+        items = pipeline_vars.items()
+    else:
+        items = [item.split('=', 1) for item in pipeline_vars.split(',')
+                 if item.strip()]
+    return dict((str(key).strip(), str(value)) for key, value in items)
+
+def _timed(function, *args):
+    """
+    Call function, which returns its result and the peak resident set
+    size in kB, and return the result, the start and end times and the
+    peak resident set size.
+    """
+    start = time.time()
+    result, peak_rss = function(*args)
+    return result, start, time.time(), peak_rss
+
+def _run_job(batch_script, process_name, environ, work_dir, log_file):
+    with open(log_file, 'w') as output:
+        job = subprocess.Popen(['bash', batch_script, process_name],
+                               env=environ, cwd=work_dir, stdout=output,
+                               stderr=subprocess.STDOUT)
+        if not hasattr(os, 'wait4'):
+            return job.wait(), None
+        # wait4 gives the resource usage of this job alone.
+        _, status, usage = os.wait4(job.pid, 0)
+        if os.WIFSIGNALED(status):
+            job.returncode = -os.WTERMSIG(status)
+        else:
+            job.returncode = os.WEXITSTATUS(status)
+        return job.returncode, _kilobytes(usage.ru_maxrss)
+
+def _kilobytes(maxrss):
+    # ru_maxrss is in bytes on macOS and in kB elsewhere.
+    if sys.platform == 'darwin':
+        return maxrss//1024
+    return maxrss
+
+# Serializes the script processes run by the threads of a pool, which
+# share the working directory.
+_cwd_lock = threading.Lock()
+
+def _run_script(module_path, function_name, variables, body=None,
+                work_dir=None):
+    """
+    Call function_name in the workflow module or, if body is given,
+    run body, the process's own script, as the pipeline server would,
+    in work_dir, by default the current directory.
+    """
+    if work_dir is None:
+        return _call_script(module_path, function_name, variables, body)
+    with _cwd_lock:
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            return _call_script(module_path, function_name, variables, body)
+        finally:
+            os.chdir(cwd)
+
+def _call_script(module_path, function_name, variables, body):
+    pipeline = LocalPipeline(variables.get('PIPELINE_STREAMPATH', '0'))
+    namespace = dict(variables)
+    namespace['__name__'] = os.path.splitext(os.path.basename(module_path))[0]
+    namespace['pipeline'] = pipeline
+    namespace['execfile'] = lambda filename, globals_=None: \
+        _execfile(filename, namespace if globals_ is None else globals_)
+    try:
+        if body is None:
+            _execfile(module_path, namespace)
+            namespace[function_name]()
+        else:
+            exec(compile(textwrap.dedent(body).strip('\n') + '\n',
+                         '<script of %s>' % function_name, 'exec'),
+                 namespace)
+    except Exception:
+        traceback.print_exc(file=sys.stderr)
+        return (1, []), _peak_rss()
+    return (0, pipeline.substreams), _peak_rss()
+
+def _execfile(filename, namespace):
+    with open(filename) as input_:
+        code = compile(input_.read(), filename, 'exec')
+    exec(code, namespace)
+
+def _peak_rss():
+    # Script processes run in the worker, so this is the peak of the
+    # worker process.
+    if resource is None:
+        return None
+    return _kilobytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
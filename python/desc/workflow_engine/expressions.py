@@ -0,0 +1,397 @@
+"""
+Local evaluation of the ${...} expressions that Pipeline-II evaluates
+in variable values and job attributes, e.g.,
+
+    ${100000 / (SITE=="NERSC" ? 10 : 1)}
+    ${SITE=="NERSC" ? NERSC_BATCH_OPTIONS : SLAC_BATCH_OPTIONS}
+
+The language comprises number, string and boolean literals, variable
+names, parentheses, the arithmetic operators + - * / % (div and mod),
+the comparisons == != < > <= >= (eq ne lt gt le ge), the logical
+operators && || ! (and or not), and the conditional ?:.
+"""
+from __future__ import print_function, absolute_import
+import math
+import re
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+from .variables import Variables
+
+__all__ = ['evaluate', 'format_value', 'VariableResolver',
+           'SiteConfiguration']
+
+class UnresolvedError(RuntimeError):
+    """An expression refers to a variable that has no local value."""
+
+def evaluate(expression, lookup):
+    """
+    Evaluate the body of a ${...} expression.  lookup is a dict or a
+    function that returns the value of a variable, or raises KeyError
+    or UnresolvedError if the variable is unknown.
+    """
+    if hasattr(lookup, 'keys'):
+        lookup = lookup.__getitem__
+    try:
+        return _compile(expression)(lookup)
+    except KeyError as eobj:
+        raise UnresolvedError('variable %s is not defined' % eobj)
+
+def format_value(value):
+    """The string form of an expression value, as written to xml."""
+    if value is None:
+        return ''
+    if value is True or value is False:
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+class VariableResolver(object):
+    """
+    Values of the variables of a chain of Variables stores, e.g., of
+    the main task and of a subtask, where later stores override
+    earlier ones.  Each variable is evaluated at most once, on first
+    use, after the variables that it refers to, so the order of the
+    definitions does not matter.  If site is given, it overrides SITE.
+    """
+    def __init__(self, stores, site=None):
+        self._raw = OrderedDict()
+        for store in stores:
+            self._raw.update(store.items())
+        if site is not None:
+            self._raw['SITE'] = site
+        self._values = {}
+        self._resolving = set()
+        self._substituted = {}
+
+    def __getitem__(self, name):
+        """
+        The value of a variable.  Raises UnresolvedError if it is not
+        defined, or cannot be evaluated locally, e.g., because it
+        depends on a variable that is not defined.
+        """
+        try:
+            value = self._values[name]
+        except KeyError:
+            value = self._resolve(name)
+        if isinstance(value, UnresolvedError):
+            raise value
+        return value
+
+    def __contains__(self, name):
+        try:
+            self[name]
+        except UnresolvedError:
+            return False
+        return True
+
+    def get(self, name, default=None):
+        try:
+            return format_value(self[name])
+        except UnresolvedError:
+            return default
+
+    def values(self):
+        """OrderedDict of the string values of the resolvable variables."""
+        result = OrderedDict()
+        for name in self._raw:
+            value = self.get(name)
+            if value is not None:
+                result[name] = value
+        return result
+
+    def substitute(self, text, markup=False):
+        """
+        Replace the ${...} expressions in text that can be evaluated
+        by their values, and leave the others as they are.  If markup
+        is True, the values are escaped for use in xml attributes.
+        """
+        if '${' not in text:
+            return text
+        try:
+            return self._substituted[(text, markup)]
+        except KeyError:
+            pass
+        pieces = []
+        position = 0
+        for match in _expression_pattern.finditer(text):
+            pieces.append(text[position:match.start()])
+            position = match.end()
+            try:
+                value = format_value(evaluate(match.group(1),
+                                              self.__getitem__))
+            except RuntimeError:
+                pieces.append(match.group(0))
+                continue
+            pieces.append(escape(value, {'"': '&quot;'}) if markup else value)
+        pieces.append(text[position:])
+        result = self._substituted[(text, markup)] = ''.join(pieces)
+        return result
+
+    def _resolve(self, name):
+        if name not in self._raw:
+            raise UnresolvedError('variable %s is not defined' % name)
+        if name in self._resolving:
+            raise UnresolvedError('circular definition of variable ' + name)
+        self._resolving.add(name)
+        try:
+            value = self._evaluate_text(self._raw[name])
+        except RuntimeError as eobj:
+            # Leave the evaluation to the server.
+            value = UnresolvedError('%s: %s' % (name, eobj))
+        finally:
+            self._resolving.discard(name)
+        self._values[name] = value
+        return value
+
+    def _evaluate_text(self, text):
+        match = _expression_pattern.match(text)
+        if match is not None and match.end() == len(text):
+            # A single expression keeps the type of its value.
+            return evaluate(match.group(1), self.__getitem__)
+        resolved = self.substitute(text)
+        if '${' in resolved:
+            raise UnresolvedError('%s cannot be resolved' % text)
+        return resolved
+
+class SiteConfiguration(object):
+    """
+    The variables of a pipeline resolved for one site.  Resolvers for
+    the main task and its subtasks are created once and reused, so
+    that a pipeline can be rendered with pre-resolved values (see
+    Pipeline.write_xml) without repeated evaluation.
+    """
+    def __init__(self, main_task, site=None):
+        self.main_task = main_task
+        self.site = site
+        self._resolvers = {}
+        self._lines = {}
+
+    def resolver(self, task):
+        try:
+            return self._resolvers[task]
+        except KeyError:
+            stores = [self.main_task.variables]
+            if task is not self.main_task:
+                stores.append(task.variables)
+            resolver = VariableResolver(stores, site=self.site)
+            self._resolvers[task] = resolver
+            return resolver
+
+    def variable_lines(self, task):
+        """The variable block of a task, with resolvable values replaced."""
+        try:
+            return self._lines[task]
+        except KeyError:
+            variables = Variables(task.variables.lines)
+            resolver = self.resolver(task)
+            for name in variables:
+                value = resolver.get(name)
+                if value is not None:
+                    variables[name] = value
+            self._lines[task] = variables.lines
+            return self._lines[task]
+
+_expression_pattern = re.compile(r'''\$\{((?:[^}"']|"[^"]*"|'[^']*')*)\}''')
+
+_token_pattern = re.compile(r'''\s*(?:
+    (?P<number>\d+\.\d*|\.\d+|\d+)
+  | (?P<string>"[^"]*"|'[^']*')
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>==|!=|<=|>=|&&|\|\||[-+*/%?:()<>!])
+  )''', re.VERBOSE)
+
+_word_operators = {'eq': '==', 'ne': '!=', 'lt': '<', 'gt': '>',
+                   'le': '<=', 'ge': '>=', 'and': '&&', 'or': '||',
+                   'not': '!', 'div': '/', 'mod': '%'}
+
+_constants = {'true': True, 'false': False, 'null': None}
+
+# The most recently used compiled expressions, least recent first.
+_compiled = OrderedDict()
+_max_compiled = 1024
+
+def _compile(expression):
+    try:
+        function = _compiled.pop(expression)
+    except KeyError:
+        parser = _Parser(expression)
+        function = parser.conditional()
+        if parser.peek() is not None:
+            raise RuntimeError('invalid expression: ' + expression)
+        if len(_compiled) >= _max_compiled:
+            _compiled.popitem(last=False)
+    _compiled[expression] = function
+    return function
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _token_pattern.match(expression, position)
+        if match is None:
+            raise RuntimeError('invalid expression: ' + expression)
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'name' and value in _word_operators:
+            kind, value = 'op', _word_operators[value]
+        tokens.append((kind, value))
+    return tokens
+
+class _Parser(object):
+    # Recursive descent, producing a tree of closures that take the
+    # variable lookup function.
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def accept(self, *ops):
+        token = self.peek()
+        if token is not None and token[0] == 'op' and token[1] in ops:
+            self.position += 1
+            return token[1]
+        return None
+
+    def expect(self, op):
+        if self.accept(op) is None:
+            raise RuntimeError('expected %s in expression: %s'
+                               % (op, self.expression))
+
+    def conditional(self):
+        test = self.binary(0)
+        if self.accept('?') is None:
+            return test
+        if_true = self.conditional()
+        self.expect(':')
+        if_false = self.conditional()
+        return lambda lookup: (if_true(lookup) if _truth(test(lookup))
+                               else if_false(lookup))
+
+    def binary(self, level):
+        if level == len(_binary_levels):
+            return self.unary()
+        operators = _binary_levels[level]
+        left = self.binary(level + 1)
+        while True:
+            op = self.accept(*operators)
+            if op is None:
+                return left
+            right = self.binary(level + 1)
+            left = _binary_function(op, left, right)
+
+    def unary(self):
+        op = self.accept('-', '!')
+        if op == '-':
+            operand = self.unary()
+            return lambda lookup: -_number(operand(lookup))
+        if op == '!':
+            operand = self.unary()
+            return lambda lookup: not _truth(operand(lookup))
+        return self.primary()
+
+    def primary(self):
+        if self.accept('(') is not None:
+            function = self.conditional()
+            self.expect(')')
+            return function
+        token = self.peek()
+        if token is None or token[0] == 'op':
+            raise RuntimeError('invalid expression: ' + self.expression)
+        self.position += 1
+        kind, value = token
+        if kind == 'number':
+            number = _number(value)
+            return lambda lookup: number
+        if kind == 'string':
+            text = value[1:-1]
+            return lambda lookup: text
+        if value in _constants:
+            constant = _constants[value]
+            return lambda lookup: constant
+        return lambda lookup: lookup(value)
+
+_binary_levels = (('||',), ('&&',), ('==', '!='), ('<', '>', '<=', '>='),
+                  ('+', '-'), ('*', '/', '%'))
+
+def _binary_function(op, left, right):
+    if op == '||':
+        return lambda lookup: _truth(left(lookup)) or _truth(right(lookup))
+    if op == '&&':
+        return lambda lookup: _truth(left(lookup)) and _truth(right(lookup))
+    operator = _operators[op]
+    return lambda lookup: operator(left(lookup), right(lookup))
+
+def _number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RuntimeError('%r is not a number' % (value,))
+
+def _truth(value):
+    if isinstance(value, str):
+        return value.lower() == 'true'
+    return bool(value)
+
+def _comparable(left, right):
+    # Compare numerically if both sides are numbers or numeric strings,
+    # and as strings otherwise.
+    try:
+        return _number(left), _number(right)
+    except RuntimeError:
+        return format_value(left), format_value(right)
+
+def _add(left, right):
+    if isinstance(left, str) or isinstance(right, str):
+        try:
+            return _number(left) + _number(right)
+        except RuntimeError:
+            return format_value(left) + format_value(right)
+    return _number(left) + _number(right)
+
+def _divide(left, right):
+    left, right = _number(left), _number(right)
+    if right == 0:
+        raise RuntimeError('division by zero')
+    if isinstance(left, int) and isinstance(right, int) \
+            and left % right == 0:
+        return left//right
+    return left/float(right)
+
+def _modulo(left, right):
+    # The sign of the remainder follows the dividend, as in Java.
+    left, right = _number(left), _number(right)
+    if right == 0:
+        raise RuntimeError('division by zero')
+    remainder = math.fmod(left, right)
+    if isinstance(left, int) and isinstance(right, int):
+        return int(remainder)
+    return remainder
+
+def _compare(function):
+    return lambda left, right: function(*_comparable(left, right))
+
+_operators = {'+': _add,
+              '-': lambda left, right: _number(left) - _number(right),
+              '*': lambda left, right: _number(left)*_number(right),
+              '/': _divide,
+              '%': _modulo,
+              '==': _compare(lambda x, y: x == y),
+              '!=': _compare(lambda x, y: x != y),
+              '<': _compare(lambda x, y: x < y),
+              '>': _compare(lambda x, y: x > y),
+              '<=': _compare(lambda x, y: x <= y),
+              '>=': _compare(lambda x, y: x >= y)}
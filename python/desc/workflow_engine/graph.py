@@ -0,0 +1,141 @@
+"""
+Dependency graph of the processes in a pipeline.
+"""
+from __future__ import print_function, absolute_import
+from collections import OrderedDict
+
+__all__ = ['ProcessGraph']
+
+class ProcessGraph(object):
+    """
+    The processes of a main task and of all of its subtasks, in
+    document order, with the edges given by Process.requirements.  The
+    processes of a subtask also depend on the outer process that
+    creates the subtask.
+    """
+    def __init__(self, main_task):
+        self.main_task = main_task
+        self.tasks = OrderedDict()
+        self.upstream = OrderedDict()
+        self.downstream = OrderedDict()
+        self._add_task(main_task)
+        for process in self.tasks:
+            for requirement in self.upstream[process]:
+                if requirement not in self.tasks:
+                    raise RuntimeError('%s requires %s, which is not in '
+                                       'the pipeline'
+                                       % (self.name(process),
+                                          requirement.name))
+                self.downstream[requirement].append(process)
+
+    def _add_task(self, task):
+        for process in task.processes:
+            self.tasks[process] = task
+            upstream = []
+            if task.outer_process is not None:
+                upstream.append(task.outer_process)
+            for requirement in process.requirements:
+                if requirement not in upstream:
+                    upstream.append(requirement)
+            self.upstream[process] = upstream
+            self.downstream[process] = []
+        for process in task.processes:
+            for subtask in process.subtasks:
+                self._add_task(subtask)
+
+    @property
+    def processes(self):
+        return list(self.tasks)
+
+    def name(self, process):
+        """The qualified name, task_name.process_name, of a process."""
+        return '.'.join((self.tasks[process].name, process.name))
+
+    def topological_order(self):
+        waiting = dict((process, len(upstream)) for process, upstream
+                       in self.upstream.items())
+        order = [process for process in self.tasks if not waiting[process]]
+        for process in order:
+            for child in self.downstream[process]:
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    order.append(child)
+        if len(order) != len(self.tasks):
+            cycle = [self.name(process) for process in self.tasks
+                     if waiting[process]]
+            raise RuntimeError('dependency cycle among processes: '
+                               + ', '.join(cycle))
+        return order
+
+    def reduced_requirements(self):
+        """
+        The requirements of each process with those implied by its
+        other requirements removed, i.e., the transitive reduction of
+        the requirement edges.  Reachability includes the implicit
+        edges from outer processes to their subtasks.  Each process's
+        set of ancestors is held as an integer bitmask, so this takes
+        O(V*E/w) time for a word size w.
+        """
+        bits = dict((process, 1 << i) for i, process in enumerate(self.tasks))
+        ancestors = {}
+        reduced = OrderedDict()
+        for process in self.topological_order():
+            implied = 0
+            for requirement in self.upstream[process]:
+                implied |= ancestors[requirement]
+            ancestors[process] = implied
+            for requirement in self.upstream[process]:
+                ancestors[process] |= bits[requirement]
+            outer_process = self.tasks[process].outer_process
+            kept = []
+            for requirement in process.requirements:
+                if requirement is outer_process or bits[requirement] & implied:
+                    continue
+                implied |= bits[requirement]
+                kept.append(requirement)
+            reduced[process] = kept
+        return reduced
+
+    def job_chains(self):
+        """
+        Linear chains of job processes within a task.  Each member of
+        a chain after the first has the previous member as its only
+        requirement, and is the only process requiring it, and all
+        members run at the same site.  Only chains of two or more
+        processes are returned.
+        """
+        def is_job(process):
+            return process.job_type in ('std', 'long') \
+                and not process.subtasks
+
+        def successor(process):
+            downstream = self.downstream[process]
+            if not is_job(process) or len(downstream) != 1:
+                return None
+            child = downstream[0]
+            task = self.tasks[child]
+            upstream = [x for x in self.upstream[child]
+                        if x is not task.outer_process]
+            if task is self.tasks[process] and is_job(child) \
+                    and upstream == [process] and child.site == process.site:
+                return child
+            return None
+
+        successors = {}
+        for process in self.tasks:
+            child = successor(process)
+            if child is not None:
+                successors[process] = child
+        linked = set(successors.values())
+        chains = []
+        for process in self.tasks:
+            if process in linked or process not in successors:
+                continue
+            chain = [process]
+            while chain[-1] in successors:
+                chain.append(successors[chain[-1]])
+            chains.append(chain)
+        return chains
+
+    def __len__(self):
+        return len(self.tasks)
@@ -0,0 +1,140 @@
+"""
+Incremental regeneration of the files generated for a pipeline, using
+a manifest of content hashes.
+"""
+from __future__ import print_function, absolute_import
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from .graph import ProcessGraph
+
+__all__ = ['BuildReport', 'incremental_build']
+
+class BuildReport(object):
+    """
+    Outcome of an incremental build.  written, unchanged and preserved
+    list the artifact paths that were (re)written, that already had
+    the rendered content, and that were left alone because they have
+    been edited since they were generated.  changed_processes and
+    removed_processes list the qualified names of processes whose xml
+    or scripts differ from, or which are missing from, the previous
+    build.
+    """
+    def __init__(self):
+        self.written = []
+        self.unchanged = []
+        self.preserved = []
+        self.changed_processes = []
+        self.removed_processes = []
+
+class _HashWriter(object):
+    def __init__(self):
+        self._hash = hashlib.sha1()
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        self._hash.update(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+class _TextBuffer(object):
+    # Collects the text written to it, as str on both python 2 and 3.
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(data)
+
+    def getvalue(self):
+        return ''.join(self._parts)
+
+def content_hash(write_func):
+    """Hash of the content that write_func writes to a file object."""
+    writer = _HashWriter()
+    write_func(writer)
+    return writer.hexdigest()
+
+def file_hash(path, chunk_size=1 << 20):
+    writer = _HashWriter()
+    with open(path, 'rb') as input_:
+        for chunk in iter(lambda: input_.read(chunk_size), b''):
+            writer.write(chunk)
+    return writer.hexdigest()
+
+def incremental_build(pipeline, xml_file, manifest_file, clobber=False,
+                      substream_tables=False):
+    """
+    Write the pipeline xml, the workflow module and the job scripts,
+    skipping files whose content is unchanged.  The module and scripts
+    are meant to be edited, so a file that differs from both the
+    rendered content and the hash recorded in the manifest, or that
+    predates the manifest, is preserved unless clobber is True.
+    substream_tables is passed to the module writer (see
+    Pipeline.write_python_module).
+    """
+    try:
+        with open(manifest_file) as input_:
+            manifest = json.load(input_)
+    except (IOError, OSError, ValueError):
+        manifest = {}
+    old_artifacts = manifest.get('artifacts', {})
+    old_processes = manifest.get('processes', {})
+    artifacts = {}
+    report = BuildReport()
+
+    def update(path, content, editable=True):
+        new_hash = content_hash(lambda output: output.write(content))
+        old_hash = old_artifacts.get(path)
+        if os.path.isfile(path):
+            disk_hash = file_hash(path)
+            if disk_hash == new_hash:
+                artifacts[path] = new_hash
+                report.unchanged.append(path)
+                return new_hash
+            if editable and not clobber and disk_hash != old_hash:
+                if old_hash is not None:
+                    artifacts[path] = old_hash
+                report.preserved.append(path)
+                return new_hash
+        with open(path, 'wb' if isinstance(content, bytes) else 'w') \
+                as output:
+            output.write(content)
+        artifacts[path] = new_hash
+        report.written.append(path)
+        return new_hash
+
+    # Each file is rendered once, for both its hash and its content.
+    update(xml_file, pipeline.toxml(), editable=False)
+    with pipeline._phase('write module'):
+        module = _TextBuffer()
+        pipeline._write_module(module, substream_tables=substream_tables)
+        update(pipeline.get_module_name(), module.getvalue())
+    script_hashes = {}
+    with pipeline._phase('write scripts'):
+        for process, script_name, content in pipeline.process_scripts():
+            script_hash = update(script_name, content)
+            script_hashes.setdefault(process, []).append(script_hash)
+
+    processes = _process_hashes(pipeline, script_hashes)
+    for name, process_hash in processes.items():
+        if old_processes.get(name) != process_hash:
+            report.changed_processes.append(name)
+    report.removed_processes = [name for name in old_processes
+                                if name not in processes]
+
+    with open(manifest_file, 'w') as output:
+        json.dump(dict(artifacts=artifacts, processes=processes), output,
+                  indent=2, sort_keys=True)
+    return report
+
+def _process_hashes(pipeline, script_hashes):
+    graph = ProcessGraph(pipeline.main_task)
+    hashes = OrderedDict()
+    for process in graph.processes:
+        content = [str(process)] + script_hashes.get(process, [])
+        hashes[graph.name(process)] \
+            = content_hash(lambda output: output.write('\n'.join(content)))
+    return hashes
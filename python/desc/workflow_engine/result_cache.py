@@ -0,0 +1,79 @@
+"""
+Persistent cache of the results of locally run processes.
+"""
+from __future__ import print_function, absolute_import
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+__all__ = ['ResultCache']
+
+class ResultCache(object):
+    """
+    Results of successful process runs, keyed by a hash of everything
+    that the run depended on (see LocalExecutor), and kept in a json
+    file.  At most max_entries results are kept; the least recently
+    used ones are evicted first.  Only the exit status, and the
+    substreams created by script processes, are cached: the output
+    files of a process are assumed to remain in the work directory.
+    """
+    def __init__(self, path, max_entries=10000):
+        self.path = os.path.abspath(path)
+        self.max_entries = max_entries
+        try:
+            with open(path) as input_:
+                entries = json.load(input_, object_pairs_hook=OrderedDict)
+        except (IOError, OSError, ValueError):
+            entries = OrderedDict()
+        self._entries = entries
+        self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """The cached result for key, or None, marking it as used."""
+        try:
+            result = self._entries.pop(key)
+        except KeyError:
+            return None
+        self._entries[key] = result
+        return result
+
+    def put(self, key, result):
+        self._entries.pop(key, None)
+        self._entries[key] = result
+        self._evict()
+
+    def clear(self):
+        self._entries.clear()
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        temp_file = os.path.join(directory,
+                                 '.%s.tmp' % os.path.basename(self.path))
+        with open(temp_file, 'w') as output:
+            json.dump(self._entries, output)
+        os.rename(temp_file, self.path)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def key(*parts):
+        """Hash of the json form of parts."""
+        text = json.dumps(parts, sort_keys=True)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def file_digest(path):
+    """Hash of the content of a file, or None if it does not exist."""
+    try:
+        with open(path, 'rb') as input_:
+            return hashlib.sha1(input_.read()).hexdigest()
+    except (IOError, OSError):
+        return None
@@ -0,0 +1,207 @@
+"""
+Partitioning of large pipelines into a chain of smaller ones.
+"""
+from __future__ import print_function, absolute_import
+import os
+from .graph import ProcessGraph
+from .variables import Variables
+
+__all__ = ['shard_pipeline']
+
+def shard_pipeline(pipeline, max_processes=None, max_bytes=None):
+    """
+    Split pipeline into pipelines of at most max_processes processes
+    and about max_bytes bytes of xml each, and return them in the order
+    in which they run.  Each process of the main task stays in one
+    shard with all of its subtasks, and the shards follow a
+    topological order of these units, cut where the fewest
+    dependencies cross between shards.  Dependencies on processes in
+    earlier shards are dropped: every shard but the last ends with a
+    script process, launch_shard_<n> unless the shard has a process of
+    that name, that runs after all of its other processes and starts a
+    stream of the next shard with pipeline.createStream, passing on the
+    variables that the stream was given.  Each shard has its own
+    workflow module, named after SCRIPT_NAME with the shard number
+    appended.
+
+    A unit that exceeds the limits by itself forms a shard of its own.
+    If the pipeline fits the limits, [pipeline] is returned.
+    """
+    graph = ProcessGraph(pipeline.main_task)
+    units = _units(pipeline.main_task)
+    order, edges = _unit_order(graph, units)
+    sizes = [_unit_size(units[index], max_bytes is not None)
+             for index in order]
+    fixed_bytes = 0
+    if max_bytes is not None:
+        fixed_bytes = len(pipeline.header) \
+            + len('\n'.join(pipeline.main_task.variables.lines))
+    bounds = _cut(order, edges, sizes, max_processes, max_bytes, fixed_bytes)
+    if len(bounds) == 1:
+        return [pipeline]
+    names = [_shard_name(pipeline.main_task.name, number)
+             for number in range(len(bounds))]
+    shards = []
+    for number, (start, stop) in enumerate(bounds):
+        members = sorted(order[start:stop])
+        next_name = names[number + 1] if number + 1 < len(bounds) else None
+        shards.append(_make_shard(pipeline, graph, names[number], number,
+                                  [units[index] for index in members],
+                                  next_name))
+    return shards
+
+def _units(main_task):
+    # Each process of the main task with the processes of its subtasks.
+    units = []
+    for process in main_task.processes:
+        unit = [process]
+        for member in unit:
+            for subtask in member.subtasks:
+                unit.extend(subtask.processes)
+        units.append(unit)
+    return units
+
+def _unit_order(graph, units):
+    unit_of = {}
+    for index, unit in enumerate(units):
+        for process in unit:
+            unit_of[process] = index
+    upstream = [set() for _ in units]
+    for process, requirements in graph.upstream.items():
+        index = unit_of[process]
+        for requirement in requirements:
+            if unit_of[requirement] != index:
+                upstream[index].add(unit_of[requirement])
+    downstream = [[] for _ in units]
+    for index, requirements in enumerate(upstream):
+        for requirement in requirements:
+            downstream[requirement].append(index)
+    # Taking the most recently enabled unit first keeps chains of
+    # dependent units together, so that fewer cuts break them.
+    waiting = [len(requirements) for requirements in upstream]
+    ready = [index for index in reversed(range(len(units)))
+             if not waiting[index]]
+    order = []
+    while ready:
+        index = ready.pop()
+        order.append(index)
+        for child in sorted(downstream[index], reverse=True):
+            waiting[child] -= 1
+            if waiting[child] == 0:
+                ready.append(child)
+    if len(order) != len(units):
+        raise RuntimeError('dependency cycle among the processes of '
+                           + graph.main_task.name)
+    edges = [(requirement, index) for index in range(len(units))
+             for requirement in upstream[index]]
+    return order, edges
+
+def _unit_size(unit, count_bytes):
+    num_bytes = 0
+    if count_bytes:
+        for process in unit:
+            num_bytes += len(str(process))
+            for subtask in process.subtasks:
+                num_bytes += len('\n'.join(subtask.variables.lines))
+    return len(unit), num_bytes
+
+def _cut(order, edges, sizes, max_processes, max_bytes, fixed_bytes):
+    # crossing[k] is the number of edges between units that a cut
+    # before position k of order would break.
+    position = dict((index, k) for k, index in enumerate(order))
+    crossing = [0]*(len(order) + 1)
+    for upstream, downstream in edges:
+        crossing[position[upstream] + 1] += 1
+        crossing[position[downstream] + 1] -= 1
+    for k in range(1, len(crossing)):
+        crossing[k] += crossing[k - 1]
+    bounds = []
+    start = 0
+    while start < len(order):
+        stop = start
+        num_processes = 0
+        num_bytes = fixed_bytes
+        while stop < len(order):
+            num_processes += sizes[stop][0]
+            num_bytes += sizes[stop][1]
+            if stop > start and \
+                    ((max_processes is not None
+                      and num_processes > max_processes) or
+                     (max_bytes is not None and num_bytes > max_bytes)):
+                break
+            stop += 1
+        if stop < len(order):
+            # Cut in the second half of the window where the fewest
+            # dependencies cross, preferring larger shards.
+            first = start + max(1, (stop - start + 1)//2)
+            stop = min(range(first, stop + 1),
+                       key=lambda k: (crossing[k], -k))
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+def _shard_name(name, number):
+    suffix = '_%i' % number
+    return name[:30 - len(suffix)] + suffix
+
+def _make_shard(pipeline, graph, name, number, units, next_name):
+    shard = pipeline.__class__(name, pipeline.main_task.version)
+    shard.header = pipeline.header
+    shard.trace = pipeline.trace
+    main_task = shard.main_task
+    main_task.notation = pipeline.main_task.notation
+    main_task.variables = Variables(pipeline.main_task.variables.lines)
+    if 'SCRIPT_NAME' in main_task.variables:
+        root, ext = os.path.splitext(main_task.get_variable('SCRIPT_NAME'))
+        main_task.set_variable('SCRIPT_NAME', '%s_%i%s' % (root, number, ext))
+    copies = {}
+    for unit in units:
+        main_task.add_process(_copy_process(unit[0], copies))
+    for original, copy in copies.items():
+        copy.requirements = [copies[requirement] for requirement
+                             in original.requirements
+                             if requirement in copies]
+    if next_name is not None:
+        from .workflow_engine import Process
+        launcher = Process(_launcher_name(copies.values(), number + 1))
+        launcher.requirements = [copies[process] for process in graph.tasks
+                                 if process in copies and
+                                 not any(child in copies for child
+                                         in graph.downstream[process])]
+        main_task.add_process(launcher)
+        shard.next_shard = (launcher.name, next_name)
+    return shard
+
+def _launcher_name(processes, number):
+    # Script processes are functions of the workflow module, so the
+    # name must differ from those of all the processes of the shard.
+    names = set(process.name for process in processes)
+    name = 'launch_shard_%i' % number
+    i = 0
+    while name in names:
+        name = 'launch_shard_%i_%i' % (number, i)
+        i += 1
+    return name
+
+def _copy_process(process, copies):
+    copy = type(process)(process.name)
+    copy.site = process.site
+    copy.notation = process.notation
+    copy.job = process.job
+    copy.script = process.script
+    copies[process] = copy
+    if process.fused:
+        copy.fused = [copies[member] if member in copies
+                      else _copy_process(member, copies)
+                      for member in process.fused]
+    for subtask in process.subtasks:
+        task = type(subtask)(subtask.name)
+        task.notation = subtask.notation
+        if subtask.variables:
+            task.variables = Variables(subtask.variables.lines)
+        if subtask.launch_options:
+            task.launch_options = dict(subtask.launch_options)
+        copy.add_subtask(task)
+        for subprocess in subtask.processes:
+            task.add_process(_copy_process(subprocess, copies))
+    return copy
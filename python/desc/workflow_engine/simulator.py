@@ -0,0 +1,234 @@
+"""
+Discrete-event simulation of a pipeline running on modeled batch farms.
+"""
+from __future__ import print_function, absolute_import
+import heapq
+import random
+from collections import OrderedDict, deque
+from .analysis import process_runtimes
+from .graph import ProcessGraph
+
+__all__ = ['BatchFarm', 'PipelineSimulator', 'SimulationResult']
+
+# Event types.
+_ELIGIBLE, _FINISH = range(2)
+
+class BatchFarm(object):
+    """
+    Model of the batch system at a site: a number of job slots and the
+    scheduler latency each job sees before it is eligible to start.
+    queue_wait is either a constant, in seconds, or a function that
+    takes a random.Random instance and returns a wait time.
+    """
+    def __init__(self, slots, queue_wait=0.):
+        if slots < 1:
+            raise RuntimeError('a batch farm needs at least one slot')
+        self.slots = slots
+        self.queue_wait = queue_wait
+
+    def sample_wait(self, rng):
+        if callable(self.queue_wait):
+            return self.queue_wait(rng)
+        return self.queue_wait
+
+    @staticmethod
+    def exponential_wait(mean):
+        return lambda rng: rng.expovariate(1./mean) if mean > 0 else 0.
+
+class SimulationResult(object):
+    """
+    Outcome of a simulated pipeline run.  timeline maps each site to a
+    list of (time, busy slots, queue depth) tuples, recorded whenever
+    either value changes; queue depth counts submitted jobs that have
+    not yet started.
+    """
+    def __init__(self, makespan, farms, timeline, num_jobs):
+        self.makespan = makespan
+        self.farms = farms
+        self.timeline = timeline
+        self.num_jobs = num_jobs
+
+    def utilization(self, site):
+        """Mean fraction of the site's slots in use up to the makespan."""
+        if self.makespan <= 0:
+            return 0.
+        busy_time = 0.
+        samples = self.timeline[site]
+        for (t0, busy, _), (t1, _, _) in zip(samples, samples[1:]):
+            busy_time += busy*(t1 - t0)
+        return busy_time/(self.farms[site].slots*self.makespan)
+
+    def max_queue_depth(self, site):
+        return max([depth for _, _, depth in self.timeline[site]] or [0])
+
+class PipelineSimulator(object):
+    """
+    Replay a pipeline against BatchFarm models.  Job processes run at
+    the site given by sites[qualified name], or at the pipeline's SITE
+    otherwise; script processes run on the pipeline server without
+    using a slot.  Each substream of a subtask runs its own instance of
+    the subtask's processes, and processes depending on a subtask
+    process wait for all of its substreams.
+
+    The graph is indexed once, so that run() can be called repeatedly
+    to sweep over farm sizes, queue waits and fan-out counts.
+    """
+    def __init__(self, pipeline, runtimes=None, sites=None, site=None):
+        graph = ProcessGraph(pipeline.main_task)
+        graph.topological_order()
+        processes = graph.processes
+        index = dict((process, i) for i, process in enumerate(processes))
+        names = [graph.name(process) for process in processes]
+        if site is None:
+            site = pipeline.main_task.variables.get('SITE', 'SLAC')
+        sites = sites if sites is not None else {}
+        self.default_site = site
+        self.site = [sites.get(name, site) if process.job is not None
+                     else None for name, process in zip(names, processes)]
+        # Jobs without runtime estimates take the MAXCPU values of the
+        # sites where they run.
+        runtime = dict((x, process_runtimes(graph, runtimes, site=x))
+                       for x in set(self.site) | set([site]))
+        self.runtime = [runtime[x if x is not None else site][name]
+                        for x, name in zip(self.site, names)]
+        self.subtask = [graph.tasks[process].name for process in processes]
+        self.outer = [index.get(graph.tasks[process].outer_process, -1)
+                      for process in processes]
+        self.same_upstream = []
+        self.other_upstream = []
+        self.same_downstream = []
+        self.other_downstream = []
+        for process in processes:
+            task = graph.tasks[process]
+            upstream = [x for x in graph.upstream[process]
+                        if x is not task.outer_process]
+            self.same_upstream.append(
+                len([x for x in upstream if graph.tasks[x] is task]))
+            self.other_upstream.append(
+                [index[x] for x in upstream if graph.tasks[x] is not task])
+            self.same_downstream.append(
+                [index[x] for x in graph.downstream[process]
+                 if graph.tasks[x] is task])
+            self.other_downstream.append(
+                [index[x] for x in graph.downstream[process]
+                 if graph.tasks[x] is not task
+                 and graph.tasks[x].outer_process is not process])
+        self.children = [[[index[x] for x in subtask.processes]
+                          for subtask in process.subtasks]
+                         for process in processes]
+        self.main = [index[x] for x in pipeline.main_task.processes]
+
+    def run(self, farms, fanout=None, seed=None):
+        """
+        Simulate one run.  farms maps site names to BatchFarm
+        instances, or is a single BatchFarm for the pipeline's site,
+        and fanout maps subtask names to the number of substreams
+        created by their outer process (default 1).
+        """
+        if isinstance(farms, BatchFarm):
+            farms = {self.default_site: farms}
+        fanout = fanout if fanout is not None else {}
+        rng = random.Random(seed)
+        num_procs = len(self.runtime)
+        done = [False]*num_procs
+        unfinished = [0]*num_procs
+        instances = [[] for _ in range(num_procs)]
+        waiting = {}
+        events = []
+        counter = [0]
+        busy = dict((site, 0) for site in farms)
+        queued = dict((site, 0) for site in farms)
+        eligible = dict((site, deque()) for site in farms)
+        timeline = OrderedDict((site, [(0., 0, 0)]) for site in farms)
+        num_jobs = [0]
+        now = [0.]
+
+        def push(time, kind, item):
+            counter[0] += 1
+            heapq.heappush(events, (time, counter[0], kind, item))
+
+        def record(site):
+            samples = timeline[site]
+            if samples[-1][0] == now[0]:
+                samples[-1] = (now[0], busy[site], queued[site])
+            else:
+                samples.append((now[0], busy[site], queued[site]))
+
+        def ready(item):
+            site = self.site[item[0]]
+            if site is None:
+                push(now[0] + self.runtime[item[0]], _FINISH, item)
+                return
+            if site not in farms:
+                raise RuntimeError('no batch farm for site %s' % site)
+            num_jobs[0] += 1
+            queued[site] += 1
+            record(site)
+            push(now[0] + farms[site].sample_wait(rng), _ELIGIBLE, item)
+
+        def create(i, stream):
+            count = self.same_upstream[i] \
+                + len([j for j in self.other_upstream[i] if not done[j]])
+            item = (i, stream)
+            waiting[item] = count
+            instances[i].append(stream)
+            if count == 0:
+                ready(item)
+
+        def release(item):
+            waiting[item] -= 1
+            if waiting[item] == 0:
+                ready(item)
+
+        def check_done(i):
+            if done[i] or unfinished[i]:
+                return
+            if self.outer[i] >= 0 and not done[self.outer[i]]:
+                return
+            done[i] = True
+            for j in self.other_downstream[i]:
+                for stream in instances[j]:
+                    release((j, stream))
+            for processes in self.children[i]:
+                for j in processes:
+                    check_done(j)
+
+        def start_jobs(site):
+            farm = farms[site]
+            while eligible[site] and busy[site] < farm.slots:
+                item = eligible[site].popleft()
+                busy[site] += 1
+                queued[site] -= 1
+                push(now[0] + self.runtime[item[0]], _FINISH, item)
+            record(site)
+
+        for i in self.main:
+            unfinished[i] += 1
+            create(i, ())
+        makespan = 0.
+        while events:
+            now[0], _, kind, item = heapq.heappop(events)
+            i, stream = item
+            site = self.site[i]
+            if kind == _ELIGIBLE:
+                eligible[site].append(item)
+                start_jobs(site)
+                continue
+            makespan = now[0]
+            if site is not None:
+                busy[site] -= 1
+                start_jobs(site)
+            unfinished[i] -= 1
+            for j in self.same_downstream[i]:
+                release((j, stream))
+            for processes in self.children[i]:
+                if not processes:
+                    continue
+                num_streams = fanout.get(self.subtask[processes[0]], 1)
+                for j in processes:
+                    unfinished[j] += num_streams
+                for k in range(num_streams):
+                    for j in processes:
+                        create(j, stream + (k,))
+            check_done(i)
+        return SimulationResult(makespan, farms, timeline, num_jobs[0])
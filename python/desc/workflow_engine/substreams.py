@@ -0,0 +1,97 @@
+"""
+Fixed-width record files of substream pipeline variables, read row by
+row by the stream launching functions of the workflow module.
+"""
+from __future__ import print_function, absolute_import
+import os
+import re
+
+__all__ = ['SubstreamTable']
+
+class SubstreamTable(object):
+    """
+    A table of pipeline variables, one row per substream.  The file is
+    plain text with comma-separated fields: a header line with the
+    variable names, then one line per substream, all padded with
+    spaces to the same length.  The launchers in the workflow module
+    can then stream the rows with nothing but file iteration, which
+    Jython on the pipeline server supports, while Python code can
+    seek to any row without reading the ones before it.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as input_:
+            header = input_.readline()
+            self.record_size = len(header)
+            input_.seek(0, os.SEEK_END)
+            size = input_.tell()
+        if not header.endswith(b'\n') or size % self.record_size:
+            raise RuntimeError('%s is not a substream table' % filename)
+        self.names = header.decode('utf-8').rstrip().split(',')
+        self._num_rows = size//self.record_size - 1
+
+    @classmethod
+    def write(cls, filename, rows, names=None):
+        """
+        Write a table and return it.  rows is a sequence of dicts, of
+        tuples in the order of names, or a NumPy structured array.
+        Values are converted with str, and must not contain commas,
+        equal signs, newlines or trailing whitespace, since rows are
+        passed to createSubstream as "NAME=value,..." strings.
+        """
+        if hasattr(rows, 'dtype'):
+            names = names or rows.dtype.names
+            rows = rows.tolist()
+        rows = list(rows)
+        if names is None:
+            if not rows or not hasattr(rows[0], 'keys'):
+                raise RuntimeError('names are needed for the table columns')
+            names = list(rows[0].keys())
+        lines = [_line(names, names)]
+        for row in rows:
+            if hasattr(row, 'keys'):
+                row = [row[name] for name in names]
+            lines.append(_line(row, names))
+        lines = [line.encode('utf-8') for line in lines]
+        width = max(len(line) for line in lines)
+        with open(filename, 'wb') as output:
+            for line in lines:
+                output.write(line.ljust(width) + b'\n')
+        return cls(filename)
+
+    def __len__(self):
+        return self._num_rows
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._num_rows
+        if not 0 <= index < self._num_rows:
+            raise IndexError('substream table index out of range')
+        with open(self.filename, 'rb') as input_:
+            input_.seek((index + 1)*self.record_size)
+            return self._parse(input_.readline())
+
+    def __iter__(self):
+        return self.rows()
+
+    def rows(self, start=0):
+        """Generate the rows, as dicts, beginning with row start."""
+        with open(self.filename, 'rb') as input_:
+            input_.seek((start + 1)*self.record_size)
+            for line in input_:
+                yield self._parse(line)
+
+    def _parse(self, line):
+        values = line.decode('utf-8').rstrip().split(',')
+        return dict(zip(self.names, values))
+
+def _line(values, names):
+    line = ','.join([value.decode('utf-8') if isinstance(value, bytes)
+                     else str(value) for value in values])
+    if line.count(',') != len(names) - 1 or _invalid.search(line):
+        raise RuntimeError('invalid substream table row %s for the columns %s'
+                           % (list(values), list(names)))
+    return line
+
+# Equal signs, newlines, and whitespace at the end of a field.
+_invalid = re.compile(r'[=\n]|\s(,|$)')
@@ -0,0 +1,146 @@
+"""
+Timing traces of local pipeline runs and of pipeline generation, for
+viewing in chrome://tracing or Perfetto, or as a flat csv summary.
+"""
+from __future__ import print_function, absolute_import
+import csv
+import json
+import time
+
+__all__ = ['Trace']
+
+class Trace(object):
+    """
+    Timestamps, in seconds since the epoch, of generation phases and
+    of process instances.  phases lists (name, start, end) tuples, as
+    recorded by the phase context manager, and processes lists dicts
+    with the qualified name and stream path of each instance, the
+    times at which it was queued, started and ended, its peak resident
+    set size in kB (None if unknown), its exit status, and whether
+    its result was taken from a cache.
+    """
+    csv_columns = ('kind', 'name', 'stream', 'queued', 'start', 'end',
+                   'wait', 'duration', 'peak_rss_kb', 'status', 'cached')
+
+    def __init__(self):
+        self.phases = []
+        self.processes = []
+
+    def phase(self, name):
+        """Context manager that records the time spent in a phase."""
+        return _Phase(self, name)
+
+    def add_process(self, name, stream, queued, start, end, peak_rss=None,
+                    status=None, cached=False):
+        self.processes.append(dict(name=name, stream=stream, queued=queued,
+                                   start=start, end=end, peak_rss_kb=peak_rss,
+                                   status=status, cached=cached))
+
+    def origin(self):
+        times = [start for _, start, _ in self.phases]
+        times.extend(record['queued'] for record in self.processes)
+        return min(times) if times else 0
+
+    def chrome_events(self):
+        """
+        The trace in the Chrome trace event format.  Generation phases
+        are shown as one thread, the time that process instances spend
+        queued as another, and the instances themselves are spread
+        over as many threads as ran concurrently.
+        """
+        origin = self.origin()
+
+        def microseconds(seconds):
+            return int(round((seconds - origin)*1e6))
+
+        events = [_metadata('process_name', 0, 0, 'generation'),
+                  _metadata('process_name', 1, 0, 'local run'),
+                  _metadata('thread_name', 1, 0, 'queue')]
+        for name, start, end in self.phases:
+            events.append(dict(name=name, cat='generation', ph='X', pid=0,
+                               tid=0, ts=microseconds(start),
+                               dur=microseconds(end) - microseconds(start)))
+        lanes = []
+        for record in sorted(self.processes, key=lambda x: x['start']):
+            label = record['name']
+            if record['stream'] != '0':
+                label += ' ' + record['stream']
+            args = dict((key, record[key]) for key
+                        in ('stream', 'peak_rss_kb', 'status', 'cached'))
+            if record['start'] > record['queued']:
+                events.append(dict(name=label, cat='queue', ph='X', pid=1,
+                                   tid=0, ts=microseconds(record['queued']),
+                                   dur=microseconds(record['start'])
+                                   - microseconds(record['queued'])))
+            for lane, end in enumerate(lanes):
+                if end <= record['start']:
+                    break
+            else:
+                lane = len(lanes)
+                lanes.append(None)
+                events.append(_metadata('thread_name', 1, lane + 1,
+                                        'worker %i' % lane))
+            lanes[lane] = record['end']
+            events.append(dict(name=label,
+                               cat='cached' if record['cached'] else 'process',
+                               ph='X', pid=1, tid=lane + 1,
+                               ts=microseconds(record['start']),
+                               dur=microseconds(record['end'])
+                               - microseconds(record['start']),
+                               args=args))
+        return events
+
+    def write_chrome_trace(self, fileobj):
+        json.dump(dict(traceEvents=self.chrome_events(),
+                       displayTimeUnit='ms'), fileobj)
+
+    def write_csv(self, fileobj):
+        """
+        Write one row per phase and per process instance, with times in
+        seconds relative to the start of the trace.
+        """
+        origin = self.origin()
+        writer = csv.writer(fileobj)
+        writer.writerow(self.csv_columns)
+        for name, start, end in self.phases:
+            writer.writerow(['phase', name, '', '', '%.6f' % (start - origin),
+                             '%.6f' % (end - origin), '',
+                             '%.6f' % (end - start), '', '', ''])
+        for record in self.processes:
+            writer.writerow(['process', record['name'], record['stream'],
+                             '%.6f' % (record['queued'] - origin),
+                             '%.6f' % (record['start'] - origin),
+                             '%.6f' % (record['end'] - origin),
+                             '%.6f' % (record['start'] - record['queued']),
+                             '%.6f' % (record['end'] - record['start']),
+                             '' if record['peak_rss_kb'] is None
+                             else record['peak_rss_kb'],
+                             '' if record['status'] is None
+                             else record['status'],
+                             int(record['cached'])])
+
+class _Phase(object):
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.phases.append((self.name, self.start, time.time()))
+        return False
+
+class _NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+no_phase = _NoPhase()
+
+def _metadata(kind, pid, tid, name):
+    return dict(name=kind, ph='M', pid=pid, tid=tid, args=dict(name=name))
@@ -0,0 +1,128 @@
+"""
+Checks of the structure of a pipeline before it is written out.
+"""
+from __future__ import print_function, absolute_import
+from collections import OrderedDict
+
+__all__ = ['pipeline_problems']
+
+def pipeline_problems(main_task):
+    """
+    List the problems in the pipeline of main_task that Pipeline-II
+    would reject: invalid or duplicate task and process names,
+    processes that belong to more than one task or whose owner_task
+    does not match their task, requirements on processes that are not
+    in the pipeline or whose unqualified names refer to another
+    process, and dependency cycles.  All of the tasks, processes and
+    requirements are visited once, so this is linear in the size of
+    the pipeline.
+    """
+    from .workflow_engine import check_name
+    problems = []
+    owners = OrderedDict()
+    process_names = {}
+    task_names = {}
+    pending = [main_task]
+    while pending:
+        task = pending.pop()
+        if task in process_names:
+            problems.append('task %s is created by more than one process'
+                            % task.name)
+            continue
+        _check(check_name, task.name, problems)
+        if task.name in task_names:
+            problems.append('duplicate task name %s' % task.name)
+        task_names[task.name] = task
+        names = process_names[task] = {}
+        owner_task = task if task.version is None else None
+        for process in task.processes:
+            if process in owners:
+                problems.append('process %s is in tasks %s and %s'
+                                % (process.name, owners[process].name,
+                                   task.name))
+                continue
+            owners[process] = task
+            _check(check_name, process.name, problems)
+            if process.name in names:
+                problems.append('duplicate process name %s.%s'
+                                % (task.name, process.name))
+            names.setdefault(process.name, process)
+            if process.owner_task is not owner_task:
+                problems.append('owner_task of %s.%s is not its task'
+                                % (task.name, process.name))
+            for subtask in process.subtasks:
+                if subtask.outer_process is not process:
+                    problems.append('outer_process of subtask %s is not %s'
+                                    % (subtask.name, process.name))
+        pending.extend(subtask for process in reversed(task.processes)
+                       for subtask in reversed(process.subtasks))
+
+    def name(process):
+        return '%s.%s' % (owners[process].name, process.name)
+
+    upstream = OrderedDict()
+    for process, task in owners.items():
+        edges = upstream[process] = []
+        if task.outer_process in owners:
+            edges.append(task.outer_process)
+        for requirement in process.requirements:
+            if requirement not in owners:
+                problems.append('%s requires %s, which is not in the '
+                                'pipeline' % (name(process),
+                                              requirement.name))
+                continue
+            # Requirements on main task processes are written without
+            # the task name, so they must not be hidden by a process
+            # of the same name in the requiring process's task.
+            if requirement.owner_task is None \
+                    and owners[requirement] is not task \
+                    and requirement.name in process_names[task]:
+                hidden_by = process_names[task][requirement.name]
+                problems.append('%s requires %s, but its unqualified name '
+                                'refers to %s' % (name(process),
+                                                  name(requirement),
+                                                  name(hidden_by)))
+            edges.append(requirement)
+    cycle = _cycle_members(upstream)
+    if cycle:
+        problems.append('dependency cycle among processes: '
+                        + ', '.join(name(process) for process in cycle))
+    return problems
+
+def _check(check_name, name, problems):
+    try:
+        check_name(name)
+    except RuntimeError as eobj:
+        problems.append(str(eobj))
+
+def _cycle_members(upstream):
+    # Remove the processes with no upstream, and then those with no
+    # downstream, among the rest; what remains lies on a cycle.
+    downstream = dict((process, []) for process in upstream)
+    waiting = {}
+    for process, edges in upstream.items():
+        waiting[process] = len(edges)
+        for requirement in edges:
+            downstream[requirement].append(process)
+    order = [process for process in upstream if not waiting[process]]
+    for process in order:
+        for child in downstream[process]:
+            waiting[child] -= 1
+            if waiting[child] == 0:
+                order.append(child)
+    if len(order) == len(upstream):
+        return []
+    remaining = set(process for process in upstream if waiting[process])
+    children = dict((process, sum(1 for child in downstream[process]
+                                  if child in remaining))
+                    for process in remaining)
+    order = [process for process in remaining if not children[process]]
+    for process in order:
+        for requirement in upstream[process]:
+            if requirement in remaining:
+                children[requirement] -= 1
+                if children[requirement] == 0:
+                    order.append(requirement)
+    done = set(order)
+    return [process for process in upstream
+            if process in remaining and process not in done]
@@ -0,0 +1,137 @@
+"""
+Ordered, indexed store for the <var> definitions of a task.
+"""
+from __future__ import print_function, absolute_import
+from xml.sax.saxutils import escape, unescape
+import xml.etree.ElementTree as ET
+
+__all__ = ['Variables']
+
+_entities = {'&quot;': '"', '&apos;': "'"}
+
+class Variables(object):
+    """
+    The variable block of a task.  Each line of the block is kept in
+    order, so that comments and the enclosing <variables> tags are
+    rendered as read in, while the <var> values are indexed by name.
+    owner is the task that holds the store, if any; it is told of
+    every change, so that it can clear its cached rendering (see
+    Task._variables_changed).
+    """
+
+    def __init__(self, lines=(), owner=None):
+        self._lines = _VariableLines(self)
+        self._names = []
+        self._index = {}
+        self._values = {}
+        self._owner = owner
+        for line in lines:
+            self._add_line(line)
+
+    def __getstate__(self):
+        return list(self._lines), self._owner
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @classmethod
+    def read(cls, varfile):
+        with open(varfile) as input_:
+            return cls([x.strip() for x in input_])
+
+    def _add_line(self, line):
+        name, value = self._parse_var(line)
+        if name is not None and name not in self._index:
+            self._index[name] = len(self._lines)
+            self._names.append(name)
+            self._values[name] = value
+        list.append(self._lines, line)
+
+    @staticmethod
+    def _parse_var(line):
+        if not line.startswith('<var'):
+            return None, None
+        if line.endswith('</var>'):
+            # Fast path for the usual <var name="NAME">VALUE</var> form.
+            head, sep, tail = line[:-len('</var>')].partition('>')
+            if sep and head.startswith('<var name="') and head.endswith('"') \
+                    and head.count('"') == 2 and '<' not in tail:
+                return head[len('<var name="'):-1], unescape(tail, _entities)
+        try:
+            element = ET.fromstring(line)
+        except ET.ParseError:
+            return None, None
+        if element.tag != 'var' or 'name' not in element.attrib:
+            return None, None
+        return element.get('name'), element.text or ''
+
+    def __getitem__(self, varname):
+        try:
+            return self._values[varname]
+        except KeyError:
+            raise RuntimeError("variable %s not found" % varname)
+
+    def __setitem__(self, varname, value):
+        if varname not in self._index:
+            raise RuntimeError("variable %s not found" % varname)
+        self._values[varname] = value
+        list.__setitem__(self._lines, self._index[varname],
+                         '<var name="%s">%s</var>' % (varname, escape(value)))
+        if self._owner is not None:
+            self._owner._variables_changed(self)
+
+    def __contains__(self, varname):
+        return varname in self._index
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, varname, default=None):
+        return self._values.get(varname, default)
+
+    def items(self):
+        return [(name, self._values[name]) for name in self]
+
+    @property
+    def lines(self):
+        """
+        The lines of the block.  This is the store's own list: changes
+        made to it are written through, and the <var> lines re-indexed.
+        """
+        return self._lines
+
+    def _lines_changed(self):
+        lines = list(self._lines)
+        del self._names[:]
+        self._index.clear()
+        self._values.clear()
+        list.__delitem__(self._lines, slice(None))
+        for line in lines:
+            self._add_line(line)
+        if self._owner is not None:
+            self._owner._variables_changed(self)
+
+class _VariableLines(list):
+    """The lines of a Variables store, which re-index it when modified."""
+    __slots__ = ('_store',)
+
+    def __init__(self, store):
+        list.__init__(self)
+        self._store = store
+
+def _writes_through(method):
+    def mutator(self, *args, **kwds):
+        result = method(self, *args, **kwds)
+        self._store._lines_changed()
+        return result
+    mutator.__name__ = method.__name__
+    return mutator
+
+for _name in ('append', 'extend', 'insert', 'remove', 'pop', 'clear', 'sort',
+              'reverse', '__setitem__', '__delitem__', '__iadd__',
+              '__imul__'):
+    if hasattr(list, _name):
+        setattr(_VariableLines, _name, _writes_through(getattr(list, _name)))
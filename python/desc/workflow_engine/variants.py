@@ -0,0 +1,235 @@
+"""
+Generation of one pipeline for several sites and parameter variants.
+"""
+from __future__ import print_function, absolute_import
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import runpy
+import sys
+import time
+from collections import OrderedDict
+try:
+    import concurrent.futures
+except ImportError:
+    concurrent = None
+from .variables import Variables
+
+__all__ = ['variant_matrix', 'read_variants', 'render_variant',
+           'write_variants']
+
+_unsafe = re.compile(r'[^\w.-]+')
+
+def variant_matrix(overrides=None, matrix=None, variants=None):
+    """
+    A list of (name, overrides) pairs, one for each combination of a
+    point of the matrix with one of the named variants.  overrides is
+    a dict of variable values common to all variants, matrix is a dict
+    of lists of values, whose product is taken, and variants is a dict
+    of dicts of values keyed by variant name.  Each name joins the
+    variant name and the matrix values; later sources take precedence
+    over earlier ones.  The key 'version' sets the version of the main
+    task, and the other keys are main task variables.  The names, and
+    the order of the variants, follow the order of the keys, so pass
+    OrderedDicts where dicts are unordered (python < 3.7).
+    """
+    overrides = OrderedDict(overrides or ())
+    matrix = OrderedDict(matrix or ())
+    variants = OrderedDict(variants or ()) or OrderedDict([('', {})])
+    keys = list(matrix.keys())
+    result = []
+    names = set()
+    for name, values in variants.items():
+        for point in itertools.product(*[matrix[key] for key in keys]):
+            parts = [name] if name else []
+            parts.extend(_unsafe.sub('_', str(value)).strip('_')
+                         for value in point)
+            variant_name = '_'.join(parts) or 'default'
+            if variant_name in names:
+                raise RuntimeError('duplicate variant name ' + variant_name)
+            names.add(variant_name)
+            variant = OrderedDict(overrides)
+            variant.update(values)
+            variant.update(zip(keys, point))
+            result.append((variant_name, OrderedDict(
+                (key, str(value)) for key, value in variant.items())))
+    return result
+
+def read_variants(source):
+    """
+    The variants described by a json file name or file object holding
+    an object with the optional keys "overrides", "matrix" and
+    "variants" (see variant_matrix).
+    """
+    return variant_matrix(**_read_spec(source))
+
+def _read_spec(source):
+    if hasattr(source, 'read'):
+        spec = json.load(source, object_pairs_hook=OrderedDict)
+    else:
+        with open(source) as input_:
+            spec = json.load(input_, object_pairs_hook=OrderedDict)
+    unknown = set(spec) - set(('overrides', 'matrix', 'variants'))
+    if unknown:
+        raise RuntimeError('unknown keys in variant file: '
+                           + ', '.join(sorted(unknown)))
+    return spec
+
+def render_variant(pipeline, overrides, directory, clobber=False):
+    """
+    Write the xml, workflow module and job scripts of pipeline with
+    the overrides applied to directory, and return the paths of the
+    files written.  The pipeline is left unchanged.
+    """
+    main_task = pipeline.main_task
+    variables = main_task.variables
+    version = main_task.version
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+    try:
+        main_task.variables = Variables(variables.lines)
+        for name, value in overrides.items():
+            if name == 'version':
+                main_task.version = value
+            else:
+                main_task.set_variable(name, value)
+        files = [os.path.join(directory, main_task.name + '.xml'),
+                 os.path.join(directory, pipeline.get_module_name())]
+        with open(files[0], 'wb') as output:
+            pipeline.write_xml(output)
+        pipeline.write_python_module(clobber=clobber, directory=directory)
+        with pipeline._phase('write scripts'):
+            for process, script_name, content in pipeline.process_scripts():
+                files.append(os.path.join(directory, script_name))
+                pipeline._create_process_script(files[-1], content, clobber)
+    finally:
+        main_task.variables = variables
+        main_task.version = version
+    return files
+
+def write_variants(pipeline, variants, output_dir, max_workers=None,
+                   clobber=False):
+    """
+    Render the (name, overrides) variants of pipeline (see
+    variant_matrix) into subdirectories of output_dir named after
+    them, on a pool of max_workers processes, and return an
+    OrderedDict of the files written for each variant.  Where the
+    worker processes are forked, they share the pipeline built here;
+    otherwise it is pickled for each variant.  The variants are
+    rendered serially if concurrent.futures is not available.
+    """
+    for name, overrides in variants:
+        for varname in overrides:
+            if varname != 'version' and \
+                    varname not in pipeline.main_task.variables:
+                raise RuntimeError('variant %s: variable %s not found'
+                                   % (name, varname))
+    results = OrderedDict()
+    if concurrent is None or max_workers == 1 or len(variants) < 2:
+        for name, overrides in variants:
+            results[name] = render_variant(pipeline, overrides,
+                                           os.path.join(output_dir, name),
+                                           clobber)
+        return results
+    global _pipeline
+    if _forks():
+        # The workers inherit the pipeline when they are forked.
+        _pipeline = pipeline
+        function, args = _render, ()
+    else:
+        function, args = render_variant, (pipeline,)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as pool:
+            futures = [pool.submit(function, *(args + (
+                overrides, os.path.join(output_dir, name), clobber)))
+                       for name, overrides in variants]
+            for (name, _), future in zip(variants, futures):
+                results[name] = future.result()
+    finally:
+        _pipeline = None
+    return results
+
+_pipeline = None
+
+def _forks():
+    # Whether the worker processes of a pool are forked.
+    try:
+        return multiprocessing.get_start_method() == 'fork'
+    except AttributeError:
+        return sys.platform != 'win32'
+
+def _render(overrides, directory, clobber):
+    return render_variant(_pipeline, overrides, directory, clobber)
+
+def _load_pipeline(path, attribute='pipeline'):
+    # A pipeline xml file, or a python script that builds a pipeline
+    # and leaves it in a global variable.
+    if path.endswith('.xml'):
+        from .workflow_engine import Pipeline
+        return Pipeline.from_xml(path)
+    namespace = runpy.run_path(path, run_name='__variants__')
+    try:
+        return namespace[attribute]
+    except KeyError:
+        raise RuntimeError('%s does not define %s' % (path, attribute))
+
+def _parse_assignment(arg):
+    name, sep, value = arg.partition('=')
+    if not sep or not name:
+        raise argparse.ArgumentTypeError('expected NAME=VALUE, got ' + arg)
+    return name, value
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write the xml, workflow module and job scripts of a '
+        'pipeline for each of a set of variable overrides.')
+    parser.add_argument('definition',
+                        help='pipeline xml file, or python script that '
+                        'builds the pipeline')
+    parser.add_argument('--attribute', default='pipeline',
+                        help='name of the pipeline in the script')
+    parser.add_argument('--variants', default=None,
+                        help='json file of overrides, matrix and variants')
+    parser.add_argument('--set', dest='overrides', action='append',
+                        type=_parse_assignment, default=[],
+                        metavar='NAME=VALUE',
+                        help='override for all variants')
+    parser.add_argument('--matrix', action='append', type=_parse_assignment,
+                        default=[], metavar='NAME=VALUE1,VALUE2,...',
+                        help='values to generate variants for')
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help='directory for the variant subdirectories')
+    parser.add_argument('-j', '--max-workers', type=int, default=None,
+                        help='number of worker processes')
+    parser.add_argument('--clobber', action='store_true', default=False,
+                        help='overwrite existing modules and scripts')
+    args = parser.parse_args(argv)
+
+    t0 = time.time()
+    spec = OrderedDict()
+    if args.variants is not None:
+        spec = _read_spec(args.variants)
+    overrides = OrderedDict(spec.get('overrides', ()))
+    overrides.update(args.overrides)
+    matrix = OrderedDict(spec.get('matrix', ()))
+    matrix.update((name, value.split(',')) for name, value in args.matrix)
+    variants = variant_matrix(overrides, matrix, spec.get('variants'))
+    pipeline = _load_pipeline(args.definition, args.attribute)
+    results = write_variants(pipeline, variants, args.output_dir,
+                             max_workers=args.max_workers,
+                             clobber=args.clobber)
+    for name, files in results.items():
+        print('%s: %i files in %s'
+              % (name, len(files), os.path.join(args.output_dir, name)))
+    print('%i variants in %.2f s' % (len(results), time.time() - t0))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,21 @@
 from __future__ import print_function, absolute_import
+import io
+import keyword
+import operator
 import os
+import re
 from collections import OrderedDict
-from xml.dom import minidom
+from .analysis import ScheduleAnalysis
+from .diff import diff_pipelines
+from .expressions import SiteConfiguration
+from .graph import ProcessGraph
+from .sharding import shard_pipeline
+from .incremental import incremental_build
+from .substreams import SubstreamTable
+from .tracing import no_phase
+from .validation import pipeline_problems
+from .variables import Variables
+from .xml_writer import XmlStreamWriter
 
 __all__ = ['Pipeline', 'Task', 'MainTask', 'Process', 'package_data_path']
 
@@ -9,57 +23,316 @@ class Pipeline(object):
     def __init__(self, name, version, pipeline_header=None):
         self.main_task = MainTask(name, version)
         self._read_pipeline_header(pipeline_header)
+        # (launcher process name, next shard name) for a shard made by
+        # shard().
+        self.next_shard = None
+        # A Trace that records the time spent generating the pipeline.
+        self.trace = None
 
-    def toxml(self, encoding='UTF-8', newl='', indent=4*' '):
-        doc = minidom.parseString(str(self))
-        return doc.toprettyxml(encoding=encoding, newl=newl, indent=indent)
+    def toxml(self, encoding='UTF-8', newl='', indent=4*' ', site=None):
+        if encoding:
+            output = io.BytesIO()
+        else:
+            output = io.StringIO()
+        self.write_xml(output, encoding=encoding, newl=newl, indent=indent,
+                       site=site)
+        return output.getvalue()
+
+    def write_xml(self, fileobj, encoding='UTF-8', newl='', indent=4*' ',
+                  site=None):
+        """
+        Write the pretty-printed pipeline xml to fileobj, which must
+        be opened in binary mode if an encoding is given.  The output
+        is identical to that of the running python's
+        minidom.parseString(str(self)).toprettyxml(...), including
+        its attribute order, but is streamed without building the
+        intermediate string or DOM.
+
+        If site is given, either a site name or a SiteConfiguration,
+        the ${...} expressions in the task variables, job attributes
+        and process sites are replaced by their values at that site,
+        where they can be evaluated locally.
+        """
+        with self._phase('serialize'):
+            if site is not None and not isinstance(site, SiteConfiguration):
+                site = SiteConfiguration(self.main_task, site)
+            writer = XmlStreamWriter(fileobj, encoding=encoding, newl=newl,
+                                     indent=indent)
+            writer.start_document()
+            writer.open_document(self.header, 'pipeline')
+            writer.text('\n')
+            self.main_task._write_xml(writer, site)
+            writer.text('\n')
+            writer.end('pipeline')
+            writer.close()
+
+    def reduce_dependencies(self):
+        """
+        Remove the process requirements that are implied by other
+        requirements, which leaves the order of execution unchanged.
+        Returns the number of <after> dependencies removed.
+        """
+        num_removed = 0
+        with self._phase('build'):
+            reduced = ProcessGraph(self.main_task).reduced_requirements()
+            for process, requirements in reduced.items():
+                num_removed += len(process.requirements) - len(requirements)
+                process.requirements = requirements
+        return num_removed
+
+    def fuse_job_chains(self):
+        """
+        Replace each linear chain of job processes within a task (see
+        ProcessGraph.job_chains) by a single job process, so that the
+        chain pays for one batch submission and one environment setup.
+        The fused process takes the place of the chain's first member,
+        inherits its requirements and site, and is required in place
+        of its last member.  Its script, written by
+        write_process_scripts, runs the member scripts in order, so its
+        maxCPU limit is the sum of theirs.  Returns the fused
+        processes.
 
-    def write_python_module(self, clobber=False):
+        Redundant requirements can hide chains, so it is best to call
+        reduce_dependencies first.
+        """
+        with self._phase('build'):
+            return self._fuse_job_chains()
+
+    def _fuse_job_chains(self):
+        graph = ProcessGraph(self.main_task)
+        fused_processes = []
+        for chain in graph.job_chains():
+            task = graph.tasks[chain[0]]
+            fused = Process(self._fused_name(task, chain[0]))
+            fused.site = chain[0].site
+            fused.job = self._fused_job_line(chain)
+            fused.notation = 'Fused job chain: ' \
+                + ' -> '.join(process.name for process in chain)
+            fused.requirements = list(chain[0].requirements)
+            fused.owner_task = chain[0].owner_task
+            fused.fused = chain
+            # The members need not be adjacent in the task's processes.
+            members = set(id(process) for process in chain[1:])
+            task.processes[:] = [fused if process is chain[0] else process
+                                 for process in task.processes
+                                 if id(process) not in members]
+            for process in graph.downstream[chain[-1]]:
+                process.requirements = [fused if x is chain[-1] else x
+                                        for x in process.requirements]
+            fused_processes.append(fused)
+        return fused_processes
+
+    @staticmethod
+    def _fused_job_line(chain):
+        terms = []
+        for job_type, varname in (('std', 'MAXCPU'), ('long', 'MAXCPULONG')):
+            count = sum(1 for process in chain if process.job_type == job_type)
+            if count:
+                terms.append(varname if count == 1
+                             else '%i*%s' % (count, varname))
+        return job_line['std'].replace('${MAXCPU}',
+                                       '${%s}' % ' + '.join(terms))
+
+    @staticmethod
+    def _fused_name(task, head):
+        names = set(process.name for process in task.processes)
+        name = 'fused_' + head.name
+        i = 0
+        while len(name) > 30 or name in names:
+            name = 'fused_%i' % i
+            i += 1
+        return name
+
+    def analyze_schedule(self, runtimes=None, fanout=None):
+        """
+        Critical path, start times and slack of the processes given
+        per-process runtime estimates and per-subtask fan-out counts.
+        See ScheduleAnalysis.
+        """
+        return ScheduleAnalysis(self, runtimes=runtimes, fanout=fanout)
+
+    def write_python_module(self, clobber=False, substream_tables=False,
+                            directory=None):
+        """
+        Write the workflow module to directory, by default the current
+        directory.  If substream_tables is True, the stream launching
+        functions read the pipeline variables of each substream from a
+        SubstreamTable next to the module (see write_substream_table)
+        instead of the <subtask>_jobs lists.
+        """
         script_name = self.get_module_name()
+        if directory is not None:
+            script_name = os.path.join(directory, script_name)
         if os.path.isfile(script_name) and not clobber:
             return
-        with open(script_name, 'w') as output:
-            # Extract parent and child process names for parallelized
-            # tasks.
-            subtask_names = []
-            for process in self.main_task.processes:
-                if process.subtasks:
-                    for subtask in process.subtasks:
-                        subtask_names.append((process.name, subtask.name))
-                        for subprocess in subtask.processes:
-                            if subprocess.job is None:
-                                self._write_function(output, subprocess.name)
-                elif process.job is None:
-                    self._write_function(output, process.name)
+        with self._phase('write module'), open(script_name, 'w') as output:
+            self._write_module(output, substream_tables=substream_tables)
+
+    def write_substream_table(self, subtask_name, rows, names=None):
+        """
+        Write the substream table for a subtask to the current
+        directory.  See SubstreamTable.write.
+        """
+        with self._phase('write scripts'):
+            return SubstreamTable.write(
+                self.substream_table_name(subtask_name), rows, names=names)
+
+    @staticmethod
+    def substream_table_name(subtask_name):
+        return '%s_streams.txt' % subtask_name
+
+    def _write_module(self, output, substream_tables=False):
+        # Extract parent and child process names for parallelized
+        # tasks.
+        subtasks = []
+        for process in self.main_task.processes:
+            if process.subtasks:
+                for subtask in process.subtasks:
+                    subtasks.append((process.name, subtask))
+                    for subprocess in subtask.processes:
+                        if subprocess.job is None:
+                            self._write_function(output, subprocess.name)
+            elif process.job is None and (self.next_shard is None or
+                                          process.name != self.next_shard[0]):
+                self._write_function(output, process.name)
+        if not substream_tables:
             # Write boilerplate empty lists of parallelizeable tasks.
-            for outer_process, subtask_name in subtask_names:
-                self._write_job_list(output, subtask_name)
-            # Write stream launching functions.
-            for outer_process, subtask_name in subtask_names:
+            for outer_process, subtask in subtasks:
+                self._write_job_list(output, subtask.name)
+        if substream_tables or any(subtask.launch_options
+                                   for _, subtask in subtasks):
+            self._write_launch_helpers(output)
+        # Write stream launching functions.
+        for outer_process, subtask in subtasks:
+            if substream_tables or subtask.launch_options:
+                self._write_substream_launcher(output, outer_process,
+                                               subtask, substream_tables)
+            else:
                 self._write_stream_launching_function(output, outer_process,
-                                                      subtask_name)
+                                                      subtask.name)
+        if self.next_shard is not None:
+            self._write_shard_launcher(output, *self.next_shard)
+
+    def write_incremental(self, xml_file,
+                          manifest_file='workflow_manifest.json',
+                          clobber=False, substream_tables=False):
+        """
+        Write the pipeline xml to xml_file, and the workflow module and
+        job scripts to the current directory, rewriting only the files
+        whose content has changed since the build recorded in
+        manifest_file.  substream_tables is as for
+        write_python_module.  Returns a BuildReport that lists the
+        files written and the processes that changed.
+        """
+        return incremental_build(self, xml_file, manifest_file,
+                                 clobber=clobber,
+                                 substream_tables=substream_tables)
+
+    def diff(self, other):
+        """
+        The structural changes from this pipeline to other, e.g., a
+        newer version of it, as a PipelineDiff.
+        """
+        return diff_pipelines(self, other)
+
+    def shard(self, max_processes=None, max_bytes=None):
+        """
+        Split the pipeline into a chain of pipelines that each have at
+        most max_processes processes and about max_bytes bytes of xml.
+        See shard_pipeline.
+        """
+        with self._phase('build'):
+            return shard_pipeline(self, max_processes=max_processes,
+                                  max_bytes=max_bytes)
+
+    def validate(self):
+        """
+        Check the pipeline for problems that the Pipeline-II server
+        would reject, and raise a RuntimeError that lists all of them.
+        See pipeline_problems.
+        """
+        with self._phase('validate'):
+            problems = pipeline_problems(self.main_task)
+        if problems:
+            raise RuntimeError('Invalid pipeline:\n    '
+                               + '\n    '.join(problems))
 
     def write_process_scripts(self, clobber=False):
         num_scripts = 0
+        with self._phase('write scripts'):
+            for process, script_name, content in self.process_scripts():
+                self._create_process_script(script_name, content, clobber)
+                num_scripts += 1
+        return num_scripts
+
+    def write_batch_script(self, clobber=False):
+        """
+        Write the batch script that runs the job processes, named by
+        BATCH_NAME, to the current directory, and return its name.
+        If ENV_SNAPSHOT_DIR is set in the job environment, e.g., as a
+        pipeline variable, the jobs save a snapshot of the DM setup
+        there on first use and restore it instead of repeating the
+        setup; running the script with --capture-env (and the job
+        environment) refreshes the snapshot, e.g., after a stack
+        update.
+        """
+        script_name = self.main_task.get_variable('BATCH_NAME')
+        if os.path.isfile(script_name) and not clobber:
+            return script_name
+        with self._phase('write scripts'), \
+                open(package_data_path('batch_script.sh')) as input_:
+            self._create_process_script(script_name, input_.read(), True)
+        os.chmod(script_name, 0o755)
+        return script_name
+
+    def _phase(self, name):
+        if self.trace is None:
+            return no_phase
+        return self.trace.phase(name)
+
+    def process_scripts(self):
+        """
+        Generate (process, script name, script content) for each
+        script run by a job process.
+        """
         for process in self.main_task.processes:
             if process.subtasks:
                 for subtask in process.subtasks:
                     for subprocess in subtask.processes:
                         if subprocess.job is not None:
-                            self._create_process_script(subprocess.name,
-                                                        clobber)
-                            num_scripts += 1
+                            for item in self._job_scripts(subprocess):
+                                yield item
             elif process.job is not None:
-                self._create_process_script(process.name, clobber)
-                num_scripts += 1
-        return num_scripts
+                for item in self._job_scripts(process):
+                    yield item
+
+    def _job_scripts(self, process):
+        if not process.fused:
+            yield process, process.name, self._script_stub(process.name)
+            return
+        for member in process.fused:
+            yield process, member.name, self._script_stub(member.name)
+        yield process, process.name, self._chain_script(process.fused)
+
+    @staticmethod
+    def _script_stub(process_name):
+        return 'echo "Running %s."\n' % process_name
 
     @staticmethod
-    def _create_process_script(process_name, clobber):
-        if os.path.isfile(process_name) and not clobber:
+    def _chain_script(chain):
+        lines = ['# Run the scripts of a fused job chain in order.']
+        for process in chain:
+            lines.append('(export PIPELINE_PROCESS=%s; '
+                         'source ${SCRIPT_LOCATION}/%s)'
+                         % (process.name, process.name))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _create_process_script(script_name, content, clobber):
+        if os.path.isfile(script_name) and not clobber:
             return
-        with open(process_name, 'w') as output:
-            output.write('echo "Running %s."\n' % process_name)
+        with open(script_name, 'w') as output:
+            output.write(content)
 
     @staticmethod
     def _write_function(output, process_name):
@@ -81,12 +354,152 @@ def %(setup_process_name)s():
         pipeline.createSubstream("%(subtask_name)s", i, job.pipeline_vars)
 """ % locals())
 
+    def _write_shard_launcher(self, output, launcher_name, shard_name):
+        # The next shard's stream is given this stream's values of the
+        # variables that it overrides.  Only variables with plain
+        # values are compared: ${...} expressions are evaluated again
+        # in the new stream, and SCRIPT_NAME differs between shards.
+        defaults = [(name, value) for name, value
+                    in self.main_task.variables.items()
+                    if '${' not in value and name != 'SCRIPT_NAME']
+        output.write("""
+def %(launcher_name)s():
+    pipeline_vars = []
+    for name, default in %(defaults)r:
+        value = str(globals().get(name, default))
+        if value != default:
+            if "," in value:
+                raise RuntimeError("cannot pass %%s=%%s to %(shard_name)s"
+                                   %% (name, value))
+            pipeline_vars.append("%%s=%%s" %% (name, value))
+    pipeline.createStream("%(shard_name)s", -1, ",".join(pipeline_vars))
+""" % locals())
+
+    def _write_substream_launcher(self, output, setup_process_name,
+                                  subtask, substream_tables):
+        options = subtask.launch_options or {}
+        if substream_tables:
+            streams = '_table_streams("%%s/%s" %% SLAC_SCRIPT_LOCATION)' \
+                % self.substream_table_name(subtask.name)
+        else:
+            streams = '_job_list_streams(%s_jobs)' % subtask.name
+        if options.get('resume'):
+            progress_file = '_progress_file("%s")' % subtask.name
+        else:
+            progress_file = None
+        output.write("""
+def %s():
+    _launch_substreams("%s", %s,
+                       batch_size=%r, interval=%r,
+                       progress_file=%s)
+""" % (setup_process_name, subtask.name, streams, options.get('batch_size'),
+       options.get('batch_interval', 0), progress_file))
+
+    @staticmethod
+    def _write_launch_helpers(output):
+        # The module runs under Jython on the pipeline server, so these
+        # stick to the language and library of Python 2.5.
+        output.write("""
+def _job_list_streams(jobs):
+    for i, job in enumerate(jobs):
+        yield i, job.pipeline_vars
+
+def _table_streams(filename):
+    table = open(filename)
+    try:
+        names = table.readline().rstrip().split(",")
+        i = 0
+        for line in table:
+            values = line.rstrip().split(",")
+            yield i, ",".join(["%s=%s" % item for item in zip(names, values)])
+            i += 1
+    finally:
+        table.close()
+
+def _progress_file(subtask):
+    # The launch progress of subtask in the current stream, kept under
+    # the output data directory and keyed on the stream path, so that
+    # concurrent streams each resume from their own.
+    import os
+    try:
+        stream = PIPELINE_STREAMPATH
+    except NameError:
+        stream = pipeline.getStream()
+    directory = os.path.join(SLAC_OUTPUT_DATA_DIR, "launch_progress")
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Another stream made it first.
+            if not os.path.isdir(directory):
+                raise
+    return os.path.join(directory, "%s_%s.txt" % (subtask, stream))
+
+def _launch_substreams(subtask, streams, batch_size=None, interval=0,
+                       progress_file=None):
+    # Launch the substreams batch_size at a time, pausing for interval
+    # seconds between batches.  The index of the next substream is
+    # kept in progress_file, so that a retry resumes where the last
+    # attempt stopped.  The file is removed once all are launched.
+    import os, time
+    start = 0
+    progress = None
+    if progress_file is not None:
+        if os.path.isfile(progress_file):
+            progress = open(progress_file, "r+")
+            start = int(progress.read().strip() or 0)
+        else:
+            progress = open(progress_file, "w")
+    try:
+        launched = 0
+        for i, pipeline_vars in streams:
+            if i < start:
+                continue
+            if batch_size and launched and launched % batch_size == 0:
+                time.sleep(interval)
+            pipeline.createSubstream(subtask, i, pipeline_vars)
+            launched += 1
+            if progress is not None:
+                progress.seek(0)
+                progress.write("%12i" % (i + 1))
+                progress.flush()
+    finally:
+        if progress is not None:
+            progress.close()
+    if progress is not None:
+        os.remove(progress_file)
+""")
+
     def get_module_name(self):
-        doc = minidom.parseString(str(self))
-        vars = doc.getElementsByTagName('var')
-        for var in vars:
-            if var.getAttribute('name') == 'SCRIPT_NAME':
-                return var.firstChild.nodeValue
+        """
+        The SCRIPT_NAME variable of the main task, or failing that of
+        the first subtask that defines it.  The lookup takes constant
+        time when the main task defines it, as it usually does;
+        otherwise the subtasks are searched in order.
+        """
+        if 'SCRIPT_NAME' in self.main_task.variables:
+            return self.main_task.get_variable('SCRIPT_NAME')
+        for process in self.main_task.processes:
+            for subtask in process.subtasks:
+                if 'SCRIPT_NAME' in subtask.variables:
+                    return subtask.get_variable('SCRIPT_NAME')
+
+    @classmethod
+    def from_xml(cls, source, trace=None):
+        """
+        Rebuild a pipeline from its xml, a file name or a file object,
+        e.g., one written by write_xml, so that it can be modified,
+        analyzed or run locally.  Writing the result reproduces the
+        original xml.  If trace is given, the reading is recorded as a
+        build phase, and the trace is set as the pipeline's.
+        """
+        from .xml_reader import read_pipeline
+        if trace is None:
+            return read_pipeline(source, cls)
+        with trace.phase('build'):
+            pipeline = read_pipeline(source, cls)
+        pipeline.trace = trace
+        return pipeline
 
     def _read_pipeline_header(self, pipeline_header):
         if pipeline_header is None:
@@ -95,46 +508,161 @@ def %(setup_process_name)s():
             self.header = ''.join(input_.readlines()).strip()
 
     def __str__(self):
-        lines = [self.header, str(self.main_task), '</pipeline>']
-        return '\n'.join(lines)
+        with self._phase('serialize'):
+            lines = [self.header, str(self.main_task), '</pipeline>']
+            return '\n'.join(lines)
+
+def _rendered(slot, renames=False):
+    """
+    A property for a field of a Process or Task that is kept in slot
+    and rendered by __str__.  Setting it clears the cached fragments
+    that include it; if renames is True, the field is part of the name
+    by which other processes refer to the node, and the fragments of
+    those processes are cleared as well.
+    """
+    def set_field(self, value):
+        if renames and getattr(self, slot) != value:
+            self._renamed()
+        setattr(self, slot, value)
+        self._invalidate()
+    return property(operator.attrgetter(slot), set_field)
 
 class Task(object):
+    __slots__ = ('_name', '_type', '_version', 'notation', 'outer_process',
+                 '_variables', '_processes', 'launch_options', '_str')
+
     def __init__(self, name, version=None):
         check_name(name)
-        self.name = name
-        self.version = version
+        # The fields are set through their slots, since nothing has
+        # been rendered yet.
+        self._str = None
+        self._name = name
+        # The Pipeline-II task type, or None to omit it.
+        self._type = 'LSST'
+        self._version = version
         self.notation = None
         self.outer_process = None
-        self.variable_lines = []
-        self.processes = []
+        # Subtasks rarely have variables of their own, so they share an
+        # empty store until set_variables replaces it.  An empty store
+        # cannot be modified, since set_variable only updates existing
+        # variables.
+        self._variables = _no_variables
+        processes = list.__new__(_ProcessList)
+        processes._owner = self
+        self._processes = processes
+        self.launch_options = None
+
+    name = _rendered('_name', renames=True)
+    type = _rendered('_type')
+    version = _rendered('_version')
+
+    def __getstate__(self):
+        # The slots are listed explicitly, since pickle protocols
+        # before 2 ignore those of a subclass with empty __slots__.
+        # The cached fragment is rendered again rather than pickled,
+        # and the shared empty variable store stays shared.
+        state = dict((name, getattr(self, name)) for name in Task.__slots__
+                     if name != '_str')
+        if self._variables is _no_variables:
+            state['_variables'] = None
+        return state
+
+    def __setstate__(self, state):
+        self._str = None
+        for name, value in state.items():
+            setattr(self, name, value)
+        if self._variables is None:
+            self._variables = _no_variables
+
+    @property
+    def variables(self):
+        """The Variables store of the task."""
+        return self._variables
+
+    @variables.setter
+    def variables(self, variables):
+        if variables is not _no_variables:
+            variables._owner = self
+        self._variables = variables
+        self._invalidate()
+
+    @property
+    def processes(self):
+        return self._processes
+
+    @processes.setter
+    def processes(self, processes):
+        self._processes = _ProcessList(self, processes)
+        self._invalidate()
 
     def set_variables(self, varfile=None):
         if varfile is None:
             varfile = package_data_path('main_task_variables.txt')
-        with open(varfile) as input_:
-            self.variable_lines = [x.strip() for x in input_]
+        self.variables = Variables.read(varfile)
+
+    @property
+    def variable_lines(self):
+        """
+        The lines of the variable block, which can be modified in place
+        (see Variables.lines).
+        """
+        if self.variables is _no_variables:
+            # The task gets a store of its own if the lines are added to.
+            return Variables(owner=self).lines
+        return self.variables.lines
+
+    @variable_lines.setter
+    def variable_lines(self, lines):
+        self.variables = Variables(lines)
+
+    def _variables_changed(self, variables):
+        if self.variables is variables:
+            self._invalidate()
+        elif self.variables is _no_variables:
+            # The lines of a store made by variable_lines were added to.
+            self.variables = variables
+
+    def _invalidate(self):
+        # Clear the cached fragments of the task and of the main task.
+        if self._str is not None:
+            self._str = None
+            outer_process = self.outer_process
+            if outer_process is not None \
+                    and outer_process._parent is not None:
+                outer_process._parent._invalidate()
+
+    def _renamed(self):
+        # The outer process lists the task by name, and processes of
+        # the task are required by qualified name.
+        if self.outer_process is not None:
+            self.outer_process._invalidate()
+        _invalidate_dependents(self, [process for process in self.processes
+                                      if process.owner_task is self])
 
     def get_variable(self, varname):
-        line = self.variable_lines[self._get_variable_line_index(varname)]
-        return line.split('>')[1].split('<')[0]
+        return self.variables[varname]
 
     def set_variable(self, varname, value):
-        index = self._get_variable_line_index(varname)
-        self.variable_lines[index] =\
-            '<var name="%s">%s</var>' % (varname, value)
-
-    def _get_variable_line_index(self, varname):
-        for i, line in enumerate(self.variable_lines):
-            if line.startswith('<var name="%s"' % varname):
-                return i
-        raise RuntimeError("variable %s not found" % varname)
+        self.variables[varname] = value
 
     def add_process(self, process):
-        self.processes.append(process)
-        if process.owner_task is not None:
+        if process._owner_task is not None:
             raise RuntimeError("Cannot assign a process to more than one task")
-        if self.version is None:
-            process.owner_task = self
+        if self._version is None:
+            if process._parent is None:
+                # Only the processes that have rendered this one's name
+                # while it was in no task can refer to it.
+                process._owner_task = self
+                process._str = None
+                if process._dependents is not None:
+                    process._invalidate_loose_dependents()
+            else:
+                process.owner_task = self
+        # _ProcessList.append, inlined.
+        if self._str is not None:
+            self._invalidate()
+        list.append(self._processes, process)
+        process._parent = self
 
     def create_process(self, process_name, job_type='std', requirements=[]):
         process = Process(process_name)
@@ -145,7 +673,19 @@ class Task(object):
         return process
 
     def create_parallel_process(self, process_name, job_type='std',
-                                requirements=[]):
+                                requirements=[], batch_size=None,
+                                batch_interval=0, max_in_flight=None,
+                                resume=False):
+        """
+        Create a setup process that launches the substreams of a new
+        subtask with one process, process_name.  The remaining options
+        control the launching, and are kept in the subtask's
+        launch_options: substreams are created batch_size at a time,
+        batch_interval seconds apart; no more than max_in_flight of
+        them run at once under LocalExecutor; and if resume is True, a
+        retried setup process skips the substreams already launched,
+        as recorded for its stream under SLAC_OUTPUT_DATA_DIR.
+        """
         if job_type not in ('std', 'long'):
             raise RuntimeError\
                 ("job_type for a parallel process must be 'long' or 'std'")
@@ -154,113 +694,340 @@ class Task(object):
         for process in requirements:
             outer_process.requires(process)
         subtask = Task(process_name + 'sTask')
+        if batch_size or max_in_flight or resume:
+            subtask.launch_options = dict(batch_size=batch_size,
+                                          batch_interval=batch_interval,
+                                          max_in_flight=max_in_flight,
+                                          resume=resume)
         outer_process.add_subtask(subtask)
         inner_process = Process(process_name)
         inner_process.job = job_line[job_type]
         subtask.add_process(inner_process)
         return outer_process
 
+    def _header_attributes(self):
+        if self.type is None:
+            return [('name', self.name)]
+        return [('name', self.name), ('type', self.type)]
+
     def _header_lines(self):
-        return ['<task name="%s" type="LSST">' % self.name]
+        return ['<task %s>' % ' '.join('%s="%s"' % item for item
+                                       in self._header_attributes())]
+
+    def _subtasks(self):
+        return []
+
+    def _write_xml(self, writer, site=None):
+        if site is None:
+            variable_lines = self.variables.lines
+            resolver = None
+        else:
+            variable_lines = site.variable_lines(self)
+            resolver = site.resolver(self)
+        writer.start('task', self._header_attributes())
+        if variable_lines:
+            writer.text('\n')
+            writer.markup('\n'.join(variable_lines))
+        for process in self.processes:
+            writer.text('\n')
+            process._write_xml(writer, resolver)
+        for subtask in self._subtasks():
+            writer.text('\n')
+            subtask._write_xml(writer, site)
+        writer.text('\n')
+        writer.end('task')
 
     def __str__(self):
+        if self._str is None:
+            self._str = self._render()
+        return self._str
+
+    def _render(self):
         lines = []
         lines.extend(self._header_lines())
-        lines.extend(self.variable_lines)
+        lines.extend(self.variables.lines)
         lines.extend([str(process) for process in self.processes])
+        lines.extend([str(subtask) for subtask in self._subtasks()])
         lines.append('</task>')
         return '\n'.join(lines)
 
 class MainTask(Task):
+    __slots__ = ()
+
     def __init__(self, name, version):
         super(MainTask, self).__init__(name)
         self.version = version
 
-    def _header_lines(self):
-        return ['<task name="%s" type="LSST" version="%s">'
-                % (self.name, self.version)]
+    def _header_attributes(self):
+        return super(MainTask, self)._header_attributes() \
+            + [('version', self.version)]
 
-    def __str__(self):
-        lines = []
-        lines.extend(self._header_lines())
-        lines.extend(self.variable_lines)
-        lines.extend([str(process) for process in self.processes])
-        for process in self.processes:
-            for subtask in process.subtasks:
-                lines.append(str(subtask))
-        lines.append('</task>')
-        return '\n'.join(lines)
+    def _subtasks(self):
+        return [subtask for process in self.processes
+                for subtask in process._subtasks or ()]
 
 class Process(object):
+    __slots__ = ('_name', '_site', '_notation', '_job', '_script',
+                 '_requirements', '_subtasks', '_owner_task', '_fused',
+                 '_parent', '_str', '_dependents')
+
     def __init__(self, name):
         check_name(name)
-        self.name = name
-        self.notation = None
-        self.job = None
-        self.script = None
-        self.requirements = []
-        self.subtasks = []
-        self.owner_task = None
+        # The fields are set through their slots, which keeps the
+        # invalidation done by the properties off this path.
+        # The task whose processes list holds this process, and the
+        # cached rendering (see __str__).
+        self._parent = None
+        self._str = None
+        # The processes whose cached fragments name this one while it
+        # is in no task, where _invalidate_dependents cannot find them.
+        self._dependents = None
+        self._name = name
+        self._site = '${JOBSITE}'
+        self._notation = None
+        self._job = None
+        self._script = None
+        # list.__new__ skips _TrackedList.__init__.
+        requirements = list.__new__(_TrackedList)
+        requirements._owner = self
+        self._requirements = requirements
+        # Most processes have neither subtasks nor fused members, so
+        # these lists are only created when they are added to.
+        self._subtasks = None
+        self._owner_task = None
+        self._fused = None
+
+    name = _rendered('_name', renames=True)
+    site = _rendered('_site')
+    notation = _rendered('_notation')
+    script = _rendered('_script')
+    owner_task = _rendered('_owner_task', renames=True)
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in Process.__slots__
+                    if name not in ('_str', '_dependents'))
+
+    def __setstate__(self, state):
+        self._str = None
+        self._dependents = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @property
+    def job(self):
+        return self._job
+
+    @job.setter
+    def job(self, job):
+        # Job lines equal to a standard one share its string.
+        self._job = _job_lines.get(job, job)
+        if self._str is not None:
+            self._invalidate()
+
+    @property
+    def requirements(self):
+        return self._requirements
+
+    @requirements.setter
+    def requirements(self, requirements):
+        self._requirements = _TrackedList(self, requirements)
+        self._invalidate()
+
+    @property
+    def subtasks(self):
+        """The subtasks created by this process."""
+        if self._subtasks is None:
+            return _PendingList(self, '_subtasks')
+        return self._subtasks
+
+    @subtasks.setter
+    def subtasks(self, subtasks):
+        self._subtasks = _TrackedList(self, subtasks)
+        self._invalidate()
+
+    @property
+    def fused(self):
+        """The processes of a fused job chain (see fuse_job_chains)."""
+        if self._fused is None:
+            return _PendingList(self, '_fused')
+        return self._fused
+
+    @fused.setter
+    def fused(self, fused):
+        self._fused = _TrackedList(self, fused)
+        self._invalidate()
+
+    def _invalidate(self):
+        # Clear the cached fragments of the process and of the tasks
+        # that enclose it.
+        if self._str is not None:
+            self._str = None
+            if self._parent is not None:
+                self._parent._invalidate()
+
+    def _renamed(self):
+        # Other processes refer to this one by its name and task.
+        self._invalidate_loose_dependents()
+        if self._parent is not None:
+            _invalidate_dependents(self._parent, [self])
+
+    def _invalidate_loose_dependents(self):
+        dependents = self._dependents
+        if dependents is not None:
+            self._dependents = None
+            for process in dependents:
+                process._invalidate()
 
     def requires(self, process):
-        if not process.subtasks:
-            self.requirements.append(process)
+        if not process._subtasks:
+            if self._str is not None:
+                self._invalidate()
+            list.append(self._requirements, process)
             return
         for subtask in process.subtasks:
             for subprocess in subtask.processes:
                 self.requirements.append(subprocess)
 
+    @property
+    def job_type(self):
+        """The job_line key of the job, or None for a custom job."""
+        return job_types.get(self.job)
+
     def add_subtask(self, task):
-        self.subtasks.append(task)
+        if self._subtasks is None:
+            subtasks = list.__new__(_TrackedList)
+            subtasks._owner = self
+            self._subtasks = subtasks
+        if self._str is not None:
+            self._invalidate()
+        list.append(self._subtasks, task)
         task.outer_process = self
 
+    def _script_body(self):
+        if self.script is not None:
+            return self.script.split('\n')
+        return ['    execfile("%s/%s" % (SLAC_SCRIPT_LOCATION, SCRIPT_NAME))',
+                '    %s()' % self.name]
+
     def _script_lines(self):
         lines = []
         lines.append('<script><![CDATA[')
-        lines.append('    execfile("%s/%s" % (SLAC_SCRIPT_LOCATION, SCRIPT_NAME))')
-        lines.append('    %s()' % self.name)
+        lines.extend(self._script_body())
         lines.append(']]>')
         lines.append('</script>')
         return lines
 
+    def _requirement_names(self):
+        for process in self._requirements:
+            if process._owner_task is not None:
+                yield '.'.join((process._owner_task.name, process._name))
+            else:
+                yield process._name
+
     def _requirements_lines(self):
         lines = []
-        if self.requirements:
+        if self._requirements:
+            for process in self._requirements:
+                if process._parent is None:
+                    if process._dependents is None:
+                        process._dependents = []
+                    process._dependents.append(self)
             lines.append('<depends>')
-            for process in self.requirements:
-                if process.owner_task is not None:
-                    process_name = '.'.join((process.owner_task.name,
-                                             process.name))
-                else:
-                    process_name = process.name
+            for process_name in self._requirement_names():
                 lines.append(('<after process="%s"/>' % process_name))
             lines.append('</depends>')
         return lines
 
     def _subtask_lines(self):
         lines = []
-        if self.subtasks:
+        if self._subtasks:
             lines.append('<createsSubtasks>')
-            for subtask in self.subtasks:
+            for subtask in self._subtasks:
                 lines.append('<subtask>%s</subtask>' % subtask.name)
             lines.append('</createsSubtasks>')
         lines.append('</process>')
         return lines
 
     def __str__(self):
+        """
+        The xml fragment of the process.  It is cached until a field
+        that it depends on changes.
+        """
+        if self._str is None:
+            self._str = self._render()
+        return self._str
+
+    def _attributes(self):
+        # A process read from xml without a site leaves it to the
+        # pipeline server's default.
+        if self.site is None:
+            return [('name', self.name)]
+        return [('name', self.name), ('site', self.site)]
+
+    def _render(self):
         lines = []
-        lines.append('<process name="%s" site="${JOBSITE}">' % self.name)
-        if self.notation is not None:
-            lines.append('<notation>%s</notation>' % (self.notation))
+        if self._site is None:
+            lines.append('<process name="%s">' % self._name)
+        else:
+            lines.append('<process name="%s" site="%s">'
+                         % (self._name, self._site))
+        if self._notation is not None:
+            lines.append('<notation>%s</notation>' % (self._notation))
         # A process comprises only either a job or a script.
-        if self.job is not None:
-            lines.append(self.job)
+        if self._job is not None:
+            lines.append(self._job)
         else:
             lines.extend(self._script_lines())
         lines.extend(self._requirements_lines())
         lines.extend(self._subtask_lines())
         return '\n'.join(lines)
 
+    def _write_xml(self, writer, resolver=None):
+        # Mirrors __str__, one node at a time.  The optional
+        # VariableResolver provides the values of ${...} expressions.
+        attributes = self._attributes()
+        job = self.job
+        if resolver is not None:
+            attributes = [(key, resolver.substitute(value))
+                          for key, value in attributes]
+            if job is not None:
+                job = resolver.substitute(job, markup=True)
+        writer.start('process', attributes)
+        if self.notation is not None:
+            writer.text('\n')
+            writer.start('notation')
+            writer.markup(self.notation)
+            writer.end('notation')
+        writer.text('\n')
+        if job is not None:
+            writer.markup(job)
+        else:
+            writer.start('script')
+            writer.cdata('\n%s\n' % '\n'.join(self._script_body()))
+            writer.text('\n')
+            writer.end('script')
+        if self.requirements:
+            writer.text('\n')
+            writer.start('depends')
+            for process_name in self._requirement_names():
+                writer.text('\n')
+                writer.start('after', (('process', process_name),))
+                writer.end('after')
+            writer.text('\n')
+            writer.end('depends')
+        if self._subtasks:
+            writer.text('\n')
+            writer.start('createsSubtasks')
+            for subtask in self._subtasks:
+                writer.text('\n')
+                writer.start('subtask')
+                writer.text(subtask.name)
+                writer.end('subtask')
+            writer.text('\n')
+            writer.end('createsSubtasks')
+        writer.text('\n')
+        writer.end('process')
+
 def package_data_path(filename):
     return os.path.join(os.environ['WORKFLOW_ENGINE_DIR'], 'data', filename)
 
@@ -268,11 +1035,154 @@ def check_name(name):
     if len(name) > 30:
         raise RuntimeError\
             (name + ': process or task name must be 30 characters or fewer.')
-    try:
-        exec(name + ' = 1')
-    except SyntaxError:
+    if _name_pattern.match(name) is None or name in _keywords:
         raise RuntimeError('Invalid process or task name: ' + name)
 
+def check_names(names):
+    """
+    Check a sequence of names as check_name does, with one regular
+    expression match over all of them.
+    """
+    names = list(names)
+    text = '\n'.join(names) + '\n' if names else ''
+    if _names_pattern.match(text) is None or text.count('\n') != len(names) \
+            or not _keywords.isdisjoint(names):
+        for name in names:
+            check_name(name)
+
+# Process and task names are used as python identifiers in the
+# workflow module.
+_name_pattern = re.compile(r'[A-Za-z_][A-Za-z0-9_]*\Z')
+_names_pattern = re.compile(r'(?:[A-Za-z_][A-Za-z0-9_]{0,29}\n)*\Z')
+# None, True and False are not in kwlist on python 2.
+_keywords = frozenset(keyword.kwlist + ['None', 'True', 'False'])
+
 job_line = dict([('script', None),
                  ('long', '<job maxCPU="${MAXCPULONG}" batchOptions="${BATCH_OPTIONS}" executable="${SCRIPT_LOCATION}/${BATCH_NAME}"/>'),
                  ('std', '<job maxCPU="${MAXCPU}" batchOptions="${BATCH_OPTIONS}" executable="${SCRIPT_LOCATION}/${BATCH_NAME}"/>')])
+job_types = dict((value, key) for key, value in job_line.items())
+_job_lines = dict((value, value) for value in job_line.values())
+
+class _SharedVariables(Variables):
+    """The empty variable store shared by tasks without variables."""
+    def _lines_changed(self):
+        list.__delitem__(self._lines, slice(None))
+        raise RuntimeError('The empty variable store is shared by tasks; '
+                           'modify Task.variable_lines instead.')
+
+_no_variables = _SharedVariables()
+
+def _invalidate_dependents(task, processes):
+    """
+    Clear the cached fragments of the processes that require any of
+    processes, in the pipeline that contains task.  The requirements
+    are not indexed, which would slow down construction, so this scans
+    the pipeline's processes; renames are rare.
+    """
+    while task.outer_process is not None \
+            and task.outer_process._parent is not None:
+        task = task.outer_process._parent
+    processes = set(processes)
+    if not processes:
+        return
+    tasks = [task]
+    for task in tasks:
+        for process in task._processes:
+            if not processes.isdisjoint(process._requirements):
+                process._invalidate()
+            if process._subtasks:
+                tasks.extend(process._subtasks)
+
+class _TrackedList(list):
+    """
+    A list of requirements, subtasks or processes that invalidates the
+    cached rendering of its owner when it is modified.
+    """
+    __slots__ = ('_owner',)
+
+    def __init__(self, owner=None, items=()):
+        list.__init__(self, items)
+        self._owner = owner
+
+    def __reduce__(self):
+        return _TrackedList, (self._owner, list(self))
+
+    def _changed(self):
+        self._owner._invalidate()
+
+    def append(self, item):
+        # The common case, inlined: the owner has not been rendered.
+        if self._owner._str is not None:
+            self._changed()
+        list.append(self, item)
+
+def _tracked(method):
+    def mutator(self, *args, **kwds):
+        self._changed()
+        return method(self, *args, **kwds)
+    mutator.__name__ = method.__name__
+    return mutator
+
+for _name in ('extend', 'insert', 'remove', 'pop', 'clear', 'sort',
+              'reverse', '__setitem__', '__delitem__', '__iadd__',
+              '__imul__'):
+    if hasattr(list, _name):
+        setattr(_TrackedList, _name, _tracked(getattr(list, _name)))
+
+class _PendingList(_TrackedList):
+    """
+    The empty subtask or fused process list of a process that has
+    none, which becomes the process's own list when it is modified.
+    """
+    __slots__ = ('_slot',)
+
+    def __init__(self, owner, slot):
+        _TrackedList.__init__(self, owner)
+        self._slot = slot
+
+    def _changed(self):
+        if getattr(self._owner, self._slot) is None:
+            setattr(self._owner, self._slot, self)
+        self._owner._invalidate()
+
+    append = _tracked(list.append)
+
+class _ProcessList(_TrackedList):
+    """The processes of a task, which are linked back to the task."""
+    __slots__ = ()
+
+    def __init__(self, owner, items=()):
+        _TrackedList.__init__(self, owner, items)
+        self._adopt(self)
+
+    def __reduce__(self):
+        return _ProcessList, (self._owner, list(self))
+
+    def _adopt(self, processes):
+        for process in processes:
+            process._parent = self._owner
+        return processes
+
+    def append(self, process):
+        owner = self._owner
+        if owner._str is not None:
+            owner._invalidate()
+        list.append(self, process)
+        process._parent = owner
+
+    def insert(self, index, process):
+        _TrackedList.insert(self, index, process)
+        process._parent = self._owner
+
+    def extend(self, processes):
+        _TrackedList.extend(self, self._adopt(list(processes)))
+
+    def __iadd__(self, processes):
+        return _TrackedList.__iadd__(self, self._adopt(list(processes)))
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = self._adopt(list(value))
+        else:
+            value._parent = self._owner
+        _TrackedList.__setitem__(self, index, value)
@@ -0,0 +1,289 @@
+"""
+Streaming reader that rebuilds a Pipeline from Pipeline-II xml.
+"""
+from __future__ import print_function, absolute_import
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+from .workflow_engine import Process, Task, job_line
+
+__all__ = ['read_pipeline']
+
+def read_pipeline(source, pipeline_class):
+    """
+    Read the pipeline xml in source, a file name or a file object, and
+    return an instance of pipeline_class.  The document is parsed as a
+    stream, and each process element is discarded once it has been
+    converted, so no DOM of the whole document is built.  Elements
+    and attributes that Pipeline has no field for raise RuntimeError
+    rather than being dropped; the content of job and variable
+    elements is kept verbatim.
+    """
+    return _PipelineReader(pipeline_class).read(source)
+
+class _PipelineReader(object):
+    def __init__(self, pipeline_class):
+        self.pipeline_class = pipeline_class
+        self.pipeline = None
+        self.namespaces = []
+        self.prefixes = {}
+        self.header = None
+        self.task_stack = []
+        # The local names of the open elements.
+        self.path = []
+        self.tasks = {}
+        self.processes = {}
+        self.requirements = []
+        self.subtask_names = []
+        # Equal job lines of the document share one string.
+        self.job_lines = {}
+
+    def read(self, source):
+        if hasattr(source, 'read'):
+            self._parse(source)
+        else:
+            with open(source, 'rb') as input_:
+                self._parse(input_)
+        if self.pipeline is None:
+            raise RuntimeError('no task found in pipeline xml')
+        self._link()
+        return self.pipeline
+
+    def _parse(self, input_, chunk_size=1 << 16):
+        # expat is driven directly, rather than through iterparse, so
+        # that comments are kept on every python version.
+        builder = ET.TreeBuilder()
+        parser = xml.parsers.expat.ParserCreate(namespace_separator='}')
+        parser.buffer_text = True
+        parser.ordered_attributes = True
+
+        def start_element(name, attrs):
+            attrib = OrderedDict((_expat_name(key), value) for key, value
+                                 in zip(attrs[::2], attrs[1::2]))
+            self._start(builder.start(_expat_name(name), attrib))
+
+        def comment(data):
+            builder.start(ET.Comment, {})
+            builder.data(data)
+            builder.end(ET.Comment)
+
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler \
+            = lambda name: self._end(builder.end(_expat_name(name)))
+        parser.CharacterDataHandler = builder.data
+        parser.CommentHandler = comment
+        parser.StartNamespaceDeclHandler = self._start_namespace
+        try:
+            while True:
+                chunk = input_.read(chunk_size)
+                if not chunk:
+                    break
+                parser.Parse(chunk, False)
+            parser.Parse(b'', True)
+        except xml.parsers.expat.ExpatError as error:
+            # Raise what ElementTree would for malformed xml.
+            parse_error = ET.ParseError(str(error))
+            parse_error.code = error.code
+            parse_error.position = (error.lineno, error.offset)
+            raise parse_error
+
+    def _start_namespace(self, prefix, uri):
+        self.namespaces.append((prefix or '', uri))
+        self.prefixes[uri] = prefix or ''
+
+    def _start(self, element):
+        tag = _local_name(element.tag)
+        if self.header is None:
+            self.header = self._start_tag(element)
+        else:
+            self._check(element, tag)
+            if tag == 'task':
+                self._start_task(element)
+        self.path.append(tag)
+
+    def _end(self, element):
+        tag = self.path.pop()
+        if tag == 'process':
+            self._read_process(element)
+            element.clear()
+        elif tag == 'variables' and self.path[-1:] == ['task']:
+            self.task_stack[-1].variable_lines \
+                = self._variable_lines(element)
+            element.clear()
+        elif tag == 'task':
+            self.task_stack.pop()
+            element.clear()
+
+    def _start_tag(self, element):
+        attributes = ['xmlns:%s' % prefix if prefix else 'xmlns'
+                      for prefix, _ in self.namespaces]
+        values = [uri for _, uri in self.namespaces]
+        for key, value in element.attrib.items():
+            attributes.append(self._qualified_name(key))
+            values.append(value)
+        return '<%s%s>' % (_local_name(element.tag),
+                           ''.join(' %s="%s"' % (key, _escape_attribute(value))
+                                   for key, value in zip(attributes, values)))
+
+    def _check(self, element, tag):
+        # The children and attributes that are read from each element
+        # below the root; the content of the others is kept verbatim.
+        parent = self.path[-1]
+        if parent not in _children:
+            return
+        if tag not in _children[parent]:
+            raise RuntimeError('unsupported element <%s> in <%s> of '
+                               'pipeline xml' % (tag, parent))
+        allowed = _attributes.get(tag)
+        if allowed is None:
+            return
+        for key, value in element.attrib.items():
+            if key not in allowed and (tag, key, value) not in _defaults:
+                raise RuntimeError('unsupported attribute %s="%s" of <%s> '
+                                   'in pipeline xml' % (key, value, tag))
+
+    def _qualified_name(self, key):
+        if not key.startswith('{'):
+            return key
+        uri, name = key[1:].split('}', 1)
+        prefix = self.prefixes.get(uri)
+        return '%s:%s' % (prefix, name) if prefix else name
+
+    def _start_task(self, element):
+        name = element.get('name')
+        if self.pipeline is None:
+            self.pipeline = self.pipeline_class(name, element.get('version'))
+            self.pipeline.header = self.header
+            task = self.pipeline.main_task
+        else:
+            task = Task(name)
+        task.type = element.get('type')
+        if name in self.tasks:
+            raise RuntimeError('duplicate task %s in pipeline xml' % name)
+        self.tasks[name] = task
+        self.task_stack.append(task)
+
+    def _read_process(self, element):
+        task = self.task_stack[-1]
+        process = Process(element.get('name'))
+        process.site = element.get('site')
+        requirements = []
+        subtask_names = []
+        for child in element:
+            tag = _local_name(child.tag)
+            if tag == 'notation':
+                process.notation = self._content(child)
+            elif tag == 'job':
+                job = None
+                if len(child) == 0:
+                    # The writer may have reordered the attributes of
+                    # a standard job line.
+                    job = _job_lines.get(frozenset(child.attrib.items()))
+                if job is None:
+                    job = self._markup(child)
+                process.job = self.job_lines.setdefault(job, job)
+            elif tag == 'script':
+                body = (child.text or '').rstrip()
+                if body.startswith('\n'):
+                    body = body[1:]
+                if body != '\n'.join(process._script_body()):
+                    process.script = body
+            elif tag == 'depends':
+                requirements.extend(after.get('process') for after in child
+                                    if _local_name(after.tag) == 'after')
+            elif tag == 'createsSubtasks':
+                subtask_names.extend(subtask.text.strip() for subtask in child
+                                     if _local_name(subtask.tag) == 'subtask')
+        key = (task.name, process.name)
+        if key in self.processes:
+            raise RuntimeError('duplicate process %s.%s in pipeline xml'
+                               % key)
+        self.processes[key] = process
+        task.add_process(process)
+        self.requirements.append((task, process, requirements))
+        self.subtask_names.append((process, subtask_names))
+
+    def _variable_lines(self, element):
+        lines = ['<variables>']
+        lines.extend(self._markup(child) for child in element)
+        lines.append('</variables>')
+        return lines
+
+    def _link(self):
+        # Subtasks and requirements can refer to elements that come
+        # later in the document, so they are connected at the end.
+        for process, subtask_names in self.subtask_names:
+            for name in subtask_names:
+                if name not in self.tasks:
+                    raise RuntimeError('subtask %s of process %s not found'
+                                       % (name, process.name))
+                process.add_subtask(self.tasks[name])
+        main_task_name = self.pipeline.main_task.name
+        for task, process, names in self.requirements:
+            for name in names:
+                owner, _, process_name = name.rpartition('.')
+                keys = [(owner, process_name)] if owner else \
+                    [(task.name, name), (main_task_name, name)]
+                for key in keys:
+                    if key in self.processes:
+                        process.requirements.append(self.processes[key])
+                        break
+                else:
+                    raise RuntimeError('%s requires %s, which is not in the '
+                                       'pipeline xml' % (process.name, name))
+
+    def _markup(self, element):
+        if element.tag is ET.Comment:
+            return '<!--%s-->' % element.text
+        attributes = ''.join(' %s="%s"' % (self._qualified_name(key),
+                                           _escape_attribute(value))
+                             for key, value in element.attrib.items())
+        content = self._content(element)
+        tag = _local_name(element.tag)
+        if not content:
+            return '<%s%s/>' % (tag, attributes)
+        return '<%s%s>%s</%s>' % (tag, attributes, content, tag)
+
+    def _content(self, element):
+        if len(element) == 0:
+            return escape(element.text or '')
+        # The whitespace around child elements is pretty-printing, which
+        # the writer adds again.
+        pieces = [escape((element.text or '').strip())]
+        for child in element:
+            pieces.append(self._markup(child))
+            pieces.append(escape((child.tail or '').strip()))
+        return ''.join(pieces)
+
+# The elements read below the root, by parent element, and their
+# attributes.  The attributes of job elements are kept verbatim.
+_children = dict(pipeline=('task',),
+                 task=('variables', 'process', 'task'),
+                 process=('notation', 'job', 'script', 'depends',
+                          'createsSubtasks'),
+                 depends=('after',),
+                 createsSubtasks=('subtask',))
+_attributes = dict(task=('name', 'type', 'version'),
+                   process=('name', 'site'),
+                   notation=(), script=(), depends=(), after=('process',),
+                   createsSubtasks=(), subtask=())
+# Attribute values that are the Pipeline-II defaults, which the writer
+# leaves implicit.
+_defaults = set([('after', 'status', 'SUCCESS')])
+
+# The standard job lines, by their attributes.
+_job_lines = dict((frozenset(ET.fromstring(line).attrib.items()), line)
+                  for line in job_line.values() if line is not None)
+
+def _expat_name(name):
+    # expat gives namespaced names as uri}local.
+    return '{' + name if '}' in name else name
+
+def _local_name(tag):
+    if tag is ET.Comment:
+        return None
+    return tag.rpartition('}')[2]
+
+def _escape_attribute(value):
+    return escape(value, {'"': '&quot;'})
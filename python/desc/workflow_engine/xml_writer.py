@@ -0,0 +1,216 @@
+"""
+Streaming, indenting xml writer that reproduces the output of
+xml.dom.minidom's toprettyxml without building a DOM.
+"""
+from __future__ import print_function, absolute_import
+import xml.dom.minidom
+import xml.parsers.expat
+
+__all__ = ['XmlStreamWriter']
+
+_FLUSH_SIZE = 4096
+
+# minidom sorts the attributes of an element by name before python
+# 3.8 and keeps them in document order since.
+_SORT_ATTRIBUTES = xml.dom.minidom.parseString('<a b="" a=""/>')\
+    .documentElement.toxml() == '<a a="" b=""/>'
+
+# States of an open element.
+_EMPTY, _HELD, _BLOCK = range(3)
+
+def _escape(data):
+    return data.replace('&', '&amp;').replace('<', '&lt;')\
+        .replace('"', '&quot;').replace('>', '&gt;')
+
+class XmlStreamWriter(object):
+    """
+    Write xml to a file object one node at a time.  The formatting
+    follows the running minidom, including its attribute order: an
+    element whose only child is a text or CDATA node is written on
+    one line, adjacent text nodes are merged, and all other children
+    are written on their own, indented lines.
+    """
+    def __init__(self, fileobj, encoding='UTF-8', newl='', indent=4*' '):
+        self.fileobj = fileobj
+        self.encoding = encoding
+        self.newl = newl
+        self.indent = indent
+        self._buffer = []
+        self._stack = []
+        self._text = []
+        self._fragments = {}
+
+    def start_document(self):
+        if self.encoding:
+            decl = '<?xml version="1.0" encoding="%s"?>' % self.encoding
+        else:
+            decl = '<?xml version="1.0" ?>'
+        self._buffer.append(decl + self.newl)
+
+    def open_document(self, header, root_tag):
+        """
+        Write the xml header text, which leaves the root_tag element
+        open for subsequent content.
+        """
+        events = self._parse(header + '</%s>' % root_tag)
+        self._replay(events[:-1])
+
+    def start(self, name, attributes=()):
+        self._flush_text()
+        self._child_node()
+        out = [self.indent*len(self._stack), '<', name]
+        if _SORT_ATTRIBUTES:
+            attributes = sorted(attributes)
+        for key, value in attributes:
+            out.append(' %s="%s"' % (key, _escape(value)))
+        self._buffer.append(''.join(out))
+        self._stack.append([name, _EMPTY, None])
+
+    def end(self, name):
+        self._flush_text()
+        element = self._stack.pop()
+        if element[0] != name:
+            raise RuntimeError('mismatched end tag: %s, expected %s'
+                               % (name, element[0]))
+        if element[1] == _EMPTY:
+            self._buffer.append('/>' + self.newl)
+        elif element[1] == _HELD:
+            kind, data = element[2]
+            if kind == 'text':
+                held = _escape(data)
+            else:
+                held = '<![CDATA[%s]]>' % data
+            self._buffer.append('>%s</%s>%s' % (held, name, self.newl))
+        else:
+            self._buffer.append('%s</%s>%s' % (self.indent*len(self._stack),
+                                               name, self.newl))
+        if len(self._buffer) > _FLUSH_SIZE:
+            self.flush()
+
+    def text(self, data):
+        if data:
+            self._text.append(data)
+
+    def cdata(self, data):
+        if ']]>' in data:
+            raise ValueError("']]>' not allowed in a CDATA section")
+        self._flush_text()
+        self._node('cdata', data)
+
+    def comment(self, data):
+        if '--' in data:
+            raise ValueError("'--' is not allowed in a comment node")
+        self._flush_text()
+        self._child_node()
+        self._buffer.append('%s<!--%s-->%s' % (self.indent*len(self._stack),
+                                               data, self.newl))
+
+    def markup(self, fragment):
+        """
+        Write a string of xml markup, e.g., a job line or a block of
+        variable definitions.  Strings without markup are written as
+        text.
+        """
+        if '<' not in fragment and '&' not in fragment \
+                and '\r' not in fragment:
+            self.text(fragment)
+            return
+        try:
+            events = self._fragments[fragment]
+        except KeyError:
+            events = self._parse('<_fragment_>%s</_fragment_>' % fragment)
+            events = events[1:-1]
+            self._fragments[fragment] = events
+        self._replay(events)
+
+    def flush(self):
+        data = ''.join(self._buffer)
+        self._buffer = []
+        if self.encoding:
+            data = data.encode(self.encoding, 'xmlcharrefreplace')
+        self.fileobj.write(data)
+
+    def close(self):
+        self._flush_text()
+        if self._stack:
+            raise RuntimeError('unclosed element: %s' % self._stack[-1][0])
+        self.flush()
+
+    def _flush_text(self):
+        if self._text:
+            data = ''.join(self._text)
+            self._text = []
+            self._node('text', data)
+
+    def _node(self, kind, data):
+        if not self._stack:
+            # minidom drops character data outside of the root element.
+            return
+        parent = self._stack[-1]
+        if parent[1] == _EMPTY:
+            parent[1] = _HELD
+            parent[2] = (kind, data)
+            return
+        self._child_node()
+        indent = self.indent*len(self._stack)
+        if kind == 'text':
+            self._buffer.append(_escape(indent + data + self.newl))
+        else:
+            self._buffer.append('<![CDATA[%s]]>' % data)
+
+    def _child_node(self):
+        """
+        Prepare the enclosing element for a child node that will be
+        written on its own line.
+        """
+        if not self._stack or self._stack[-1][1] == _BLOCK:
+            return
+        parent = self._stack[-1]
+        self._buffer.append('>' + self.newl)
+        if parent[1] == _HELD:
+            parent[1] = _BLOCK
+            kind, data = parent[2]
+            parent[2] = None
+            self._node(kind, data)
+        parent[1] = _BLOCK
+
+    def _replay(self, events):
+        for method, args in events:
+            getattr(self, method)(*args)
+
+    @staticmethod
+    def _parse(document):
+        events = []
+        cdata = []
+        parser = xml.parsers.expat.ParserCreate()
+        parser.ordered_attributes = True
+        parser.buffer_text = True
+
+        def start_element(name, attrs):
+            pairs = list(zip(attrs[::2], attrs[1::2]))
+            # minidom lists namespace declarations first.
+            pairs.sort(key=lambda x: not (x[0] == 'xmlns'
+                                          or x[0].startswith('xmlns:')))
+            events.append(('start', (name, pairs)))
+
+        def character_data(data):
+            if cdata:
+                cdata.append(data)
+            else:
+                events.append(('text', (data,)))
+
+        def start_cdata():
+            cdata.append('')
+
+        def end_cdata():
+            events.append(('cdata', (''.join(cdata),)))
+            del cdata[:]
+
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = lambda name: events.append(('end', (name,)))
+        parser.CharacterDataHandler = character_data
+        parser.CommentHandler = lambda data: events.append(('comment', (data,)))
+        parser.StartCdataSectionHandler = start_cdata
+        parser.EndCdataSectionHandler = end_cdata
+        parser.Parse(document, True)
+        return events
@@ -1,3 +1,4 @@
 inst_dir=$( cd $(dirname $BASH_SOURCE)/..; pwd -P )
 export PYTHONPATH=$inst_dir/python:${PYTHONPATH}
 export WORKFLOW_ENGINE_DIR=$inst_dir
+export PATH=$inst_dir/bin.src:${PATH}
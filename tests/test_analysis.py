@@ -0,0 +1,53 @@
+"""
+Unit tests for the critical-path analysis.
+"""
+from __future__ import print_function, absolute_import
+import os
+import unittest
+import desc.workflow_engine as engine
+
+class ScheduleAnalysisTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = engine.Pipeline('my_pipeline', '1.0')
+        main_task = self.pipeline.main_task
+        first = main_task.create_process('first')
+        short = main_task.create_process('short', requirements=[first])
+        setup = main_task.create_parallel_process('parallel',
+                                                  job_type='long',
+                                                  requirements=[first])
+        main_task.create_process('last', job_type='script',
+                                 requirements=[short, setup])
+        self.runtimes = {'first': 10, 'short': 5,
+                         'parallelsTask.parallel': 20}
+
+    def test_analysis(self):
+        analysis = self.pipeline.analyze_schedule(
+            runtimes=self.runtimes, fanout=dict(parallelsTask=100))
+        self.assertEqual(analysis.makespan, 30)
+        self.assertEqual(analysis.critical_path,
+                         ['my_pipeline.first', 'my_pipeline.setup_parallels',
+                          'parallelsTask.parallel', 'my_pipeline.last'])
+        self.assertEqual(analysis.earliest_start['my_pipeline.short'], 10)
+        self.assertEqual(analysis.latest_start['my_pipeline.short'], 25)
+        self.assertEqual(analysis.slack['my_pipeline.short'], 15)
+        self.assertEqual(analysis.slack['parallelsTask.parallel'], 0)
+        self.assertEqual(analysis.work, 10 + 5 + 20*100)
+        self.assertEqual(analysis.makespan_bound(10), 201.5)
+        self.assertEqual(analysis.makespan_bound(1000), 30)
+
+    def test_default_runtimes(self):
+        analysis = self.pipeline.analyze_schedule()
+        self.assertEqual(analysis.runtime['my_pipeline.first'], 1e5)
+        self.assertEqual(analysis.runtime['my_pipeline.last'], 0)
+        varfile = os.path.join(os.environ['WORKFLOW_ENGINE_DIR'],
+                               'tests', 'main_task_test_variables.txt')
+        self.pipeline.main_task.set_variables(varfile)
+        self.pipeline.main_task.set_variable('MAXCPULONG', '500')
+        analysis = self.pipeline.analyze_schedule()
+        self.assertEqual(analysis.runtime['parallelsTask.parallel'], 500)
+        # MAXCPU is evaluated for SITE=NERSC.
+        self.assertEqual(analysis.runtime['my_pipeline.first'], 1e4)
+        self.assertEqual(analysis.makespan, 2e4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Unit tests for the environment snapshots of the batch script.
+"""
+from __future__ import print_function, absolute_import
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+import desc.workflow_engine as engine
+
+class BatchScriptTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        pipeline = engine.Pipeline('my_pipeline', '1.0')
+        pipeline.main_task.set_variables()
+        self.batch_script = pipeline.write_batch_script()
+        # The setup logs each time that it is sourced.
+        self.setup_file = os.path.join(self.tmpdir, 'setup.bash')
+        with open(self.setup_file, 'w') as output:
+            output.write('echo sourced >> %s/setup.log\n'
+                         'export DM_VALUE="a b\n c"\n'
+                         'export PATH=/dm/bin:$PATH\n'
+                         'unset DM_OLD\n'
+                         'dm_function() { echo "function $1"; }\n'
+                         % self.tmpdir)
+        with open('job', 'w') as output:
+            output.write('echo "$DM_VALUE" > job.out\n'
+                         'echo $PATH | cut -f1 -d: >> job.out\n'
+                         'dm_function $PIPELINE_PROCESS >> job.out\n'
+                         'echo ${DM_OLD-unset} >> job.out\n'
+                         'bash -c "declare -F _write_snapshot" >> job.out'
+                         ' || echo unexported >> job.out\n')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def _run(self, *args, **kwds):
+        environ = dict(os.environ, OUTPUT_DATA_DIR=self.tmpdir,
+                       SCRIPT_LOCATION=self.tmpdir, DM_DIR=self.tmpdir,
+                       DM_SETUP='setup.bash', PIPELINE_STREAMPATH='0',
+                       PIPELINE_PROCESS='job', DM_OLD='old',
+                       ENV_SNAPSHOT_DIR=os.path.join(self.tmpdir,
+                                                     'env_snapshots'))
+        environ.update(kwds)
+        if environ['ENV_SNAPSHOT_DIR'] is None:
+            del environ['ENV_SNAPSHOT_DIR']
+        with open(os.devnull, 'w') as devnull:
+            returncode = subprocess.call(['bash', self.batch_script] +
+                                         list(args), env=environ,
+                                         stdout=devnull, stderr=devnull)
+        self.assertEqual(returncode, 0)
+        with open('setup.log') as input_:
+            return len(input_.readlines())
+
+    def _job_output(self):
+        with open('job.out') as input_:
+            return input_.read()
+
+    def test_snapshot(self):
+        self.assertEqual(os.stat(self.batch_script).st_mode & 0o111, 0o111)
+        expected = 'a b\n c\n/dm/bin\nfunction job\nunset\nunexported\n'
+        self.assertEqual(self._run(), 1)
+        self.assertEqual(self._job_output(), expected)
+        os.remove('job.out')
+
+        # The snapshot replaces the setup.
+        self.assertEqual(self._run(), 1)
+        self.assertEqual(self._job_output(), expected)
+        snapshots = os.listdir('env_snapshots')
+        self.assertEqual(len(snapshots), 1)
+        with open(os.path.join('env_snapshots', snapshots[0])) as input_:
+            snapshot = input_.read()
+        self.assertNotIn('PIPELINE_STREAMPATH', snapshot)
+        self.assertIn('unset DM_OLD\n', snapshot)
+
+        # A newer setup file makes the snapshot stale.
+        earlier = time.time() - 10
+        os.utime(os.path.join('env_snapshots', snapshots[0]),
+                 (earlier, earlier))
+        self.assertEqual(self._run(), 2)
+        self.assertEqual(self._job_output(), expected)
+        self.assertEqual(self._run(), 2)
+
+        # --capture-env only refreshes the snapshot.
+        os.remove('job.out')
+        self.assertEqual(self._run('--capture-env'), 3)
+        self.assertFalse(os.path.isfile('job.out'))
+
+    def test_no_snapshot(self):
+        # Snapshots are only used if ENV_SNAPSHOT_DIR is set.
+        self.assertEqual(self._run(ENV_SNAPSHOT_DIR=None), 1)
+        self.assertEqual(self._run(ENV_SNAPSHOT_DIR=''), 2)
+        self.assertEqual(self._job_output(),
+                         'a b\n c\n/dm/bin\nfunction job\nunset\n'
+                         'unexported\n')
+        self.assertFalse(os.path.exists('env_snapshots'))
+
+if __name__ == '__main__':
+    unittest.main()
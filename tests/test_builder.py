@@ -0,0 +1,106 @@
+"""
+Unit tests for bulk construction of pipelines from process tables.
+"""
+from __future__ import print_function, absolute_import
+import io
+import unittest
+import desc.workflow_engine as engine
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class ProcessTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.csv = u"""name,job_type,task,notation,requirements,outer
+first,script,,The first process,,
+visit,std,visitsTask,,,setup_visits
+finish,,visitsTask,,visit,
+setup_visits,script,,,first,
+last,long,,The last process,setup_visits,
+"""
+
+    def reference_pipeline(self):
+        pipeline = engine.Pipeline('my_pipeline', '1.0')
+        main_task = pipeline.main_task
+        first = main_task.create_process('first', job_type='script')
+        first.notation = 'The first process'
+        setup = main_task.create_process('setup_visits', job_type='script',
+                                         requirements=[first])
+        subtask = engine.Task('visitsTask')
+        setup.add_subtask(subtask)
+        visit = subtask.create_process('visit')
+        subtask.create_process('finish', requirements=[visit])
+        last = main_task.create_process('last', job_type='long',
+                                        requirements=[setup])
+        last.notation = 'The last process'
+        return pipeline
+
+    def test_csv(self):
+        pipeline = engine.Pipeline('my_pipeline', '1.0')
+        created = engine.add_processes(pipeline, io.StringIO(self.csv))
+        self.assertEqual([process.name for process in created],
+                         ['first', 'visit', 'finish', 'setup_visits', 'last'])
+        self.assertEqual(pipeline.toxml(), self.reference_pipeline().toxml())
+
+    def test_records(self):
+        pipeline = engine.Pipeline('my_pipeline', '1.0')
+        engine.add_processes(pipeline, [
+            dict(name='first', job_type='script',
+                 notation='The first process'),
+            ('setup_visits', 'script', None, None, ['first']),
+            ('visit', 'std', 'visitsTask', None, [], 'setup_visits')])
+        engine.add_processes(pipeline, [
+            dict(name='finish', task='visitsTask', requirements='visit'),
+            dict(name='last', job_type='long', notation='The last process',
+                 requirements='my_pipeline.setup_visits')])
+        self.assertEqual(pipeline.toxml(), self.reference_pipeline().toxml())
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_structured_array(self):
+        table = np.array([('first', 'script', '', 'The first process', '', ''),
+                          ('setup_visits', 'script', '', '', 'first', ''),
+                          ('visit', 'std', 'visitsTask', '', '',
+                           'setup_visits'),
+                          ('finish', 'std', 'visitsTask', '', 'visit', ''),
+                          ('last', 'long', '', 'The last process',
+                           'setup_visits', '')],
+                         dtype=[(column, 'S30') for column
+                                in engine.builder.columns])
+        pipeline = engine.Pipeline('my_pipeline', '1.0')
+        engine.add_processes(pipeline, table)
+        self.assertEqual(pipeline.toxml(), self.reference_pipeline().toxml())
+
+    def test_requires_subtask(self):
+        pipeline = engine.Pipeline('my_pipeline', '1.0')
+        created = engine.add_processes(pipeline, io.StringIO(self.csv))
+        wrap_up, = engine.add_processes(pipeline, [
+            dict(name='wrap_up', requirements='setup_visits')])
+        self.assertEqual(wrap_up.requirements, created[1:3])
+
+    def test_errors(self):
+        pipeline = engine.Pipeline('my_pipeline', '1.0')
+        for rows in ([dict(name='2PCF')],
+                     [dict(name='class')],
+                     [dict(name='first'), dict(name='first')],
+                     [dict(name='first', job_type='medium')],
+                     [dict(name='first', requirements='zeroth')],
+                     [dict(name='visit', task='visitsTask')],
+                     [dict(name='first'),
+                      dict(name='visit', task='visitsTask', outer='first'),
+                      dict(name='finish', task='visitsTask', outer='last')]):
+            self.assertRaises(RuntimeError, engine.add_processes, pipeline,
+                              rows)
+        # Nothing is added if the table is invalid.
+        self.assertEqual(pipeline.main_task.processes, [])
+
+    def test_check_names(self):
+        engine.workflow_engine.check_names(['a', '_b1', 30*'c'])
+        engine.workflow_engine.check_names([])
+        for names in (['a', 31*'c'], ['a', 'b c'], ['a', 'b\nc'], ['None'],
+                      ['True'], ['False'], ['a.b'], ['']):
+            self.assertRaises(RuntimeError,
+                              engine.workflow_engine.check_names, names)
+
+if __name__ == '__main__':
+    unittest.main()
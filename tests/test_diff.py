@@ -0,0 +1,77 @@
+"""
+Unit tests for structural pipeline diffs.
+"""
+from __future__ import print_function, absolute_import
+import io
+import json
+import unittest
+import desc.workflow_engine as engine
+from desc.workflow_engine.workflow_engine import job_line
+
+def make_pipeline(version):
+    pipeline = engine.Pipeline('my_pipeline', version)
+    main_task = pipeline.main_task
+    main_task.set_variables()
+    first = main_task.create_process('first')
+    second = main_task.create_process('second', requirements=[first])
+    setup = main_task.create_parallel_process('parallel',
+                                              requirements=[first])
+    main_task.create_process('last', job_type='script',
+                             requirements=[second, setup])
+    return pipeline
+
+class PipelineDiffTestCase(unittest.TestCase):
+    def test_no_changes(self):
+        old = make_pipeline('1.0')
+        new = engine.Pipeline.from_xml(io.BytesIO(old.toxml()))
+        diff = old.diff(new)
+        self.assertFalse(diff)
+        self.assertEqual(diff.affected_processes, [])
+
+    def test_changes(self):
+        old = make_pipeline('1.0')
+        new = make_pipeline('1.1')
+        main_task = new.main_task
+        first, second, setup, last = main_task.processes
+        second.job = job_line['long']
+        last.requirements.remove(second)
+        main_task.create_process('extra', requirements=[first])
+        setup.subtasks[0].variable_lines \
+            = ['<variables>', '<var name="FILTER">r</var>', '</variables>']
+
+        diff = engine.diff_pipelines(old, new)
+        self.assertTrue(diff)
+        self.assertEqual(diff.version, ('1.0', '1.1'))
+        self.assertEqual(diff.added_processes, ['my_pipeline.extra'])
+        self.assertEqual(diff.removed_processes, [])
+        self.assertEqual(dict(diff.changed_processes),
+                         {'my_pipeline.second': ['job'],
+                          'my_pipeline.last': ['requirements']})
+        self.assertEqual(diff.added_edges,
+                         [('my_pipeline.first', 'my_pipeline.extra')])
+        self.assertEqual(diff.removed_edges,
+                         [('my_pipeline.second', 'my_pipeline.last')])
+        self.assertEqual(dict(diff.changed_variables['parallelsTask']),
+                         {'FILTER': (None, 'r')})
+        self.assertEqual(diff.affected_processes,
+                         ['my_pipeline.second', 'my_pipeline.last',
+                          'my_pipeline.extra', 'parallelsTask.parallel'])
+        self.assertEqual(json.loads(json.dumps(diff.to_dict()))
+                         ['removed_edges'],
+                         [['my_pipeline.second', 'my_pipeline.last']])
+
+        diff = new.diff(old)
+        self.assertEqual(diff.removed_processes, ['my_pipeline.extra'])
+        self.assertEqual(dict(diff.changed_variables['parallelsTask']),
+                         {'FILTER': ('r', None)})
+
+    def test_main_task_variables(self):
+        old = make_pipeline('1.0')
+        new = make_pipeline('1.0')
+        new.main_task.set_variable('MAXCPU', '1000')
+        diff = old.diff(new)
+        self.assertEqual(list(diff.changed_variables), ['my_pipeline'])
+        self.assertEqual(len(diff.affected_processes), 5)
+
+if __name__ == '__main__':
+    unittest.main()
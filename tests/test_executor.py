@@ -0,0 +1,229 @@
+"""
+Unit tests for local pipeline execution.
+"""
+from __future__ import print_function, absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+import desc.workflow_engine as engine
+from desc.workflow_engine.executor import LocalExecutor, LocalPipeline
+
+class LocalExecutorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        self.pipeline = engine.Pipeline('my_pipeline', '1.0')
+        main_task = self.pipeline.main_task
+        varfile = os.path.join(os.environ['WORKFLOW_ENGINE_DIR'],
+                               'tests', 'main_task_test_variables.txt')
+        main_task.set_variables(varfile=varfile)
+        first = main_task.create_process('first')
+        second = main_task.create_process('second', job_type='long',
+                                          requirements=[first])
+        setup = main_task.create_parallel_process('parallel',
+                                                  requirements=[first])
+        main_task.create_process('last', job_type='script',
+                                 requirements=[second, setup])
+        self.pipeline.write_python_module()
+        self._set_num_streams(3)
+        self.pipeline.write_process_scripts()
+        for name in ('first', 'second', 'parallel'):
+            with open(name, 'w') as output:
+                output.write('echo %s >> ${OUTPUT_DATA_DIR}/order.txt\n'
+                             % name)
+
+    def _set_num_streams(self, num_streams):
+        with open(self.pipeline.get_module_name(), 'a') as output:
+            output.write('''
+class Job(object):
+    def __init__(self, index):
+        self.pipeline_vars = dict(VISIT=str(100 + index))
+
+parallelsTask_jobs = [Job(i) for i in range(%i)]
+''' % num_streams)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def _check_run(self, pool):
+        executor = LocalExecutor(self.pipeline, max_workers=4, pool=pool)
+        status = executor.run()
+        self.assertEqual(list(status.keys()),
+                         ['my_pipeline.first', 'my_pipeline.second',
+                          'my_pipeline.setup_parallels', 'my_pipeline.last',
+                          'parallelsTask.parallel'])
+        self.assertEqual(set(status.values()), set([0]))
+        with open('order.txt') as input_:
+            order = [x.strip() for x in input_]
+        self.assertEqual(order[0], 'first')
+        self.assertEqual(sorted(order[1:]), ['parallel']*3 + ['second'])
+        with open('my_pipeline.first.log') as input_:
+            self.assertIn('first', input_.read())
+        self.assertFalse(os.path.exists('env_snapshots'))
+
+    def test_thread_pool(self):
+        self._check_run('thread')
+
+    def test_process_pool(self):
+        self._check_run('process')
+
+    def test_env_snapshots(self):
+        executor = LocalExecutor(self.pipeline, pool='thread',
+                                 env_snapshots=True)
+        self.assertEqual(set(executor.run().values()), set([0]))
+        self.assertEqual(len(os.listdir('env_snapshots')), 1)
+
+    def test_failure(self):
+        with open('second', 'w') as output:
+            output.write('exit 1\n')
+        status = LocalExecutor(self.pipeline, pool='thread').run()
+        self.assertEqual(status['my_pipeline.first'], 0)
+        self.assertNotEqual(status['my_pipeline.second'], 0)
+        self.assertEqual(status['parallelsTask.parallel'], 0)
+        self.assertEqual(status['my_pipeline.last'], None)
+
+    def test_substreams(self):
+        with open('parallel', 'w') as output:
+            output.write('echo ${VISIT} ${PIPELINE_STREAMPATH} '
+                         '>> ${OUTPUT_DATA_DIR}/streams.txt\n')
+        self._set_num_streams(20)
+        executor = LocalExecutor(self.pipeline, max_workers=4, pool='thread',
+                                 max_substreams=2)
+        status = executor.run()
+        self.assertEqual(set(status.values()), set([0]))
+        with open('streams.txt') as input_:
+            streams = sorted(x.split() for x in input_)
+        self.assertEqual(streams, sorted([str(100 + i), '0.%i' % i]
+                                         for i in range(20)))
+        self.assertEqual(executor.stream_status[('parallelsTask.parallel',
+                                                 '0.19')], 0)
+        num_streams, elapsed, rate = \
+            executor.fanout_summary()['parallelsTask']
+        self.assertEqual(num_streams, 20)
+
+    def test_substream_table(self):
+        with open('parallel', 'w') as output:
+            output.write('echo ${VISIT} ${FILTER} ${PIPELINE_STREAMPATH} '
+                         '>> ${OUTPUT_DATA_DIR}/streams.txt\n')
+        self.pipeline.write_python_module(clobber=True, substream_tables=True)
+        with open(self.pipeline.get_module_name()) as input_:
+            self.assertNotIn('parallelsTask_jobs', input_.read())
+        rows = [dict(VISIT=100 + i, FILTER='ugrizy'[i % 6])
+                for i in range(8)]
+        self.pipeline.write_substream_table('parallelsTask', rows,
+                                            names=['VISIT', 'FILTER'])
+        status = LocalExecutor(self.pipeline, pool='thread').run()
+        self.assertEqual(set(status.values()), set([0]))
+        with open('streams.txt') as input_:
+            streams = sorted(x.split() for x in input_)
+        self.assertEqual(streams, sorted([str(100 + i), 'ugrizy'[i % 6],
+                                          '0.%i' % i] for i in range(8)))
+
+    def test_max_in_flight(self):
+        # The lock directory makes any overlap of substreams fail.
+        with open('parallel', 'w') as output:
+            output.write('mkdir ${OUTPUT_DATA_DIR}/lock || exit 5\n'
+                         'sleep 0.05\n'
+                         'rmdir ${OUTPUT_DATA_DIR}/lock\n')
+        main_task = self.pipeline.main_task
+        main_task.processes[2].subtasks[0].launch_options \
+            = dict(batch_size=2, max_in_flight=1)
+        self.pipeline.write_python_module(clobber=True)
+        self._set_num_streams(4)
+        executor = LocalExecutor(self.pipeline, max_workers=4, pool='thread')
+        status = executor.run()
+        self.assertEqual(set(status.values()), set([0]))
+        self.assertEqual(executor.fanout_summary()['parallelsTask'][0], 4)
+
+    def test_result_cache(self):
+        def run():
+            executor = LocalExecutor(self.pipeline, pool='thread',
+                                     cache='results.json')
+            status = executor.run()
+            self.assertEqual(set(status.values()), set([0]))
+            if not os.path.isfile('order.txt'):
+                return executor, []
+            with open('order.txt') as input_:
+                order = sorted(x.strip() for x in input_)
+            os.remove('order.txt')
+            return executor, order
+
+        executor, order = run()
+        self.assertEqual(executor.cached, [])
+        self.assertEqual(order, ['first', 'parallel', 'parallel',
+                                 'parallel', 'second'])
+        self.assertEqual(len(executor.cache), 7)
+
+        executor, order = run()
+        self.assertEqual(len(executor.cached), 7)
+        self.assertEqual(order, [])
+
+        # Changing a script reruns the process and everything downstream.
+        with open('second', 'a') as output:
+            output.write('true\n')
+        executor, order = run()
+        self.assertEqual(order, ['second'])
+        self.assertNotIn(('my_pipeline.second', '0'), executor.cached)
+        self.assertNotIn(('my_pipeline.last', '0'), executor.cached)
+        self.assertIn(('parallelsTask.parallel', '0.2'), executor.cached)
+
+        # The least recently used results are evicted.
+        cache = engine.ResultCache('results.json', max_entries=3)
+        self.assertEqual(len(cache), 3)
+
+    def test_substream_failure(self):
+        with open('parallel', 'w') as output:
+            output.write('if [ ${VISIT} -eq 102 ]; then exit 3; fi\n')
+        status = LocalExecutor(self.pipeline, pool='thread',
+                               max_substreams=1).run()
+        self.assertEqual(status['parallelsTask.parallel'], 3)
+        self.assertEqual(status['my_pipeline.last'], None)
+
+    def test_no_substreams(self):
+        self._set_num_streams(0)
+        status = LocalExecutor(self.pipeline, pool='thread').run()
+        self.assertEqual(set(status.values()), set([0]))
+        self.assertFalse(os.path.isfile('parallelsTask.parallel.0.0.log'))
+
+    def test_script_body(self):
+        # A script of the process's own, e.g., one read from xml, is run
+        # instead of the function in the workflow module.
+        last = self.pipeline.main_task.processes[-1]
+        last.script = '''
+    execfile("%s/%s" % (SLAC_SCRIPT_LOCATION, SCRIPT_NAME))
+    with open("custom.txt", "w") as output:
+        output.write("%s %i" % (SITE, len(parallelsTask_jobs)))'''
+        status = LocalExecutor(self.pipeline, pool='thread').run()
+        self.assertEqual(status['my_pipeline.last'], 0)
+        with open('custom.txt') as input_:
+            self.assertEqual(input_.read(), 'NERSC 3')
+        # Script processes run in work_dir, as the jobs do.
+        os.remove('custom.txt')
+        os.mkdir('work')
+        for pool in ('thread', 'process'):
+            status = LocalExecutor(self.pipeline, pool=pool,
+                                   work_dir='work').run()
+            self.assertEqual(status['my_pipeline.last'], 0)
+            os.remove(os.path.join('work', 'custom.txt'))
+            self.assertFalse(os.path.exists('custom.txt'))
+        last.script = 'raise ValueError("failed")'
+        status = LocalExecutor(self.pipeline, pool='thread').run()
+        self.assertEqual(status['my_pipeline.last'], 1)
+
+    def test_local_pipeline(self):
+        pipeline = LocalPipeline()
+        pipeline.createSubstream('my_subtask', 0, dict(VISIT=1))
+        pipeline.createSubstream('my_subtask', '1', 'VISIT=2,FILTER=r')
+        self.assertEqual(pipeline.substreams,
+                         [('my_subtask', 0, dict(VISIT='1')),
+                          ('my_subtask', 1, dict(VISIT='2', FILTER='r'))])
+
+    def test_bad_pool(self):
+        self.assertRaises(RuntimeError, LocalExecutor, self.pipeline,
+                          pool='mpi')
+
+if __name__ == '__main__':
+    unittest.main()
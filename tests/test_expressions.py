@@ -0,0 +1,101 @@
+"""
+Unit tests for the local evaluation of ${...} expressions.
+"""
+from __future__ import print_function, absolute_import
+import unittest
+from xml.dom import minidom
+import desc.workflow_engine as engine
+from desc.workflow_engine import expressions
+from desc.workflow_engine.expressions import UnresolvedError
+
+class ExpressionTestCase(unittest.TestCase):
+    def test_evaluate(self):
+        evaluate = engine.evaluate
+        self.assertEqual(evaluate('100000 / (SITE=="NERSC" ? 10 : 1)',
+                                  dict(SITE='NERSC')), 10000)
+        self.assertEqual(evaluate('100000 / (SITE=="NERSC" ? 10 : 1)',
+                                  dict(SITE='SLAC')), 100000)
+        self.assertEqual(evaluate('1 + 2*3 - -4', {}), 11)
+        self.assertEqual(evaluate('7/2', {}), 3.5)
+        self.assertEqual(evaluate('-7 % 3', {}), -1)
+        self.assertEqual(evaluate('N mod 4 == 2', dict(N='10')), True)
+        self.assertEqual(evaluate("'a' + B", dict(B='b')), 'ab')
+        self.assertEqual(evaluate('X >= 2 && !(Y lt 1) || false',
+                                  dict(X=2, Y='1')), True)
+        self.assertEqual(evaluate('A ? "yes" : "no"', dict(A='false')), 'no')
+        self.assertEqual(engine.format_value(evaluate('10/4*2', {})), '5')
+        self.assertRaises(UnresolvedError, evaluate, 'MISSING + 1', {})
+        for expression in ('1 +', '(1', '1 2', 'f(1)', '1/0'):
+            self.assertRaises(RuntimeError, evaluate, expression, {})
+
+    def test_compile_cache(self):
+        for i in range(expressions._max_compiled + 10):
+            self.assertEqual(engine.evaluate('%i + 1' % i, {}), i + 1)
+        self.assertEqual(len(expressions._compiled),
+                         expressions._max_compiled)
+        self.assertNotIn('0 + 1', expressions._compiled)
+        self.assertIn('%i + 1' % i, expressions._compiled)
+
+class VariableResolverTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = engine.Pipeline('my_pipeline', '1.0')
+        self.main_task = self.pipeline.main_task
+        self.main_task.set_variables()
+
+    def test_sites(self):
+        for site, maxcpu, jobsite in (('SLAC', '100000', 'LSST'),
+                                      ('NERSC', '10000', 'NERSCTONYJ')):
+            resolver = engine.VariableResolver([self.main_task.variables],
+                                               site=site)
+            values = resolver.values()
+            self.assertEqual(list(values), list(self.main_task.variables))
+            self.assertEqual(values['MAXCPU'], maxcpu)
+            self.assertEqual(values['JOBSITE'], jobsite)
+            self.assertEqual(values['DM_DIR'],
+                             values[site + '_DM_DIR'])
+
+    def test_unresolved(self):
+        variables = engine.Variables(['<var name="A">${B}/a</var>',
+                                      '<var name="B">${C}</var>',
+                                      '<var name="C">${A}</var>',
+                                      '<var name="D">${STREAM}</var>',
+                                      '<var name="E">${1 + 1}</var>'])
+        resolver = engine.VariableResolver([variables])
+        self.assertEqual(list(resolver.values().items()), [('E', '2')])
+        self.assertNotIn('A', resolver)
+        self.assertRaises(UnresolvedError, resolver.__getitem__, 'D')
+        self.assertEqual(resolver.substitute('${E}/${D}'), '2/${D}')
+
+    def test_site_xml(self):
+        main_task = self.main_task
+        first = main_task.create_process('first')
+        setup = main_task.create_parallel_process('parallel',
+                                                  requirements=[first])
+        subtask = setup.subtasks[0]
+        subtask.variable_lines = ['<variables>',
+                                  '<var name="SITE">SLAC</var>',
+                                  '<var name="EXTRA">${MAXCPU}</var>',
+                                  '<var name="TAG">${STREAM} &amp; co</var>',
+                                  '</variables>']
+        doc = minidom.parseString(self.pipeline.toxml(site='NERSC'))
+        values = dict((var.getAttribute('name'), var.firstChild.data)
+                      for var in doc.getElementsByTagName('var'))
+        self.assertEqual(values['MAXCPU'], '10000')
+        self.assertEqual(values['EXTRA'], '10000')
+        self.assertEqual(values['TAG'], '${STREAM} & co')
+        self.assertEqual(values['BATCH_OPTIONS'], '-p shared | -L SCRATCH')
+        jobs = doc.getElementsByTagName('job')
+        self.assertEqual(jobs[0].getAttribute('maxCPU'), '10000')
+        self.assertEqual(jobs[0].getAttribute('executable'),
+                         '/global/cscratch1/sd/jchiang8/WL_pipeline/'
+                         'WL_pipeline_Batch.sh')
+        processes = doc.getElementsByTagName('process')
+        self.assertEqual(processes[0].getAttribute('site'), 'NERSCTONYJ')
+
+        # Without a site, the xml is unchanged.
+        doc = minidom.parseString(self.pipeline.toxml())
+        jobs = doc.getElementsByTagName('job')
+        self.assertEqual(jobs[0].getAttribute('maxCPU'), '${MAXCPU}')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Unit tests for the process dependency graph.
+"""
+from __future__ import print_function, absolute_import
+import unittest
+import desc.workflow_engine as engine
+
+class ProcessGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = engine.Pipeline('my_pipeline', '1.0')
+        main_task = self.pipeline.main_task
+        self.first = main_task.create_process('first')
+        self.setup = main_task.create_parallel_process('parallel',
+                                                       requirements=
+                                                       [self.first])
+        self.second = main_task.create_process('second',
+                                               requirements=[self.setup])
+        self.third = main_task.create_process('third',
+                                              requirements=[self.second,
+                                                            self.first,
+                                                            self.setup,
+                                                            self.second])
+
+    def test_graph(self):
+        graph = engine.ProcessGraph(self.pipeline.main_task)
+        self.assertEqual(len(graph), 5)
+        parallel = self.setup.subtasks[0].processes[0]
+        self.assertEqual(graph.name(parallel), 'parallelsTask.parallel')
+        self.assertEqual(graph.upstream[parallel], [self.setup])
+        self.assertEqual(graph.upstream[self.third],
+                         [self.second, self.first, parallel])
+        order = graph.topological_order()
+        self.assertEqual(order[:3], [self.first, self.setup, parallel])
+
+    def test_cycle(self):
+        self.first.requires(self.third)
+        graph = engine.ProcessGraph(self.pipeline.main_task)
+        self.assertRaises(RuntimeError, graph.topological_order)
+
+    def test_missing_requirement(self):
+        self.first.requires(engine.Process('orphan'))
+        self.assertRaises(RuntimeError, engine.ProcessGraph,
+                          self.pipeline.main_task)
+
+    def test_reduce_dependencies(self):
+        self.assertEqual(self.pipeline.reduce_dependencies(), 3)
+        self.assertEqual(self.third.requirements, [self.second])
+        self.assertEqual(self.pipeline.reduce_dependencies(), 0)
+
+    def test_reduce_subtask_dependencies(self):
+        subtask = engine.Task('my_subtask')
+        sub1 = subtask.create_process('sub1')
+        sub2 = subtask.create_process('sub2', requirements=[sub1])
+        self.third.add_subtask(subtask)
+        last = self.pipeline.main_task.create_process('last')
+        last.requires(self.third)
+        last.requires(sub1)
+        last.requires(sub2)
+        self.assertEqual(self.pipeline.reduce_dependencies(), 6)
+        self.assertEqual(last.requirements, [sub2])
+
+if __name__ == '__main__':
+    unittest.main()
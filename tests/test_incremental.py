@@ -0,0 +1,90 @@
+"""
+Unit tests for incremental regeneration of pipeline files.
+"""
+from __future__ import print_function, absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+import desc.workflow_engine as engine
+
+class IncrementalBuildTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        self.pipeline = engine.Pipeline('my_pipeline', '1.0')
+        main_task = self.pipeline.main_task
+        varfile = os.path.join(os.environ['WORKFLOW_ENGINE_DIR'],
+                               'tests', 'main_task_test_variables.txt')
+        main_task.set_variables(varfile=varfile)
+        self.first = main_task.create_process('first')
+        main_task.create_parallel_process('parallel',
+                                          requirements=[self.first])
+        self.module_name = self.pipeline.get_module_name()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def test_incremental_build(self):
+        report = self.pipeline.write_incremental('pipeline.xml')
+        self.assertEqual(report.written, ['pipeline.xml', self.module_name,
+                                          'first', 'parallel'])
+        self.assertEqual(report.changed_processes,
+                         ['my_pipeline.first', 'my_pipeline.setup_parallels',
+                          'parallelsTask.parallel'])
+        with open('pipeline.xml', 'rb') as input_:
+            self.assertEqual(input_.read(), self.pipeline.toxml())
+
+        report = self.pipeline.write_incremental('pipeline.xml')
+        self.assertEqual(report.written, [])
+        self.assertEqual(len(report.unchanged), 4)
+        self.assertEqual(report.changed_processes, [])
+
+        # A user-edited script is preserved, and a new process is
+        # reported along with the process that now depends on it.
+        with open('first', 'w') as output:
+            output.write('run_first_step.py\n')
+        last = self.pipeline.main_task.create_process('last')
+        self.first.requires(last)
+        report = self.pipeline.write_incremental('pipeline.xml')
+        self.assertEqual(report.written, ['pipeline.xml', 'last'])
+        self.assertEqual(report.preserved, ['first'])
+        self.assertEqual(report.changed_processes,
+                         ['my_pipeline.first', 'my_pipeline.last'])
+        with open('first') as input_:
+            self.assertEqual(input_.read(), 'run_first_step.py\n')
+
+        report = self.pipeline.write_incremental('pipeline.xml',
+                                                 clobber=True)
+        self.assertEqual(report.written, ['first'])
+
+    def test_render_once(self):
+        calls = []
+        write_xml = self.pipeline.write_xml
+        self.pipeline.write_xml = lambda *args, **kwds: \
+            calls.append(write_xml(*args, **kwds))
+        self.pipeline.write_incremental('pipeline.xml',
+                                        substream_tables=True)
+        self.assertEqual(len(calls), 1)
+        with open(self.module_name) as input_:
+            module = input_.read()
+        self.pipeline.write_python_module(clobber=True,
+                                          substream_tables=True)
+        with open(self.module_name) as input_:
+            self.assertEqual(input_.read(), module)
+        report = self.pipeline.write_incremental('pipeline.xml')
+        self.assertEqual(report.written, [self.module_name])
+
+    def test_removed_process(self):
+        self.pipeline.write_incremental('pipeline.xml')
+        self.pipeline.main_task.processes.pop(0)
+        self.pipeline.main_task.processes[0].requirements = []
+        report = self.pipeline.write_incremental('pipeline.xml')
+        self.assertEqual(report.removed_processes, ['my_pipeline.first'])
+        self.assertEqual(report.changed_processes,
+                         ['my_pipeline.setup_parallels'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Unit tests for splitting pipelines into shards.
+"""
+from __future__ import print_function, absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+import desc.workflow_engine as engine
+from desc.workflow_engine.executor import LocalPipeline
+
+class ShardingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        self.pipeline = engine.Pipeline('my_pipeline', '1.0')
+        main_task = self.pipeline.main_task
+        main_task.set_variables()
+        # Two independent chains of five processes, with a parallel
+        # process in the middle of the first.
+        for chain in 'ab':
+            process = main_task.create_process('%s0' % chain)
+            for i in range(1, 5):
+                if chain == 'a' and i == 2:
+                    process = main_task.create_parallel_process(
+                        'a2', requirements=[process])
+                else:
+                    process = main_task.create_process(
+                        '%s%i' % (chain, i), requirements=[process])
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def _names(self, shard):
+        graph = engine.ProcessGraph(shard.main_task)
+        return [graph.name(process) for process in graph.processes]
+
+    def test_max_processes(self):
+        self.assertEqual(self.pipeline.shard(max_processes=11),
+                         [self.pipeline])
+        shards = self.pipeline.shard(max_processes=6)
+        self.assertEqual([shard.main_task.name for shard in shards],
+                         ['my_pipeline_0', 'my_pipeline_1'])
+        # The chains are cut apart rather than in the middle.
+        self.assertEqual(self._names(shards[0]),
+                         ['my_pipeline_0.a0', 'my_pipeline_0.a1',
+                          'my_pipeline_0.setup_a2s', 'my_pipeline_0.a3',
+                          'my_pipeline_0.a4', 'my_pipeline_0.launch_shard_1',
+                          'a2sTask.a2'])
+        self.assertEqual(self._names(shards[1]),
+                         ['my_pipeline_1.b%i' % i for i in range(5)])
+        launcher = shards[0].main_task.processes[-1]
+        self.assertEqual([process.name for process in launcher.requirements],
+                         ['a4'])
+        for shard in shards:
+            self.assertEqual(engine.pipeline_problems(shard.main_task), [])
+        self.assertEqual(self.pipeline.main_task.processes[0].owner_task,
+                         None)
+        self.assertEqual(len(self.pipeline.main_task.processes), 10)
+
+    def test_modules(self):
+        shards = self.pipeline.shard(max_processes=4)
+        self.assertEqual(len(shards), 4)
+        module_names = [shard.get_module_name() for shard in shards]
+        self.assertEqual(module_names,
+                         ['WL_pipeline_Workflow_%i.py' % i for i in range(4)])
+        for shard in shards:
+            shard.write_python_module()
+        local_pipeline = LocalPipeline()
+        namespace = dict(pipeline=local_pipeline)
+        with open(module_names[0]) as input_:
+            exec(input_.read(), namespace)
+        namespace['launch_shard_1']()
+        self.assertEqual(local_pipeline.streams, [('my_pipeline_1', -1, {})])
+
+        # The variables given to a stream are passed on to the next.
+        namespace.update(SITE='NERSC', DM_SETUP='test.sh',
+                         SCRIPT_NAME=module_names[0], MAXCPU=10000)
+        namespace['launch_shard_1']()
+        self.assertEqual(local_pipeline.streams[-1],
+                         ('my_pipeline_1', -1,
+                          dict(SITE='NERSC', DM_SETUP='test.sh')))
+        namespace['DM_SETUP'] = 'a,b'
+        self.assertRaises(RuntimeError, namespace['launch_shard_1'])
+        with open(module_names[-1]) as input_:
+            self.assertNotIn('createStream', input_.read())
+
+    def test_launcher_name(self):
+        main_task = self.pipeline.main_task
+        a4 = main_task.processes[4]
+        main_task.create_process('launch_shard_1', requirements=[a4])
+        shards = self.pipeline.shard(max_processes=7)
+        self.assertEqual(len(shards), 2)
+        self.assertIn('my_pipeline_0.launch_shard_1',
+                      self._names(shards[0]))
+        launcher = shards[0].main_task.processes[-1]
+        self.assertEqual(launcher.name, 'launch_shard_1_0')
+        self.assertEqual(shards[0].next_shard,
+                         ('launch_shard_1_0', 'my_pipeline_1'))
+
+    def test_shard_fused(self):
+        fused = self.pipeline.fuse_job_chains()
+        self.assertEqual(len(fused), 3)
+        shards = self.pipeline.shard(max_processes=2)
+        self.assertTrue(len(shards) > 1)
+        copies = [process for shard in shards
+                  for process in shard.main_task.processes
+                  if process.fused]
+        self.assertEqual([process.name for process in copies],
+                         [process.name for process in fused])
+        for original, copy in zip(fused, copies):
+            self.assertEqual([member.name for member in copy.fused],
+                             [member.name for member in original.fused])
+            self.assertTrue(all(member not in original.fused
+                                for member in copy.fused))
+            # The members still run in order within the copy.
+            for upstream, member in zip(copy.fused, copy.fused[1:]):
+                self.assertEqual(member.requirements, [upstream])
+        for shard in shards:
+            scripts = [name for _, name, _ in shard.process_scripts()]
+            for process in shard.main_task.processes:
+                for member in process.fused:
+                    self.assertIn(member.name, scripts)
+
+    def test_max_bytes(self):
+        size = len(self.pipeline.toxml())
+        shards = self.pipeline.shard(max_bytes=size//2)
+        self.assertTrue(len(shards) > 1)
+        self.assertEqual(sum(len(shard.main_task.processes)
+                             for shard in shards), 10 + len(shards) - 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+Unit tests for the batch-farm simulator.
+"""
+from __future__ import print_function, absolute_import
+import unittest
+import desc.workflow_engine as engine
+
+class PipelineSimulatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = engine.Pipeline('my_pipeline', '1.0')
+        main_task = self.pipeline.main_task
+        first = main_task.create_process('first')
+        setup = main_task.create_parallel_process('parallel',
+                                                  requirements=[first])
+        main_task.create_process('last', requirements=[setup])
+        self.runtimes = dict(first=10, parallel=100, last=5)
+
+    def test_unconstrained(self):
+        simulator = engine.PipelineSimulator(self.pipeline,
+                                             runtimes=self.runtimes)
+        result = simulator.run(engine.BatchFarm(slots=1000, queue_wait=1),
+                               fanout=dict(parallelsTask=50))
+        self.assertEqual(result.makespan, 118)
+        self.assertEqual(result.num_jobs, 52)
+        self.assertEqual(result.max_queue_depth('SLAC'), 50)
+        self.assertEqual(max(busy for _, busy, _
+                             in result.timeline['SLAC']), 50)
+
+    def test_slots_and_queue_wait(self):
+        simulator = engine.PipelineSimulator(self.pipeline,
+                                             runtimes=self.runtimes,
+                                             site='NERSC')
+        farms = dict(NERSC=engine.BatchFarm(slots=10, queue_wait=1))
+        result = simulator.run(farms, fanout=dict(parallelsTask=50))
+        self.assertEqual(result.makespan, 1 + 10 + 1 + 5*100 + 1 + 5)
+        utilization = result.utilization('NERSC')
+        self.assertAlmostEqual(utilization, (10 + 5000 + 5.)
+                               /(10*result.makespan))
+
+    def test_random_queue_wait(self):
+        simulator = engine.PipelineSimulator(self.pipeline,
+                                             runtimes=self.runtimes)
+        farm = engine.BatchFarm(20, engine.BatchFarm.exponential_wait(60))
+        result1 = simulator.run(farm, fanout=dict(parallelsTask=100), seed=1)
+        result2 = simulator.run(farm, fanout=dict(parallelsTask=100), seed=1)
+        self.assertEqual(result1.makespan, result2.makespan)
+        self.assertTrue(result1.makespan > 10 + 5*100 + 5)
+
+    def test_missing_farm(self):
+        simulator = engine.PipelineSimulator(self.pipeline)
+        self.assertRaises(RuntimeError, simulator.run,
+                          dict(NERSC=engine.BatchFarm(1)))
+
+if __name__ == '__main__':
+    unittest.main()
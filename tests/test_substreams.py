@@ -0,0 +1,154 @@
+"""
+Unit tests for substream parameter tables.
+"""
+from __future__ import print_function, absolute_import
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import desc.workflow_engine as engine
+from desc.workflow_engine.executor import LocalPipeline
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class SubstreamTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'visitsTask_streams.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_and_read(self):
+        rows = [(100 + i, 'ugrizy'[i % 6], '') for i in range(1000)]
+        table = engine.SubstreamTable.write(self.filename, rows,
+                                            names=('VISIT', 'FILTER', 'TAG'))
+        self.assertEqual(table.names, ['VISIT', 'FILTER', 'TAG'])
+        self.assertEqual(len(table), 1000)
+        self.assertEqual(table[0], dict(VISIT='100', FILTER='u', TAG=''))
+        self.assertEqual(table[-1], dict(VISIT='1099', FILTER='i', TAG=''))
+        self.assertEqual([row['VISIT'] for row in table.rows(998)],
+                         ['1098', '1099'])
+        self.assertEqual(len(list(table)), 1000)
+        self.assertEqual(os.path.getsize(self.filename),
+                         1001*table.record_size)
+        self.assertRaises(IndexError, table.__getitem__, 1000)
+
+        # Column names default to the keys of dict rows.
+        table = engine.SubstreamTable.write(self.filename,
+                                            [dict(VISIT=1), dict(VISIT=20)])
+        self.assertEqual(list(table), [dict(VISIT='1'), dict(VISIT='20')])
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_structured_array(self):
+        rows = np.array([(1, b'r'), (2, b'i')],
+                        dtype=[('VISIT', 'i8'), ('FILTER', 'S1')])
+        table = engine.SubstreamTable.write(self.filename, rows)
+        self.assertEqual(list(table), [dict(VISIT='1', FILTER='r'),
+                                       dict(VISIT='2', FILTER='i')])
+
+    def test_invalid_fields(self):
+        for rows in ([dict(VISIT='1,2')], [dict(VISIT='a=b')],
+                     [dict(VISIT='1 ')], [('1', '2')]):
+            self.assertRaises(RuntimeError, engine.SubstreamTable.write,
+                              self.filename, rows, names=['VISIT'])
+        self.assertRaises(RuntimeError, engine.SubstreamTable.write,
+                          self.filename, [(1,)])
+        with open(self.filename, 'w') as output:
+            output.write('VISIT\n100\n1000\n')
+        self.assertRaises(RuntimeError, engine.SubstreamTable, self.filename)
+
+class FailingPipeline(LocalPipeline):
+    """A server that refuses to create substream fail_at."""
+    def __init__(self, stream_path, fail_at):
+        LocalPipeline.__init__(self, stream_path)
+        self.fail_at = fail_at
+
+    def createSubstream(self, subtask, stream, pipeline_vars=None):
+        if stream == self.fail_at:
+            raise RuntimeError('server is unavailable')
+        LocalPipeline.createSubstream(self, subtask, stream, pipeline_vars)
+
+class ResumeLaunchingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        pipeline = engine.Pipeline('my_pipeline', '1.0')
+        main_task = pipeline.main_task
+        main_task.set_variables()
+        main_task.create_parallel_process('visit', batch_size=3,
+                                          resume=True)
+        pipeline.write_python_module()
+        rows = [dict(VISIT=i) for i in range(10)]
+        pipeline.write_substream_table('visitsTask', rows)
+        pipeline.write_python_module(clobber=True, substream_tables=True)
+        with open(pipeline.get_module_name()) as input_:
+            self.code = compile(input_.read(), pipeline.get_module_name(),
+                                'exec')
+        self.progress_dir = os.path.join(self.tmpdir, 'launch_progress')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def _setup_visits(self, local_pipeline, stream_path):
+        namespace = dict(pipeline=local_pipeline,
+                         SLAC_SCRIPT_LOCATION=self.tmpdir,
+                         SLAC_OUTPUT_DATA_DIR=self.tmpdir,
+                         PIPELINE_STREAMPATH=stream_path)
+        exec(self.code, namespace)
+        try:
+            namespace['setup_visits']()
+        except RuntimeError:
+            return False
+        return True
+
+    def _launched(self, pipelines):
+        return [index for local_pipeline in pipelines
+                for _, index, _ in local_pipeline.substreams]
+
+    def test_resume_launching(self):
+        first = FailingPipeline('0', 7)
+        self.assertFalse(self._setup_visits(first, '0'))
+        self.assertTrue(os.path.isfile(os.path.join(self.progress_dir,
+                                                    'visitsTask_0.txt')))
+        second = LocalPipeline()
+        self.assertTrue(self._setup_visits(second, '0'))
+        self.assertEqual(self._launched([first, second]), list(range(10)))
+        self.assertEqual(os.listdir(self.progress_dir), [])
+
+    def test_concurrent_streams(self):
+        # Two streams fail at different points, then resume at once;
+        # each resumes from its own progress.
+        failed = dict((path, FailingPipeline(path, fail_at))
+                      for path, fail_at in (('1', 7), ('2', 3)))
+        for path, local_pipeline in failed.items():
+            self.assertFalse(self._setup_visits(local_pipeline, path))
+        self.assertEqual(sorted(os.listdir(self.progress_dir)),
+                         ['visitsTask_1.txt', 'visitsTask_2.txt'])
+        resumed = dict((path, LocalPipeline(path)) for path in failed)
+        threads = [threading.Thread(target=self._setup_visits,
+                                    args=(local_pipeline, path))
+                   for path, local_pipeline in resumed.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for path in failed:
+            self.assertEqual(self._launched([failed[path], resumed[path]]),
+                             list(range(10)))
+        self.assertEqual(os.listdir(self.progress_dir), [])
+
+        # Without PIPELINE_STREAMPATH, the server's stream number is used.
+        namespace = dict(pipeline=LocalPipeline('0.4'),
+                         SLAC_OUTPUT_DATA_DIR=self.tmpdir)
+        exec(self.code, namespace)
+        self.assertEqual(namespace['_progress_file']('visitsTask'),
+                         os.path.join(self.progress_dir, 'visitsTask_4.txt'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+Unit tests for timing traces.
+"""
+from __future__ import print_function, absolute_import
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import desc.workflow_engine as engine
+from desc.workflow_engine.executor import LocalExecutor
+
+class TraceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def test_trace(self):
+        trace = engine.Trace()
+        pipeline = engine.Pipeline('my_pipeline', '1.0')
+        pipeline.trace = trace
+        main_task = pipeline.main_task
+        varfile = os.path.join(os.environ['WORKFLOW_ENGINE_DIR'],
+                               'tests', 'main_task_test_variables.txt')
+        main_task.set_variables(varfile=varfile)
+        engine.add_processes(pipeline, [dict(name='first'),
+                                        dict(name='second',
+                                             requirements='first')])
+        pipeline.reduce_dependencies()
+        pipeline.validate()
+        pipeline.toxml()
+        pipeline.write_python_module()
+        pipeline.write_process_scripts()
+        pipeline.write_batch_script()
+        self.assertEqual([name for name, _, _ in trace.phases],
+                         ['build', 'build', 'validate', 'serialize',
+                          'write module', 'write scripts', 'write scripts'])
+
+        status = LocalExecutor(pipeline, pool='thread').run()
+        self.assertEqual(set(status.values()), set([0]))
+        self.assertEqual([(record['name'], record['stream'])
+                          for record in trace.processes],
+                         [('my_pipeline.first', '0'),
+                          ('my_pipeline.second', '0')])
+        first, second = trace.processes
+        self.assertTrue(first['queued'] <= first['start'] <= first['end']
+                        <= second['queued'] <= second['start']
+                        <= second['end'])
+        self.assertEqual(first['status'], 0)
+        if hasattr(os, 'wait4'):
+            self.assertTrue(first['peak_rss_kb'] > 0)
+
+        with open('trace.json', 'w') as output:
+            trace.write_chrome_trace(output)
+        with open('trace.json') as input_:
+            events = json.load(input_)['traceEvents']
+        spans = [event for event in events if event['ph'] == 'X']
+        self.assertEqual([event['name'] for event in spans
+                          if event['cat'] == 'process'],
+                         ['my_pipeline.first', 'my_pipeline.second'])
+        self.assertEqual(len([event for event in spans
+                              if event['cat'] == 'generation']), 7)
+        self.assertTrue(all(event['dur'] >= 0 and event['ts'] >= 0
+                            for event in spans))
+
+        with open('trace.csv', 'w') as output:
+            trace.write_csv(output)
+        with open('trace.csv') as input_:
+            rows = list(csv.reader(input_))
+        self.assertEqual(tuple(rows[0]), engine.Trace.csv_columns)
+        self.assertEqual([row[:3] for row in rows[8:]],
+                         [['process', 'my_pipeline.first', '0'],
+                          ['process', 'my_pipeline.second', '0']])
+
+    def test_from_xml(self):
+        xml = engine.Pipeline('my_pipeline', '1.0').toxml()
+        trace = engine.Trace()
+        pipeline = engine.Pipeline.from_xml(io.BytesIO(xml), trace=trace)
+        self.assertIs(pipeline.trace, trace)
+        str(pipeline)
+        self.assertEqual([name for name, _, _ in trace.phases],
+                         ['build', 'serialize'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+Unit tests for pipeline validation.
+"""
+from __future__ import print_function, absolute_import
+import unittest
+import desc.workflow_engine as engine
+
+class ValidationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = engine.Pipeline('my_pipeline', '1.0')
+        main_task = self.pipeline.main_task
+        self.first = main_task.create_process('first')
+        self.setup = main_task.create_parallel_process(
+            'parallel', requirements=[self.first])
+        self.last = main_task.create_process('last',
+                                             requirements=[self.setup])
+
+    def test_valid(self):
+        self.assertEqual(engine.pipeline_problems(self.pipeline.main_task),
+                         [])
+        self.pipeline.validate()
+
+    def test_problems(self):
+        main_task = self.pipeline.main_task
+        subtask = self.setup.subtasks[0]
+        # A cycle through the implicit edge to the outer process.
+        self.first.requires(subtask.processes[0])
+        # A requirement on a process that is in no task.
+        self.last.requires(engine.Process('orphan'))
+        # A main task process hidden by a subtask process.
+        extra = engine.Process('first')
+        subtask.add_process(extra)
+        extra.requires(self.first)
+        # Names changed after construction.
+        self.last.name = 'x'*31
+        main_task.processes.append(main_task.processes[0])
+        main_task.create_process('first')
+
+        problems = engine.pipeline_problems(main_task)
+        self.assertEqual(len(problems), 6)
+        self.assertIn('process first is in tasks my_pipeline and '
+                      'my_pipeline', problems)
+        self.assertIn('%s: process or task name must be 30 characters '
+                      'or fewer.' % ('x'*31), problems)
+        self.assertIn('duplicate process name my_pipeline.first', problems)
+        self.assertIn('my_pipeline.%s requires orphan, which is not in the '
+                      'pipeline' % ('x'*31), problems)
+        self.assertIn('parallelsTask.first requires my_pipeline.first, but '
+                      'its unqualified name refers to parallelsTask.first',
+                      problems)
+        self.assertIn('dependency cycle among processes: my_pipeline.first, '
+                      'my_pipeline.setup_parallels, parallelsTask.parallel',
+                      problems)
+        self.assertRaises(RuntimeError, self.pipeline.validate)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Unit tests for the task variable store.
+"""
+from __future__ import print_function, absolute_import
+import os
+import unittest
+import desc.workflow_engine as engine
+
+class VariablesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.varfile = os.path.join(os.environ['WORKFLOW_ENGINE_DIR'],
+                                    'tests', 'main_task_test_variables.txt')
+
+    def test_read(self):
+        variables = engine.Variables.read(self.varfile)
+        with open(self.varfile) as input_:
+            lines = [x.strip() for x in input_]
+        self.assertEqual(variables.lines, lines)
+        self.assertEqual(len(variables), 19)
+        self.assertEqual(list(variables)[:2], ['SITE', 'MAXCPU'])
+        self.assertEqual(variables['SITE'], 'NERSC')
+        self.assertEqual(variables['JOBSITE'],
+                         '${SITE=="NERSC" ? "NERSCTONYJ" : "LSST"}')
+        self.assertIn('DM_SETUP', variables)
+        self.assertNotIn('foobar', variables)
+        self.assertEqual(variables.get('foobar'), None)
+        self.assertRaises(RuntimeError, variables.__getitem__, 'foobar')
+
+    def test_set(self):
+        variables = engine.Variables.read(self.varfile)
+        lines = list(variables.lines)
+        variables['DM_SETUP'] = 'setup.sh'
+        index = lines.index('<var name="DM_SETUP">setup.bash</var>')
+        lines[index] = '<var name="DM_SETUP">setup.sh</var>'
+        self.assertEqual(variables.lines, lines)
+        self.assertEqual(variables['DM_SETUP'], 'setup.sh')
+        self.assertRaises(RuntimeError, variables.__setitem__,
+                          *('foobar', 'value'))
+
+    def test_special_characters(self):
+        variables = engine.Variables(['<variables>',
+                                      '<!-- a comment -->',
+                                      '<var name="A">${B > 1 ? 2 : 3}</var>',
+                                      '<var name="B">x &amp; y</var>',
+                                      '<var name="C"/>',
+                                      '</variables>'])
+        self.assertEqual(variables['A'], '${B > 1 ? 2 : 3}')
+        self.assertEqual(variables['B'], 'x & y')
+        self.assertEqual(variables['C'], '')
+        variables['C'] = 'a < b & c'
+        self.assertEqual(variables['C'], 'a < b & c')
+        self.assertEqual(variables.lines[4],
+                         '<var name="C">a &lt; b &amp; c</var>')
+        self.assertEqual(variables.lines[1], '<!-- a comment -->')
+
+    def test_write_through(self):
+        variables = engine.Variables.read(self.varfile)
+        lines = variables.lines
+        lines.insert(-1, '<var name="NEW_VAR">new</var>')
+        self.assertEqual(variables['NEW_VAR'], 'new')
+        lines[lines.index('<var name="NEW_VAR">new</var>')] \
+            = '<var name="NEW_VAR">newer</var>'
+        self.assertEqual(variables['NEW_VAR'], 'newer')
+        variables['NEW_VAR'] = 'newest'
+        self.assertEqual(lines[-2], '<var name="NEW_VAR">newest</var>')
+        del lines[-2]
+        self.assertNotIn('NEW_VAR', variables)
+
+        # Tasks without variables of their own get a store when lines
+        # are added, without affecting other tasks.
+        pipeline = engine.Pipeline('my_pipeline', '1.0')
+        main_task = pipeline.main_task
+        main_task.set_variables(varfile=self.varfile)
+        main_task.variable_lines.insert(-1, '<var name="X">1</var>')
+        self.assertEqual(main_task.get_variable('X'), '1')
+        setup = main_task.create_parallel_process('visit')
+        subtask = setup.subtasks[0]
+        other = main_task.create_parallel_process('sensor').subtasks[0]
+        subtask.variable_lines.extend(['<variables>',
+                                       '<var name="SCRIPT_NAME">a.py</var>',
+                                       '</variables>'])
+        self.assertEqual(subtask.get_variable('SCRIPT_NAME'), 'a.py')
+        self.assertEqual(other.variable_lines, [])
+        self.assertRaises(RuntimeError, other.variables.lines.append,
+                          '<var name="A">1</var>')
+        self.assertEqual(other.variable_lines, [])
+        self.assertIn('<var name="SCRIPT_NAME">a.py</var>', str(pipeline))
+
+    def test_module_name(self):
+        pipeline = engine.Pipeline('my_pipeline', '1.0')
+        self.assertEqual(pipeline.get_module_name(), None)
+        pipeline.main_task.set_variables(varfile=self.varfile)
+        self.assertEqual(pipeline.get_module_name(), 'WL_pipeline_Workflow.py')
+        pipeline.main_task.set_variable('SCRIPT_NAME', 'my_module.py')
+        self.assertEqual(pipeline.get_module_name(), 'my_module.py')
+        pipeline = engine.Pipeline('my_pipeline', '1.0')
+        setup = pipeline.main_task.create_parallel_process('visit')
+        setup.subtasks[0].variable_lines \
+            = ['<var name="SCRIPT_NAME">subtask_module.py</var>']
+        self.assertEqual(pipeline.get_module_name(), 'subtask_module.py')
+
+if __name__ == '__main__':
+    unittest.main()
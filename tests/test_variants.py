@@ -0,0 +1,95 @@
+"""
+Unit tests for the generation of pipeline variants.
+"""
+from __future__ import print_function, absolute_import
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+import desc.workflow_engine as engine
+import desc.workflow_engine.variants as variants_module
+
+class VariantsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = engine.Pipeline('variant_pipeline', '1.0')
+        main_task = self.pipeline.main_task
+        main_task.set_variables()
+        main_task.set_variable('SCRIPT_NAME', 'variant_workflow.py')
+        setup = main_task.create_process('setup')
+        main_task.create_parallel_process('visit', requirements=[setup])
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_variant_matrix(self):
+        variants = engine.variant_matrix(
+            overrides=dict(DM_SETUP='setup.sh'),
+            matrix=dict(SITE=['SLAC', 'NERSC']),
+            variants=dict(test=dict(version='1.1', DM_SETUP='test.sh')))
+        self.assertEqual([name for name, _ in variants],
+                         ['test_SLAC', 'test_NERSC'])
+        self.assertEqual(dict(variants[1][1]),
+                         dict(DM_SETUP='test.sh', version='1.1',
+                              SITE='NERSC'))
+        self.assertEqual(engine.variant_matrix(), [('default', {})])
+        spec = io.StringIO(u'{"matrix": {"SCRIPT_LOCATION": ["/a/b", "c"]}}')
+        self.assertEqual([name for name, _ in engine.read_variants(spec)],
+                         ['a_b', 'c'])
+        self.assertRaises(RuntimeError, engine.variant_matrix,
+                          matrix=dict(SITE=['a/b', 'a_b']))
+        self.assertRaises(RuntimeError, engine.read_variants,
+                          io.StringIO(u'{"sites": []}'))
+
+    def test_write_variants(self):
+        variants = engine.variant_matrix(matrix=OrderedDict(
+            [('SITE', ['SLAC', 'NERSC']), ('version', ['1.0', '2.0'])]))
+        for max_workers in (1, 2):
+            output_dir = os.path.join(self.tmpdir, str(max_workers))
+            results = engine.write_variants(self.pipeline, variants,
+                                            output_dir,
+                                            max_workers=max_workers)
+            self.assertEqual(list(results.keys()),
+                             [name for name, _ in variants])
+            files = results['NERSC_2.0']
+            self.assertEqual([os.path.basename(x) for x in files],
+                             ['variant_pipeline.xml', 'variant_workflow.py',
+                              'setup', 'visit'])
+            for path in files:
+                self.assertTrue(os.path.isfile(path))
+            with open(files[0]) as input_:
+                xml = input_.read()
+            self.assertIn('<var name="SITE">NERSC</var>', xml)
+            self.assertIn('version="2.0"', xml)
+            self.assertEqual(self.pipeline.main_task.get_variable('SITE'),
+                             'SLAC')
+            self.assertEqual(self.pipeline.main_task.version, '1.0')
+        self.assertRaises(RuntimeError, engine.write_variants, self.pipeline,
+                          [('bad', dict(NO_SUCH_VARIABLE='x'))], self.tmpdir)
+
+    def test_write_variants_fallbacks(self):
+        "Pickle the pipeline for unforked workers; render serially."
+        variants = engine.variant_matrix(matrix=dict(SITE=['SLAC', 'NERSC']))
+        forks = variants_module._forks
+        concurrent = variants_module.concurrent
+        try:
+            variants_module._forks = lambda: False
+            results = engine.write_variants(self.pipeline, variants,
+                                            os.path.join(self.tmpdir, 'a'),
+                                            max_workers=2)
+            variants_module.concurrent = None
+            serial = engine.write_variants(self.pipeline, variants,
+                                           os.path.join(self.tmpdir, 'b'))
+        finally:
+            variants_module._forks = forks
+            variants_module.concurrent = concurrent
+        for name, _ in variants:
+            for path_a, path_b in zip(results[name], serial[name]):
+                with open(path_a) as file_a, open(path_b) as file_b:
+                    self.assertEqual(file_a.read(), file_b.read())
+        self.assertEqual(variants_module._pipeline, None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,9 @@ Unit tests for workflow engine xml generator code.
 """
 from __future__ import print_function, absolute_import
 from builtins import str
+import io
 import os
+import pickle
 import unittest
 from xml.dom import minidom
 import desc.workflow_engine.workflow_engine as engine
@@ -18,11 +20,12 @@ class WorkflowEngineTestCase(unittest.TestCase):
         self.pipeline.main_task.set_variables(varfile=varfile)
         self.process_name = 'my_process'
         self.parallel_process_name = 'my_parallel_process'
+        self.script_files = []
 
     def tearDown(self):
-        for filename in (self.pipeline.get_module_name(),
+        for filename in [self.pipeline.get_module_name(),
                          self.process_name,
-                         self.parallel_process_name):
+                         self.parallel_process_name] + self.script_files:
             try:
                 os.remove(filename)
             except OSError:
@@ -83,6 +86,37 @@ class WorkflowEngineTestCase(unittest.TestCase):
         # Test for invalid process name.
         self.assertRaises(RuntimeError, main_task.create_process, *('2PCF',))
 
+    def test_compact_process(self):
+        main_task = self.pipeline.main_task
+        process = main_task.create_process(self.process_name)
+        self.assertFalse(hasattr(process, '__dict__'))
+        self.assertEqual(process.job_type, 'std')
+
+        # Equal job lines are interned.
+        custom = engine.Process('custom_job')
+        custom.job = ''.join(list(engine.job_line['long']))
+        self.assertIs(custom.job, engine.job_line['long'])
+        self.assertEqual(custom.job_type, 'long')
+        # Other job lines are not kept after their processes are gone.
+        custom.job = '<job maxCPU="100"/>'
+        self.assertEqual(custom.job_type, None)
+        self.assertNotIn(custom.job, engine._job_lines)
+
+        # Subtask lists are only created when a subtask is added.
+        self.assertEqual(len(process.subtasks), 0)
+        outer = main_task.create_parallel_process(self.parallel_process_name)
+        self.assertEqual(len(outer.subtasks), 1)
+        self.assertEqual(len(process.subtasks), 0)
+        self.assertIsNone(process._subtasks)
+        extra = engine.Task('extra_task')
+        process.subtasks.append(extra)
+        self.assertEqual(process.subtasks, [extra])
+        self.assertEqual(len(outer.subtasks), 1)
+        self.assertIn('<subtask>extra_task</subtask>', str(process))
+        subtask = outer.subtasks[0]
+        self.assertFalse(subtask.variable_lines)
+        self.assertRaises(RuntimeError, subtask.set_variable, 'SITE', 'SLAC')
+
     def test_parallel_process_creation(self):
         main_task = self.pipeline.main_task
         process_name = self.process_name
@@ -192,5 +226,182 @@ User-defined script content.
         self.assertIsInstance(eval(sub_process2.name), type(lambda : 1))
         self.assertIsInstance(eval(outer_process.name), type(lambda : 1))
 
+    def test_write_xml(self):
+        main_task = self.pipeline.main_task
+        process = main_task.create_process(self.process_name)
+        process.notation = 'A &amp; B'
+        parallel_process \
+            = main_task.create_parallel_process(self.parallel_process_name,
+                                                requirements=[process])
+        main_task.create_process('wrap_up', job_type='script',
+                                 requirements=[parallel_process])
+        for kwds in (dict(), dict(newl='\n'),
+                     dict(encoding=None, indent='\t', newl='\n')):
+            expected = minidom.parseString(str(self.pipeline))\
+                .toprettyxml(**dict(dict(encoding='UTF-8', newl='',
+                                         indent=4*' '), **kwds))
+            self.assertEqual(self.pipeline.toxml(**kwds), expected)
+        output = io.BytesIO()
+        self.pipeline.write_xml(output)
+        self.assertEqual(output.getvalue(), self.pipeline.toxml())
+
+    def test_fuse_job_chains(self):
+        main_task = self.pipeline.main_task
+        setup = main_task.create_process('setup_visits', job_type='script')
+        subtask = engine.Task('visit_task')
+        smoke = subtask.create_process('smoke_test')
+        run = subtask.create_process('run_sim', job_type='long',
+                                     requirements=[smoke])
+        register = subtask.create_process('register', requirements=[run])
+        finalize = subtask.create_process('finalize', job_type='script',
+                                          requirements=[register])
+        setup.add_subtask(subtask)
+        wrap_up = main_task.create_process('wrap_up', job_type='script',
+                                           requirements=[register])
+        fused = self.pipeline.fuse_job_chains()
+        self.assertEqual(len(fused), 1)
+        fused = fused[0]
+        self.assertEqual(fused.name, 'fused_smoke_test')
+        self.assertEqual(fused.fused, [smoke, run, register])
+        # The fused job may use the CPU time of all of its members.
+        self.assertIn('maxCPU="${2*MAXCPU + MAXCPULONG}"', fused.job)
+        self.assertIn('maxCPU="30000"',
+                      self.pipeline.toxml(site='NERSC').decode('utf-8'))
+        self.assertEqual(fused.site, '${JOBSITE}')
+        self.assertEqual(subtask.processes, [fused, finalize])
+        self.assertEqual(finalize.requirements, [fused])
+        self.assertEqual(wrap_up.requirements, [fused])
+        doc = minidom.parseString(str(self.pipeline))
+        afters = [x.getAttribute('process')
+                  for x in doc.getElementsByTagName('after')]
+        self.assertEqual(afters, ['visit_task.fused_smoke_test',
+                                  'visit_task.fused_smoke_test'])
+        self.script_files = ['smoke_test', 'run_sim', 'register', fused.name]
+        self.assertEqual(self.pipeline.write_process_scripts(), 4)
+        with open(fused.name) as input_:
+            lines = input_.readlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn('source ${SCRIPT_LOCATION}/run_sim', lines[2])
+        self.assertEqual(self.pipeline.fuse_job_chains(), [])
+
+    def test_fuse_job_chains_by_site(self):
+        main_task = self.pipeline.main_task
+        first = main_task.create_process('first')
+        second = main_task.create_process('second', requirements=[first])
+        third = main_task.create_process('third', requirements=[second])
+        first.site = second.site = 'SLAC'
+        third.site = 'NERSC'
+        fused = self.pipeline.fuse_job_chains()
+        self.assertEqual(len(fused), 1)
+        self.assertEqual(fused[0].fused, [first, second])
+        self.assertEqual(fused[0].site, 'SLAC')
+        self.assertIn('maxCPU="${2*MAXCPU}"', fused[0].job)
+        self.assertEqual(third.requirements, fused)
+        schedule = self.pipeline.analyze_schedule(runtimes=dict(first=5.,
+                                                                second=7.))
+        self.assertEqual(schedule.runtime['my_pipeline.fused_first'], 12.)
+
+    def test_fuse_job_chains_interleaved(self):
+        # An unrelated process between the chain members is kept.
+        main_task = self.pipeline.main_task
+        first = main_task.create_process('first')
+        other = main_task.create_process('other', job_type='script')
+        second = main_task.create_process('second', requirements=[first])
+        third = main_task.create_process('third', requirements=[second])
+        last = main_task.create_process('last', requirements=[third, other])
+        fused = self.pipeline.fuse_job_chains()
+        self.assertEqual(len(fused), 1)
+        self.assertEqual(fused[0].fused, [first, second, third])
+        self.assertEqual(main_task.processes, [fused[0], other, last])
+        self.assertEqual(last.requirements, [fused[0], other])
+        self.pipeline.validate()
+
+    def test_cached_rendering(self):
+        main_task = self.pipeline.main_task
+        setup = main_task.create_process('setup')
+        subtask = engine.Task('visit_task')
+        run = subtask.create_process('run')
+        setup.add_subtask(subtask)
+        finish = main_task.create_process('finish', requirements=[run])
+        text = str(self.pipeline)
+        self.assertEqual(str(self.pipeline), text)
+        run.notation = 'rerun me'
+        self.assertIsNone(subtask._str)
+        self.assertIsNone(main_task._str)
+        self.assertIsNotNone(setup._str)
+        self.assertIsNotNone(finish._str)
+        self.assertIn('rerun me', str(self.pipeline))
+        run.name = 'simulate'
+        self.assertIn('visit_task.simulate', str(finish))
+        subtask.processes.append(engine.Process('register'))
+        self.assertIn('name="register"', str(self.pipeline))
+        main_task.set_variable('OUTPUT_DATA_DIR', '/new/output')
+        self.assertIn('/new/output', str(self.pipeline))
+        self.assertNotEqual(str(self.pipeline), text)
+
+        # Only the nodes that render a change are invalidated.
+        str(self.pipeline)
+        other = engine.Pipeline('other_pipeline', '1.0')
+        other.main_task.set_variables()
+        other.main_task.set_variable('SITE', 'NERSC')
+        engine.SiteConfiguration(main_task).variable_lines(main_task)
+        self.assertIsNotNone(main_task._str)
+        subtask.set_variables()
+        self.assertIsNone(main_task._str)
+        self.assertIsNotNone(finish._str)
+        str(self.pipeline)
+        subtask.set_variable('SITE', 'NERSC')
+        self.assertIsNone(subtask._str)
+        self.assertIsNone(main_task._str)
+        self.assertIsNotNone(setup._str)
+        self.assertIn('<var name="SITE">NERSC</var>', str(self.pipeline))
+
+        # A rename clears the processes that require the renamed node.
+        str(self.pipeline)
+        setup.name = 'prepare'
+        self.assertIsNone(setup._str)
+        self.assertIsNotNone(finish._str)
+        self.assertIsNotNone(run._str)
+        subtask.name = 'visits_task'
+        self.assertIsNone(finish._str)
+        self.assertIsNone(setup._str)
+        self.assertIn('visits_task.simulate', str(finish))
+        self.assertIn('<subtask>visits_task</subtask>', str(setup))
+        copy = engine.Pipeline.from_xml(io.BytesIO(self.pipeline.toxml()))
+        self.assertEqual(str(main_task), str(copy.main_task))
+
+        # A process rendered while it requires one that is in no task
+        # is cleared when that process is added to a task.
+        loose = engine.Process('loose')
+        finish.requires(loose)
+        self.assertIn('<after process="loose"/>', str(self.pipeline))
+        subtask.add_process(loose)
+        self.assertIn('<after process="visits_task.loose"/>',
+                      str(self.pipeline))
+        loose.name = 'placed'
+        self.assertIn('visits_task.placed', str(self.pipeline))
+
+    def test_pickle(self):
+        main_task = self.pipeline.main_task
+        setup = main_task.create_parallel_process('visit')
+        main_task.create_process('finish', requirements=[setup])
+        copy = pickle.loads(pickle.dumps(self.pipeline))
+        self.assertEqual(str(copy), str(self.pipeline))
+        main_task = copy.main_task
+        finish = main_task.processes[-1]
+        self.assertIs(finish._parent, main_task)
+        self.assertIs(main_task.variables._owner, main_task)
+        main_task.processes[0].subtasks[0].processes[0].name = 'exposure'
+        self.assertIn('visitsTask.exposure', str(copy))
+        finish.requirements.append(main_task.processes[0])
+        self.assertIn('<after process="setup_visits"/>', str(copy))
+        # Pickle protocols before 2 keep the state of the tasks too.
+        copy = pickle.loads(pickle.dumps(self.pipeline, 0))
+        self.assertEqual(str(copy), str(self.pipeline))
+        subtask = copy.main_task.processes[0].subtasks[0]
+        self.assertIs(subtask.variables,
+                      self.pipeline.main_task.processes[0].subtasks[0]
+                      .variables)
+
 if __name__ == '__main__':
     unittest.main()
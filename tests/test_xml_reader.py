@@ -0,0 +1,139 @@
+"""
+Unit tests for reading pipelines from their xml.
+"""
+from __future__ import print_function, absolute_import
+import io
+import unittest
+import xml.etree.ElementTree as ET
+import desc.workflow_engine as engine
+from desc.workflow_engine.workflow_engine import job_line
+
+class XmlReaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = engine.Pipeline('my_pipeline', '1.0')
+        main_task = self.pipeline.main_task
+        main_task.set_variables()
+        main_task.notation = 'main task'
+        first = main_task.create_process('first', job_type='long')
+        first.notation = 'first &amp; "quoted"'
+        setup = main_task.create_parallel_process('parallel',
+                                                  requirements=[first])
+        setup.subtasks[0].variable_lines \
+            = ['<variables>', '<!-- per visit -->',
+               '<var name="TAG">${STREAM} &amp; co</var>', '</variables>']
+        last = main_task.create_process('last', job_type='script',
+                                        requirements=[setup])
+        last.script = '    print("done")\n    last()'
+        self.xml = self.pipeline.toxml()
+
+    def test_round_trip(self):
+        pipeline = engine.Pipeline.from_xml(io.BytesIO(self.xml))
+        self.assertEqual(pipeline.toxml(), self.xml)
+
+        main_task = pipeline.main_task
+        self.assertEqual(main_task.version, '1.0')
+        self.assertEqual([process.name for process in main_task.processes],
+                         ['first', 'setup_parallels', 'last'])
+        first, setup, last = main_task.processes
+        self.assertEqual(first.job_type, 'long')
+        self.assertIs(first.job, job_line['long'])
+        self.assertIsNone(setup.script)
+        self.assertEqual(last.script, '    print("done")\n    last()')
+        subtask = setup.subtasks[0]
+        self.assertIs(subtask.outer_process, setup)
+        self.assertEqual(subtask.get_variable('TAG'), '${STREAM} & co')
+        parallel = subtask.processes[0]
+        self.assertEqual(setup.requirements, [first])
+        self.assertEqual(last.requirements, [parallel])
+        graph = engine.ProcessGraph(pipeline.main_task)
+        self.assertEqual([graph.name(process)
+                          for process in graph.topological_order()],
+                         ['my_pipeline.first', 'my_pipeline.setup_parallels',
+                          'parallelsTask.parallel', 'my_pipeline.last'])
+
+    def test_mixed_notation(self):
+        # Whitespace inside mixed content is not preserved.
+        first = self.pipeline.main_task.processes[0]
+        first.notation = 'first <b>bold</b> process'
+        pipeline = engine.Pipeline.from_xml(io.BytesIO(self.pipeline.toxml()))
+        self.assertEqual(pipeline.main_task.processes[0].notation,
+                         'first<b>bold</b>process')
+
+    def test_site_xml(self):
+        pipeline = engine.Pipeline.from_xml(io.BytesIO(self.xml))
+        self.assertEqual(pipeline.toxml(site='NERSC'),
+                         self.pipeline.toxml(site='NERSC'))
+        resolved = pipeline.toxml(site='NERSC')
+        pipeline = engine.Pipeline.from_xml(io.BytesIO(resolved))
+        self.assertEqual(pipeline.main_task.processes[0].site, 'NERSCTONYJ')
+        self.assertEqual(pipeline.toxml(), resolved)
+
+    def test_missing_references(self):
+        xml = self.xml.replace(b'<subtask>parallelsTask</subtask>',
+                               b'<subtask>otherTask</subtask>')
+        self.assertRaises(RuntimeError, engine.Pipeline.from_xml,
+                          io.BytesIO(xml))
+        xml = self.xml.replace(b'process="first"', b'process="zeroth"')
+        self.assertRaises(RuntimeError, engine.Pipeline.from_xml,
+                          io.BytesIO(xml))
+        self.assertRaises(ET.ParseError, engine.Pipeline.from_xml,
+                          io.BytesIO(self.xml[:-20]))
+
+    def test_pipeline_ii_constructs(self):
+        # Constructs of hand-written Pipeline-II xml that this package
+        # does not generate itself.
+        xml = b"""<?xml version="1.0" encoding="UTF-8"?>
+<pipeline xmlns="http://glast-ground.slac.stanford.edu/pipeline"
+          xmlns:xs="http://www.w3.org/2001/XMLSchema-instance">
+  <task name="imSim" type="Data" version="2.3">
+    <variables>
+      <var name="MAXCPU">8000</var>
+    </variables>
+    <process name="setup">
+      <job batchOptions=" -R rhel60 " maxCPU="${MAXCPU}"
+           executable="${SCRIPT_LOCATION}/setup.sh"/>
+    </process>
+    <process name="simulate" site="NERSC">
+      <job executable="${SCRIPT_LOCATION}/simulate.sh"/>
+      <depends>
+        <after process="setup" status="SUCCESS"/>
+      </depends>
+    </process>
+  </task>
+</pipeline>
+"""
+        pipeline = engine.Pipeline.from_xml(io.BytesIO(xml))
+        main_task = pipeline.main_task
+        self.assertEqual(main_task.type, 'Data')
+        setup, simulate = main_task.processes
+        self.assertIsNone(setup.site)
+        self.assertEqual(simulate.site, 'NERSC')
+        self.assertEqual(simulate.requirements, [setup])
+        self.assertEqual(setup.job,
+                         '<job batchOptions=" -R rhel60 " maxCPU="${MAXCPU}" '
+                         'executable="${SCRIPT_LOCATION}/setup.sh"/>')
+        written = pipeline.toxml()
+        self.assertIn(b'<task name="imSim" type="Data" version="2.3">',
+                      written)
+        self.assertIn(b'<process name="setup">', written)
+        self.assertIn(b'<process name="setup">', pipeline.toxml(site='SLAC'))
+        self.assertIn('<process name="setup">', str(pipeline))
+        self.assertEqual(engine.Pipeline.from_xml(io.BytesIO(written))
+                         .toxml(), written)
+
+        # What the pipeline cannot represent is an error, not dropped.
+        for old, new in ((b'<variables>',
+                          b'<prerequisites><prerequisite name="RUN" '
+                          b'type="integer"/></prerequisites><variables>'),
+                         (b'status="SUCCESS"', b'status="DONE"'),
+                         (b'site="NERSC"',
+                          b'site="NERSC" autoRetryMaxAttempts="2"'),
+                         (b'</depends>',
+                          b'</depends><variables/>'),
+                         (b'<after', b'<before')):
+            self.assertIn(old, xml)
+            self.assertRaises(RuntimeError, engine.Pipeline.from_xml,
+                              io.BytesIO(xml.replace(old, new)))
+
+if __name__ == '__main__':
+    unittest.main()